@@ -0,0 +1,119 @@
+"""Stand-in for open-persona-sidecar in load tests.
+
+An OpenAI-compatible server (`GET /v1/models`, `POST /v1/chat/completions`) that
+streams a fixed number of SSE chunks with a configurable delay per token, so the
+time spent in Open WebUI can be separated from model time. It counts how many
+requests carried the headers the Open Persona patch forwards.
+
+Used by loadtest.py; can also be run on its own to point a real Open WebUI at:
+
+    python benchmarks/fake_sidecar.py --port 8000 --tokens 64 --token-latency-ms 10
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+
+from aiohttp import web
+
+MODEL_ID = "open-persona"
+MODEL_DETAILS_HEADER = "x-openpersona-model-details"
+
+STATS = web.AppKey("stats", dict)
+
+
+def _chunk(model: str, delta: dict, finish_reason=None) -> bytes:
+    data = {
+        "id": "chatcmpl-loadtest",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return b"data: " + json.dumps(data, separators=(",", ":")).encode() + b"\n\n"
+
+
+def new_stats() -> dict:
+    return {"requests": 0, "streamed": 0, "with_identity": 0, "with_traceparent": 0}
+
+
+def create_app(tokens: int = 32, token_latency_ms: float = 5.0, first_token_ms: float = 0.0) -> web.Application:
+    app = web.Application()
+    app[STATS] = new_stats()
+    token_delay = token_latency_ms / 1000.0
+    details = base64.b64encode(json.dumps({"model": MODEL_ID, "small_model": MODEL_ID}).encode()).decode()
+
+    async def models(request: web.Request) -> web.Response:
+        return web.json_response({"object": "list", "data": [{"id": MODEL_ID, "object": "model", "owned_by": "open-persona"}]})
+
+    async def chat_completions(request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        stats = request.app[STATS]
+        stats["requests"] += 1
+        if "x-openwebui-user-id" in request.headers:
+            stats["with_identity"] += 1
+        if "traceparent" in request.headers:
+            stats["with_traceparent"] += 1
+        model = body.get("model") or MODEL_ID
+
+        if not body.get("stream"):
+            await asyncio.sleep(first_token_ms / 1000.0 + token_delay * tokens)
+            return web.json_response(
+                {
+                    "id": "chatcmpl-loadtest",
+                    "object": "chat.completion",
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": "tok " * tokens}, "finish_reason": "stop"}],
+                },
+                headers={MODEL_DETAILS_HEADER: details},
+            )
+
+        stats["streamed"] += 1
+        response = web.StreamResponse(
+            headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache", MODEL_DETAILS_HEADER: details}
+        )
+        await response.prepare(request)
+        token = _chunk(model, {"content": "tok "})
+        if first_token_ms:
+            await asyncio.sleep(first_token_ms / 1000.0)
+        await response.write(_chunk(model, {"role": "assistant", "content": ""}))
+        for _ in range(tokens):
+            if token_delay:
+                await asyncio.sleep(token_delay)
+            await response.write(token)
+        await response.write(_chunk(model, {}, "stop"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    app.router.add_get("/v1/models", models)
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    return app
+
+
+async def start(host: str = "127.0.0.1", port: int = 0, **options) -> tuple:
+    """Start the server; returns `(runner, base_url, app)`. Stop with `await runner.cleanup()`."""
+    app = create_app(**options)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    bound_port = runner.addresses[0][1]
+    return runner, f"http://{host}:{bound_port}/v1", app
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Fake open-persona-sidecar for load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--tokens", type=int, default=32)
+    parser.add_argument("--token-latency-ms", type=float, default=5.0)
+    parser.add_argument("--first-token-ms", type=float, default=0.0)
+    args = parser.parse_args(argv)
+    app = create_app(args.tokens, args.token_latency_ms, args.first_token_ms)
+    web.run_app(app, host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,471 @@
+"""Load test: the patched Open WebUI openai router vs. upstream, against a fake sidecar.
+
+The upstream `routers/openai.py` is pinned (PINNED_VERSION/PINNED_SHA256, taken
+from the `open-webui` wheel on PyPI). The harness patches it with the real
+patch_openai_router.py, starts fake_sidecar.py, and drives concurrent streamed
+chat completions from many synthetic users through `generate_chat_completion`
+of each variant. Each variant runs in its own worker process, with its own
+DATA_DIR, so memory numbers are not shared.
+
+It needs an environment where Open WebUI imports, e.g. the (unpatched) base image,
+whose own router can stand in for the download:
+
+    docker run --rm -v "$PWD/services/open-persona-openwebui:/bench" -w /bench \\
+        -e PYTHONPATH=/app/backend ghcr.io/open-webui/open-webui:v0.6.43 \\
+        python benchmarks/loadtest.py --requests 2000 --concurrency 64 --users 500 \\
+            --upstream-file /app/backend/open_webui/routers/openai.py \\
+            --out benchmarks/results/0.6.43.json
+
+Reported per variant: time to first chunk and to the end of the stream (p50/p95/p99),
+throughput and RSS. `added_latency_ms` is patched minus upstream at each
+percentile. Users are spread over the requests, so the patched variant sees
+provider-key cache misses (one DB read per user) as well as hits. Save results
+per base image; `--baseline old.json` prints the change.
+
+After bumping the base image, pass `--upstream-version X.Y.Z` (and the new
+`--upstream-sha256`, or update the pins here) to rerun against the new router.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import pathlib
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+
+PINNED_VERSION = "0.6.43"
+PINNED_SHA256 = "0493907773994dbd80b3894b01c27c4cc78d42e3a759c549ba0e98a2cce5013a"
+UPSTREAM_MEMBER = "open_webui/routers/openai.py"
+
+BENCH_DIR = pathlib.Path(__file__).resolve().parent
+SERVICE_DIR = BENCH_DIR.parent
+CACHE_DIR = pathlib.Path(
+    os.environ.get("OPEN_PERSONA_LOADTEST_CACHE", pathlib.Path.home() / ".cache" / "open-persona-loadtest")
+)
+
+# The Persona model row each worker creates; its base model is the fake sidecar's.
+PERSONA_ID = "loadtest-persona"
+PERCENTILES = (50, 95, 99)
+
+sys.path.insert(0, str(SERVICE_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def fetch_upstream(version: str, cache_dir: pathlib.Path = CACHE_DIR) -> bytes:
+    """`routers/openai.py` from the `open-webui==version` wheel (downloaded once, cached)."""
+    cached = cache_dir / f"openai-{version}.py"
+    if cached.exists():
+        return cached.read_bytes()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        subprocess.run(
+            [sys.executable, "-m", "pip", "download", f"open-webui=={version}", "--no-deps", "-q", "-d", tmp],
+            check=True,
+        )
+        wheel = next(pathlib.Path(tmp).glob("open_webui-*.whl"))
+        with zipfile.ZipFile(wheel) as zf:
+            data = zf.read(UPSTREAM_MEMBER)
+    cached.write_bytes(data)
+    return data
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(samples_ms: list) -> dict:
+    values = sorted(samples_ms)
+    summary = {f"p{p}": round(percentile(values, p), 3) for p in PERCENTILES}
+    summary["mean"] = round(sum(values) / len(values), 3) if values else 0.0
+    summary["max"] = round(values[-1], 3) if values else 0.0
+    return summary
+
+
+def rss_kb() -> int:
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+# -- worker (one process per variant) ------------------------------------------
+
+
+def load_router(path: str):
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location("open_webui.routers.openai", path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def seed_database(base_model_id: str, user_count: int) -> list:
+    """Persona model, provider-key tools and synthetic users (each with its own key) in the worker's DB."""
+    from open_webui.models.models import ModelForm, ModelMeta, ModelParams, Models
+    from open_webui.models.tools import ToolForm, ToolMeta, Tools
+    from open_webui.models.users import Users
+
+    import open_persona_provider_cache
+
+    Models.insert_new_model(
+        ModelForm(
+            id=PERSONA_ID,
+            base_model_id=base_model_id,
+            name="Load test persona",
+            meta=ModelMeta(open_persona={"template": "loadtest"}),
+            params=ModelParams(),
+        ),
+        user_id="loadtest",
+    )
+    for tool_id in (open_persona_provider_cache.ADMIN_TOOL_ID, open_persona_provider_cache.USER_TOOL_ID):
+        Tools.insert_new_tool(
+            "loadtest",
+            ToolForm(
+                id=tool_id,
+                name=tool_id,
+                content=(SERVICE_DIR / f"{tool_id}_tool.py").read_text(encoding="utf-8"),
+                meta=ToolMeta(),
+            ),
+            [],
+        )
+    Tools.update_tool_valves_by_id(open_persona_provider_cache.ADMIN_TOOL_ID, {"openai_api_key": "loadtest-default"})
+
+    users = []
+    for i in range(user_count):
+        user = Users.insert_new_user(
+            f"loadtest-user-{i}", f"Load test user {i}", f"user{i}@loadtest.invalid", role="admin"
+        )
+        Tools.update_user_valves_by_id_and_user_id(
+            open_persona_provider_cache.USER_TOOL_ID, user.id, {"openrouter_api_key": f"loadtest-key-{i}"}
+        )
+        users.append(user)
+    return users
+
+
+def make_app(sidecar_url: str):
+    from types import SimpleNamespace
+
+    config = SimpleNamespace(
+        ENABLE_OPENAI_API=True,
+        OPENAI_API_BASE_URLS=[sidecar_url],
+        OPENAI_API_KEYS=[""],
+        OPENAI_API_CONFIGS={"0": {}},
+    )
+    return SimpleNamespace(state=SimpleNamespace(config=config, OPENAI_MODELS={}))
+
+
+async def one_request(router, app, user, n: int) -> tuple:
+    from starlette.requests import Request
+
+    request = Request(
+        {
+            "type": "http",
+            "method": "POST",
+            "path": "/api/chat/completions",
+            "headers": [(b"content-type", b"application/json")],
+            "query_string": b"",
+            "app": app,
+        }
+    )
+    form_data = {
+        "model": PERSONA_ID,
+        "stream": True,
+        "messages": [{"role": "user", "content": f"load test {n}"}],
+        "metadata": {"chat_id": f"loadtest-chat-{n}", "message_id": f"loadtest-message-{n}"},
+    }
+    started = time.perf_counter()
+    response = await router.generate_chat_completion(request, form_data, user=user, bypass_filter=True)
+    first = None
+    async for _ in response.body_iterator:
+        if first is None:
+            first = time.perf_counter()
+    ended = time.perf_counter()
+    if response.background is not None:
+        await response.background()
+    return (first or ended) - started, ended - started
+
+
+async def drive(router, app, users: list, requests: int, concurrency: int, warmup: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    ttfb, total, errors = [], [], []
+
+    async def run(n: int, record: bool) -> None:
+        async with semaphore:
+            try:
+                first, end = await one_request(router, app, users[n % len(users)], n)
+            except Exception as exc:  # counted, not fatal: the report shows the error rate
+                errors.append(f"{type(exc).__name__}: {exc}")
+                return
+            if record:
+                ttfb.append(round(first * 1000.0, 3))
+                total.append(round(end * 1000.0, 3))
+
+    await asyncio.gather(*(run(n, False) for n in range(warmup)))
+    rss_before = rss_kb()
+    started = time.perf_counter()
+    await asyncio.gather(*(run(n, True) for n in range(warmup, warmup + requests)))
+    return {
+        "requests": requests,
+        "errors": errors,
+        "duration_s": time.perf_counter() - started,
+        "ttfb_ms": ttfb,
+        "total_ms": total,
+        "rss_kb_before": rss_before,
+        "rss_kb_after": rss_kb(),
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def worker(args) -> None:
+    router = load_router(args.router_file)
+    from fake_sidecar import MODEL_ID
+
+    users = seed_database(MODEL_ID, args.users)
+    app = make_app(args.sidecar_url)
+    result = asyncio.run(drive(router, app, users, args.requests, args.concurrency, args.warmup))
+    if "open_persona_provider_cache" in sys.modules:
+        result["provider_key_cache"] = sys.modules["open_persona_provider_cache"].cache.stats()
+    pathlib.Path(args.result_file).write_text(json.dumps(result), encoding="utf-8")
+
+
+# -- orchestrator ----------------------------------------------------------------
+
+
+class SidecarThread:
+    """fake_sidecar on its own event loop, so it does not compete with the workers' loops."""
+
+    def __init__(self, **options):
+        self.options = options
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def __enter__(self):
+        import fake_sidecar
+
+        self.thread.start()
+        self.runner, self.url, app = asyncio.run_coroutine_threadsafe(
+            fake_sidecar.start(**self.options), self.loop
+        ).result()
+        self.stats = app[fake_sidecar.STATS]
+        return self
+
+    def take_stats(self) -> dict:
+        stats = dict(self.stats)
+        for key in self.stats:
+            self.stats[key] = 0
+        return stats
+
+    def __exit__(self, *exc):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+
+def run_worker(variant: str, round_no: int, router_file: pathlib.Path, sidecar: SidecarThread, args, workdir) -> dict:
+    data_dir = workdir / f"data-{variant}-{round_no}"
+    data_dir.mkdir()
+    result_file = workdir / f"{variant}-{round_no}.json"
+    log_file = workdir / f"{variant}-{round_no}.log"
+    env = {**os.environ, "DATA_DIR": str(data_dir), "WEBUI_SECRET_KEY": "loadtest", "GLOBAL_LOG_LEVEL": "WARNING"}
+    env.pop("DATABASE_URL", None)
+    command = [sys.executable, __file__, "--worker", "--router-file", str(router_file)]
+    command += ["--sidecar-url", sidecar.url, "--result-file", str(result_file)]
+    for option in ("requests", "concurrency", "users", "warmup"):
+        command += [f"--{option}", str(getattr(args, option))]
+    with open(log_file, "wb") as log:
+        code = subprocess.run(command, env=env, stdout=log, stderr=subprocess.STDOUT).returncode
+    output = log_file.read_text(encoding="utf-8", errors="replace")
+    if args.verbose or code:
+        print(output, end="")
+    if code:
+        raise SystemExit(f"{variant} worker failed (exit {code})")
+    result = json.loads(result_file.read_text(encoding="utf-8"))
+    result["sidecar"] = sidecar.take_stats()
+    return result
+
+
+def merge_rounds(rounds: list) -> dict:
+    """One variant's report from the raw samples of all its rounds."""
+    ttfb = [v for r in rounds for v in r["ttfb_ms"]]
+    total = [v for r in rounds for v in r["total_ms"]]
+    errors = [e for r in rounds for e in r["errors"]]
+    duration = sum(r["duration_s"] for r in rounds)
+    sidecar = {}
+    for r in rounds:
+        for key, value in r["sidecar"].items():
+            sidecar[key] = sidecar.get(key, 0) + value
+    merged = {
+        "rounds": len(rounds),
+        "requests": sum(r["requests"] for r in rounds),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(total) / duration, 2) if duration else 0.0,
+        "ttfb_ms": summarize(ttfb),
+        "total_ms": summarize(total),
+        "rss_kb_growth": max(r["rss_kb_after"] - r["rss_kb_before"] for r in rounds),
+        "max_rss_kb": max(r["max_rss_kb"] for r in rounds),
+        "sidecar": sidecar,
+    }
+    if "provider_key_cache" in rounds[-1]:
+        merged["provider_key_cache"] = rounds[-1]["provider_key_cache"]
+    return merged
+
+
+def compare(upstream: dict, patched: dict) -> dict:
+    added = {
+        metric: {p: round(patched[metric][p] - upstream[metric][p], 3) for p in upstream[metric]}
+        for metric in ("ttfb_ms", "total_ms")
+    }
+    return {
+        "added_latency_ms": added,
+        "throughput_ratio": round(patched["throughput_rps"] / upstream["throughput_rps"], 4)
+        if upstream["throughput_rps"]
+        else None,
+        "added_rss_kb": patched["max_rss_kb"] - upstream["max_rss_kb"],
+    }
+
+
+def open_webui_version() -> str:
+    try:
+        from importlib.metadata import version
+
+        return version("open-webui")
+    except Exception:
+        return "unknown"
+
+
+def format_report(report: dict) -> str:
+    lines = [f"upstream open-webui {report['upstream']['version']} (sha256 {report['upstream']['sha256'][:12]})"]
+    for variant in ("upstream", "patched"):
+        r = report["variants"][variant]
+        lines.append(
+            f"{variant:>8}: ttfb p50/p95/p99 {r['ttfb_ms']['p50']:.2f}/{r['ttfb_ms']['p95']:.2f}/{r['ttfb_ms']['p99']:.2f}ms"
+            f" total p50/p95/p99 {r['total_ms']['p50']:.2f}/{r['total_ms']['p95']:.2f}/{r['total_ms']['p99']:.2f}ms"
+            f" {r['throughput_rps']:.1f} req/s max_rss={r['max_rss_kb'] // 1024}MiB errors={r['errors']}"
+        )
+    added = report["comparison"]["added_latency_ms"]
+    lines.append(
+        "   added: ttfb "
+        + "/".join(f"{added['ttfb_ms'][f'p{p}']:+.2f}" for p in PERCENTILES)
+        + "ms total "
+        + "/".join(f"{added['total_ms'][f'p{p}']:+.2f}" for p in PERCENTILES)
+        + f"ms throughput x{report['comparison']['throughput_ratio']} rss {report['comparison']['added_rss_kb']:+d}KiB"
+    )
+    return "\n".join(lines)
+
+
+def format_baseline(report: dict, baseline: dict) -> str:
+    lines = [f"vs baseline (open-webui {baseline['upstream']['version']}):"]
+    for metric in ("ttfb_ms", "total_ms"):
+        for p in PERCENTILES:
+            key = f"p{p}"
+            old = baseline["comparison"]["added_latency_ms"][metric][key]
+            new = report["comparison"]["added_latency_ms"][metric][key]
+            lines.append(f"  added {metric} {key}: {old:+.2f} -> {new:+.2f}ms")
+    return "\n".join(lines)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the patched Open WebUI openai router.")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--users", type=int, default=200, help="synthetic users (distinct provider-key cache entries)")
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=2, help="worker runs per variant (alternating order)")
+    parser.add_argument("--tokens", type=int, default=32, help="SSE chunks per completion")
+    parser.add_argument("--token-latency-ms", type=float, default=5.0)
+    parser.add_argument("--upstream-version", default=PINNED_VERSION)
+    parser.add_argument("--upstream-sha256", help=f"expected sha256 (default: pinned for {PINNED_VERSION})")
+    parser.add_argument("--upstream-file", help="use this routers/openai.py instead of downloading the wheel")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--baseline", help="earlier JSON report to compare added latency against")
+    parser.add_argument("--verbose", action="store_true", help="show worker (Open WebUI) output")
+    # Internal: run one variant in this process.
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--router-file", help=argparse.SUPPRESS)
+    parser.add_argument("--sidecar-url", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        worker(args)
+        return 0
+
+    import patch_openai_router
+
+    upstream = (
+        pathlib.Path(args.upstream_file).read_bytes() if args.upstream_file else fetch_upstream(args.upstream_version)
+    )
+    expected = args.upstream_sha256 or (PINNED_SHA256 if args.upstream_version == PINNED_VERSION else None)
+    upstream_hash = sha256(upstream)
+    if expected and upstream_hash != expected:
+        raise SystemExit(f"Upstream router sha256 {upstream_hash} does not match the pin {expected}")
+
+    report = {
+        "upstream": {"version": args.upstream_version, "sha256": upstream_hash},
+        "environment": {
+            "python": platform.python_version(),
+            "open_webui_installed": open_webui_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "config": {
+            k: getattr(args, k)
+            for k in ("requests", "concurrency", "users", "warmup", "rounds", "tokens", "token_latency_ms")
+        },
+        "started_at": time.time(),
+    }
+    with tempfile.TemporaryDirectory(prefix="open-persona-loadtest-") as tmp:
+        workdir = pathlib.Path(tmp)
+        routers = {
+            "upstream": upstream.decode("utf-8"),
+            "patched": patch_openai_router.patch(upstream.decode("utf-8")),
+        }
+        router_files = {}
+        for variant, source in routers.items():
+            router_files[variant] = workdir / f"openai_{variant}.py"
+            router_files[variant].write_text(source, encoding="utf-8")
+        rounds = {variant: [] for variant in routers}
+        with SidecarThread(tokens=args.tokens, token_latency_ms=args.token_latency_ms) as sidecar:
+            # Alternate the order each round so machine drift does not favour one variant.
+            for round_no in range(args.rounds):
+                order = list(routers) if round_no % 2 == 0 else list(reversed(list(routers)))
+                for variant in order:
+                    rounds[variant].append(run_worker(variant, round_no, router_files[variant], sidecar, args, workdir))
+        report["variants"] = {variant: merge_rounds(results) for variant, results in rounds.items()}
+
+    report["comparison"] = compare(report["variants"]["upstream"], report["variants"]["patched"])
+    print(format_report(report))
+    if not report["variants"]["patched"]["sidecar"]["with_identity"]:
+        print("warning: the patched router forwarded no x-openwebui-user-id headers; check the sidecar allowlist")
+    if args.baseline:
+        print(format_baseline(report, json.loads(pathlib.Path(args.baseline).read_text(encoding="utf-8"))))
+    if args.out:
+        out = pathlib.Path(args.out)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    return 1 if any(r["errors"] for r in report["variants"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
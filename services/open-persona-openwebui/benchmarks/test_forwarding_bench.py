@@ -0,0 +1,69 @@
+"""Per-request overhead of the Open Persona forwarding stage.
+
+Run from services/open-persona-openwebui:
+
+    pip install pytest-benchmark
+    python -m pytest benchmarks --benchmark-only --benchmark-time-unit=us
+
+The mean of `test_resolve_sidecar_headers_cache_hit` is the per-request cost the
+forwarding stage adds to a sidecar-bound chat completion on a warm key cache.
+Use `--benchmark-save`/`--benchmark-compare` to track it across changes.
+"""
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import open_persona_forwarding as fwd  # noqa: E402
+import open_persona_provider_cache as pc  # noqa: E402
+
+SIDECAR_URL = "http://open-persona-sidecar:8000/v1"
+META = {"open_persona": {"template": "izzy", "integrations": {"instrumentl": {"enabled": True}}}}
+
+
+class _Meta:
+    def model_dump(self):
+        return META
+
+
+class _Model:
+    id = "persona-a"
+    updated_at = 1700000000
+    meta = _Meta()
+
+
+@pytest.fixture
+def warm_key_cache(monkeypatch):
+    key_cache = pc.ProviderKeyCache(max_users=16, ttl_seconds=3600)
+    key_cache.put("u1", pc.ProviderKeys("sk-openai", "sk-anthropic", "sk-openrouter"))
+    monkeypatch.setattr(pc, "cache", key_cache)
+    return key_cache
+
+
+def test_allowlist_check(benchmark):
+    assert benchmark(fwd.is_sidecar_url, SIDECAR_URL)
+
+
+def test_host_matcher_cluster_local(benchmark):
+    assert benchmark(fwd.host_allowed, "open-persona-sidecar.default.svc.cluster.local")
+
+
+def test_encode_meta_headers_b64(benchmark):
+    assert "x-openpersona-meta-b64" in benchmark(fwd.encode_meta_headers, META["open_persona"], "b64")
+
+
+def test_encode_meta_headers_zlib(benchmark):
+    assert "x-openpersona-meta-z64" in benchmark(fwd.encode_meta_headers, META["open_persona"], "zlib")
+
+
+def test_build_sidecar_headers(benchmark):
+    keys = pc.ProviderKeys("sk-openai", "sk-anthropic", "sk-openrouter")
+    meta_headers = fwd.encode_meta_headers(META["open_persona"])
+    headers = benchmark(fwd.build_sidecar_headers, "u1", "persona-a", meta_headers, keys)
+    assert "x-openpersona-meta-digest" in headers
+
+
+def test_resolve_sidecar_headers_cache_hit(benchmark, warm_key_cache):
+    headers = benchmark(fwd.resolve_sidecar_headers, "u1", "persona-a", _Model())
+    assert headers["x-openpersona-openai-api-key"] == "sk-openai"
+    assert warm_key_cache.stats()["misses"] == 0
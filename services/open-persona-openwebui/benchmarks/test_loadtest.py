@@ -0,0 +1,69 @@
+"""Checks for the load-test harness itself (the load test needs Open WebUI; see loadtest.py)."""
+
+import asyncio
+import json
+
+import pytest
+
+import loadtest
+
+
+def test_percentiles_nearest_rank():
+    values = list(range(1, 101))
+    assert loadtest.percentile(values, 50) == 50
+    assert loadtest.percentile(values, 95) == 95
+    assert loadtest.percentile(values, 99) == 99
+    assert loadtest.percentile([7.0], 99) == 7.0
+    assert loadtest.percentile([], 50) == 0.0
+
+
+def test_merge_rounds_and_compare():
+    def round_(samples, duration):
+        return {
+            "requests": len(samples),
+            "errors": [],
+            "duration_s": duration,
+            "ttfb_ms": samples,
+            "total_ms": [s * 10 for s in samples],
+            "rss_kb_before": 1000,
+            "rss_kb_after": 1100,
+            "max_rss_kb": 2000,
+            "sidecar": {"requests": len(samples), "with_identity": 0},
+        }
+
+    upstream = loadtest.merge_rounds([round_([1.0, 2.0], 1.0), round_([3.0, 4.0], 1.0)])
+    patched = loadtest.merge_rounds([round_([2.0, 3.0], 1.0), round_([4.0, 5.0], 2.0)])
+    assert upstream["requests"] == 4 and upstream["throughput_rps"] == 2.0
+    assert upstream["sidecar"]["requests"] == 4
+
+    comparison = loadtest.compare(upstream, patched)
+    assert comparison["added_latency_ms"]["ttfb_ms"]["p50"] == 1.0
+    assert comparison["added_latency_ms"]["total_ms"]["p99"] == 10.0
+    assert comparison["throughput_ratio"] == pytest.approx(4 / 3 / 2, abs=0.01)
+
+
+def test_fake_sidecar_streams_sse():
+    aiohttp = pytest.importorskip("aiohttp")
+    import fake_sidecar
+
+    async def run():
+        runner, url, app = await fake_sidecar.start(tokens=3, token_latency_ms=0)
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"{url}/models") as r:
+                    assert (await r.json())["data"][0]["id"] == fake_sidecar.MODEL_ID
+                body = {"model": fake_sidecar.MODEL_ID, "stream": True, "messages": []}
+                headers = {"x-openwebui-user-id": "u1"}
+                async with session.post(f"{url}/chat/completions", json=body, headers=headers) as r:
+                    assert r.headers["Content-Type"].startswith("text/event-stream")
+                    assert fake_sidecar.MODEL_DETAILS_HEADER in r.headers
+                    events = [line for line in (await r.text()).split("\n\n") if line]
+        finally:
+            await runner.cleanup()
+        return events, app[fake_sidecar.STATS]
+
+    events, stats = asyncio.run(run())
+    assert events[-1] == "data: [DONE]"
+    chunks = [json.loads(e[len("data: ") :]) for e in events[:-1]]
+    assert "".join(c["choices"][0]["delta"].get("content", "") for c in chunks) == "tok tok tok "
+    assert stats == {"requests": 1, "streamed": 1, "with_identity": 1, "with_traceparent": 0}
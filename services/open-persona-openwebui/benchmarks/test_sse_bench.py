@@ -0,0 +1,94 @@
+"""CPU per streamed event: upstream's relay vs. open_persona_sse.relay.
+
+Both feed the same sidecar stream (EVENTS token events) through a real aiohttp
+`StreamReader`, then through the per-item work Open WebUI's chat middleware does
+before it looks at a delta (decode, strip, `data:` check, `json.loads`). The
+upstream relay is StreamReader iteration (a `readline()` per line), which is
+what `stream_chunks_handler` returns by default.
+
+    python -m pytest benchmarks/test_sse_bench.py --benchmark-only --benchmark-time-unit=ms
+
+Divide a mean by EVENTS for the per-event (per-token) cost. `one_event_per_read`
+is a sidecar flushing each token; `batched_reads` is 16 KiB network reads.
+"""
+
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+aiohttp = pytest.importorskip("aiohttp")
+
+import open_persona_sse as sse  # noqa: E402
+
+EVENTS = 2000
+READ_SIZE = 16 * 1024
+
+
+def _event(n: int) -> bytes:
+    data = {
+        "id": "chatcmpl_ses_0123456789",
+        "object": "chat.completion.chunk",
+        "created": 1700000000,
+        "model": "open-persona/build",
+        "choices": [{"index": 0, "delta": {"content": f"token{n} "}, "finish_reason": None}],
+    }
+    return b"data: " + json.dumps(data, separators=(",", ":")).encode() + b"\n\n"
+
+
+STREAM = [_event(n) for n in range(EVENTS)] + [b"data: [DONE]\n\n"]
+PAYLOAD = b"".join(STREAM)
+READS = {
+    "one_event_per_read": STREAM,
+    "batched_reads": [PAYLOAD[i : i + READ_SIZE] for i in range(0, len(PAYLOAD), READ_SIZE)],
+}
+
+
+def _reader(reads, loop):
+    from aiohttp.base_protocol import BaseProtocol
+
+    # A limit above the payload so feeding it all up front never pauses the (absent) transport.
+    reader = aiohttp.StreamReader(BaseProtocol(loop), len(PAYLOAD), loop=loop)
+    for data in reads:
+        reader.feed_data(data)
+    reader.feed_eof()
+    return reader
+
+
+def _middleware_item(item) -> int:
+    # The first steps of Open WebUI's stream_body_handler for every item.
+    line = item.decode("utf-8", "replace") if isinstance(item, bytes) else item
+    if not line.strip() or not line.startswith("data:"):
+        return 0
+    try:
+        json.loads(line[len("data:") :].strip())
+    except ValueError:
+        return 0
+    return 1
+
+
+async def _upstream(reader):
+    return sum([_middleware_item(line) async for line in reader])
+
+
+async def _passthrough(reader):
+    return sum([_middleware_item(item) async for item in sse.sidecar_stream(reader)])
+
+
+def _run(relay, reads):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(relay(_reader(reads, loop)))
+    finally:
+        loop.close()
+
+
+@pytest.mark.parametrize("reads", list(READS))
+def test_upstream_relay(benchmark, reads):
+    assert benchmark(_run, _upstream, READS[reads]) == EVENTS
+
+
+@pytest.mark.parametrize("reads", list(READS))
+def test_sidecar_passthrough(benchmark, reads):
+    assert benchmark(_run, _passthrough, READS[reads]) == EVENTS
@@ -0,0 +1,127 @@
+"""Cached access-control checks for the patched Open WebUI tools router.
+
+Every valves read, spec read and write on a tool checks `has_access` against the
+caller's groups, and `Groups.get_groups_by_member_id` is a join. The settings UI
+hits these endpoints repeatedly, so each user's group ids are kept in a small LRU
+with a short TTL, and the access decision per `(tool id, tool.updated_at, mode)`
+is memoized alongside them. Editing a tool's access control bumps `updated_at`,
+which keys in a fresh decision.
+
+Membership changes made through Open WebUI's group API (patched by
+patch_groups_router.py) call `invalidate_group()` in the worker that served
+them. Changes made elsewhere (open_persona_seed.py, OAuth/LDAP group sync, SCIM,
+other workers) are picked up within the TTL.
+"""
+
+import os
+import time
+from typing import Callable, Iterable, NamedTuple, Optional
+
+import open_persona_metrics
+from open_persona_metrics import VALVES_ACCESS
+from open_persona_ttl_cache import TTLCache
+
+CACHE_MAX_USERS = int(os.environ.get("OPEN_PERSONA_GROUP_CACHE_MAX_USERS", "1024"))
+CACHE_TTL_SECONDS = float(os.environ.get("OPEN_PERSONA_GROUP_CACHE_TTL_SECONDS", "30"))
+
+# Decisions memoized per user (tools x modes); the settings UI only touches a few.
+MAX_DECISIONS_PER_USER = 64
+
+
+def _load_group_ids(user_id: str) -> frozenset:
+    from open_webui.models.groups import Groups
+
+    return frozenset(group.id for group in Groups.get_groups_by_member_id(user_id))
+
+
+def _has_access(user_id: str, mode: str, access_control, group_ids: frozenset) -> bool:
+    from open_webui.utils.access_control import has_access
+
+    return has_access(user_id, mode, access_control, set(group_ids), strict=True)
+
+
+class Membership(NamedTuple):
+    group_ids: frozenset
+    # (tool id, tool.updated_at, mode) -> allowed
+    decisions: dict
+
+
+class GroupMembershipCache(TTLCache[Membership]):
+    """Thread-safe LRU + TTL cache of group ids (and access decisions), keyed by user id."""
+
+    def __init__(
+        self,
+        max_users: int = CACHE_MAX_USERS,
+        ttl_seconds: float = CACHE_TTL_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        super().__init__(max_users, ttl_seconds, clock)
+
+    def put(self, user_id: str, group_ids: frozenset, generation: Optional[int] = None) -> Membership:
+        return super().put(user_id, Membership(frozenset(group_ids), {}), generation)
+
+
+cache = GroupMembershipCache()
+open_persona_metrics.register_cache("group_membership", cache.stats)
+
+
+def user_membership(
+    user_id: str,
+    load: Callable[[str], frozenset] = _load_group_ids,
+    membership_cache: Optional[GroupMembershipCache] = None,
+) -> Membership:
+    """Return `user_id`'s group ids (and decision memo), loading them on a miss."""
+    membership_cache = membership_cache or cache
+    user_id = str(user_id)
+    membership = membership_cache.get(user_id)
+    if membership is not None:
+        return membership
+
+    generation = membership_cache.generation()
+    return membership_cache.put(user_id, load(user_id), generation)
+
+
+def has_tool_access(
+    user_id: str,
+    mode: str,
+    tool,
+    load: Callable[[str], frozenset] = _load_group_ids,
+    check: Callable[[str, str, object, frozenset], bool] = _has_access,
+    membership_cache: Optional[GroupMembershipCache] = None,
+) -> bool:
+    """Strict `has_access` for `tool` ("read"/"write"), using cached groups and decisions."""
+    user_id = str(user_id)
+    membership = user_membership(user_id, load, membership_cache)
+    updated_at = getattr(tool, "updated_at", None)
+    key = (tool.id, updated_at, mode)
+    if updated_at is not None:
+        allowed = membership.decisions.get(key)
+        if allowed is not None:
+            VALVES_ACCESS.inc(mode, "allowed" if allowed else "denied", "true")
+            return allowed
+
+    allowed = bool(check(user_id, mode, tool.access_control, membership.group_ids))
+    VALVES_ACCESS.inc(mode, "allowed" if allowed else "denied", "false")
+    if updated_at is not None:
+        if len(membership.decisions) >= MAX_DECISIONS_PER_USER:
+            membership.decisions.clear()
+        membership.decisions[key] = allowed
+    return allowed
+
+
+def invalidate_group(
+    group_id: Optional[str] = None,
+    user_ids: Optional[Iterable[str]] = None,
+    membership_cache: Optional[GroupMembershipCache] = None,
+) -> None:
+    """Drop cached memberships after a write to `group_id`.
+
+    With `user_ids` only those users are dropped; otherwise (group renamed,
+    deleted, permissions changed, or members unknown) the whole cache is cleared.
+    """
+    membership_cache = membership_cache or cache
+    if user_ids is None:
+        membership_cache.clear()
+        return
+    for user_id in user_ids:
+        membership_cache.invalidate_user(str(user_id))
@@ -0,0 +1,73 @@
+"""Admin-only Open Persona API, mounted by patch_main.py at `/api/v1/open-persona`.
+
+- `POST /provider-keys/import` — JSONL body of `{user_id, keys}` rows, applied in
+  batched transactions (see open_persona_key_import). Returns a summary.
+- `GET /provider-keys/export` — streams JSONL with every key redacted.
+- `GET /metrics` — Prometheus text format (see open_persona_metrics).
+- `POST /models/refresh` — refetch the sidecar model list on next use (see
+  open_persona_model_cache; this worker only, others within the TTL).
+"""
+
+import json
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from open_webui.utils.auth import get_admin_user
+
+import open_persona_executor
+import open_persona_key_import
+import open_persona_metrics
+import open_persona_model_cache
+import open_persona_provider_cache
+
+router = APIRouter()
+
+
+@router.post("/provider-keys/import")
+async def import_provider_keys(request: Request, user=Depends(get_admin_user)):
+    report = open_persona_key_import.new_report()
+    batch_size = max(1, open_persona_key_import.BATCH_SIZE)
+    lines, buffer, first_line = [], b"", 1
+
+    # Own pool, so a large import does not hold up completions' header building.
+    async def flush(lines, first_line):
+        await open_persona_executor.run_import(
+            open_persona_key_import.import_lines, lines, report=report, first_line=first_line
+        )
+
+    # Read the body incrementally; each full batch is written while the rest streams in.
+    async for chunk in request.stream():
+        buffer += chunk
+        *complete, buffer = buffer.split(b"\n")
+        lines.extend(complete)
+        if len(lines) >= batch_size:
+            await flush(lines, first_line)
+            first_line += len(lines)
+            lines = []
+    if buffer:
+        lines.append(buffer)
+    if lines:
+        await flush(lines, first_line)
+
+    for user_id in report["updated_user_ids"]:
+        open_persona_provider_cache.invalidate(open_persona_provider_cache.USER_TOOL_ID, user_id)
+    return {k: v for k, v in report.items() if k != "updated_user_ids"}
+
+
+@router.get("/provider-keys/export")
+async def export_provider_keys(user=Depends(get_admin_user)):
+    # A sync generator: Starlette iterates it on its threadpool, so paging the
+    # user table does not block the event loop.
+    rows = (json.dumps(row) + "\n" for row in open_persona_key_import.export_rows())
+    return StreamingResponse(rows, media_type="application/x-ndjson")
+
+
+@router.get("/metrics")
+async def get_metrics(user=Depends(get_admin_user)):
+    return PlainTextResponse(open_persona_metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@router.post("/models/refresh")
+async def refresh_models(user=Depends(get_admin_user)):
+    open_persona_model_cache.invalidate()
+    return open_persona_model_cache.cache.stats()
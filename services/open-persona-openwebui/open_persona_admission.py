@@ -0,0 +1,238 @@
+"""Admission control for sidecar-bound chat completions.
+
+Every completion forwarded to the sidecar holds a slot until its response is
+done (the router's cleanup closes the sidecar session, see open_persona_http).
+Slots are limited per user (`x-openwebui-user-id`) and, optionally, in total, so
+one user with many tabs cannot occupy every opencode runner.
+
+A request over a limit waits in a bounded queue. Freed slots go round-robin
+across the users that are waiting, FIFO within each user, so a user with a
+long backlog does not hold up everyone behind them. A request gets a 429 with
+`Retry-After` when the queue is full (immediately) or when it has waited
+`OPEN_PERSONA_ADMISSION_TIMEOUT_SECONDS`.
+
+Only clients of the openai router's own `/openai/chat/completions` see that
+status and header. Open WebUI's `/api/chat/completions` (the chat UI) runs the
+completion in `process_chat`, which catches the exception and passes on just
+`str(e)`, as the `chat:message:error` event and the stored message error. The
+detail therefore names the retry delay itself, so the chat shows e.g.
+`429: Too many concurrent Open Persona requests; please retry in 5s.`
+
+Limits are per uvicorn worker (each has its own event loop and counters):
+
+- `OPEN_PERSONA_MAX_INFLIGHT_PER_USER` (default 4; 0 = no per-user limit)
+- `OPEN_PERSONA_MAX_INFLIGHT` (default 0 = no global limit)
+- `OPEN_PERSONA_ADMISSION_QUEUE_SIZE` (default 64 waiting requests)
+- `OPEN_PERSONA_ADMISSION_TIMEOUT_SECONDS` (default 15)
+- `OPEN_PERSONA_ADMISSION_RETRY_AFTER_SECONDS` (default 5)
+
+A slot whose response is never cleaned up (e.g. dropped without running its
+background task) is released when the response is garbage-collected, and at
+the latest after `OPEN_PERSONA_ADMISSION_LEASE_SECONDS`.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import time
+import weakref
+from collections import OrderedDict, deque
+from typing import Callable, Optional
+
+import open_persona_metrics
+from open_persona_metrics import ADMISSION_REQUESTS, ADMISSION_WAIT_SECONDS
+
+log = logging.getLogger(__name__)
+
+MAX_INFLIGHT_PER_USER = int(os.environ.get("OPEN_PERSONA_MAX_INFLIGHT_PER_USER", "4"))
+MAX_INFLIGHT = int(os.environ.get("OPEN_PERSONA_MAX_INFLIGHT", "0"))
+QUEUE_SIZE = int(os.environ.get("OPEN_PERSONA_ADMISSION_QUEUE_SIZE", "64"))
+TIMEOUT_SECONDS = float(os.environ.get("OPEN_PERSONA_ADMISSION_TIMEOUT_SECONDS", "15"))
+RETRY_AFTER_SECONDS = float(os.environ.get("OPEN_PERSONA_ADMISSION_RETRY_AFTER_SECONDS", "5"))
+LEASE_SECONDS = float(os.environ.get("OPEN_PERSONA_ADMISSION_LEASE_SECONDS", "3600"))
+
+# Expired leases are looked for at most this often.
+LEASE_CHECK_INTERVAL_SECONDS = 1.0
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Slot:
+    """One admitted completion; `release()` is idempotent."""
+
+    def __init__(self, controller: "AdmissionController", user_id: str, acquired_at: float):
+        self._controller = controller
+        self._loop = asyncio.get_running_loop()
+        self.user_id = user_id
+        self.acquired_at = acquired_at
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self._controller._release(self)
+
+    def _release_threadsafe(self) -> None:
+        # Finalizers run wherever the garbage collector does (e.g. an executor thread).
+        if not self.released and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self.release)
+
+    def release_when_collected(self, obj) -> None:
+        """Release the slot when `obj` (the upstream response) is garbage-collected."""
+        weakref.finalize(obj, self._release_threadsafe)
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_per_user: int = MAX_INFLIGHT_PER_USER,
+        max_total: int = MAX_INFLIGHT,
+        queue_size: int = QUEUE_SIZE,
+        timeout_seconds: float = TIMEOUT_SECONDS,
+        retry_after_seconds: float = RETRY_AFTER_SECONDS,
+        lease_seconds: float = LEASE_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_per_user = max_per_user
+        self.max_total = max_total
+        self.queue_size = queue_size
+        self.timeout_seconds = timeout_seconds
+        self.retry_after_seconds = retry_after_seconds
+        self.lease_seconds = lease_seconds
+        self._clock = clock
+        self._inflight: dict = {}
+        self._total = 0
+        self._slots: set = set()
+        # user id -> futures waiting for a slot; order is the round-robin order.
+        self._waiting: "OrderedDict[str, deque]" = OrderedDict()
+        self._queued = 0
+        self._next_lease_check = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_per_user > 0 or self.max_total > 0
+
+    def _has_room(self, user_id: str) -> bool:
+        if self.max_total > 0 and self._total >= self.max_total:
+            return False
+        return self.max_per_user <= 0 or self._inflight.get(user_id, 0) < self.max_per_user
+
+    def _grant(self, user_id: str) -> Slot:
+        self._inflight[user_id] = self._inflight.get(user_id, 0) + 1
+        self._total += 1
+        slot = Slot(self, user_id, self._clock())
+        self._slots.add(slot)
+        return slot
+
+    def _release(self, slot: Slot) -> None:
+        self._slots.discard(slot)
+        count = self._inflight.get(slot.user_id, 0) - 1
+        if count > 0:
+            self._inflight[slot.user_id] = count
+        else:
+            self._inflight.pop(slot.user_id, None)
+        self._total -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand freed slots to waiting requests, round-robin across users."""
+        granted = True
+        while granted and self._waiting:
+            granted = False
+            for user_id in list(self._waiting):
+                if not self._has_room(user_id):
+                    continue
+                waiters = self._waiting[user_id]
+                while waiters and waiters[0].done():
+                    waiters.popleft()  # timed out or cancelled; already uncounted
+                if not waiters:
+                    del self._waiting[user_id]
+                    continue
+                future = waiters.popleft()
+                self._queued -= 1
+                if waiters:
+                    self._waiting.move_to_end(user_id)
+                else:
+                    del self._waiting[user_id]
+                future.set_result(self._grant(user_id))
+                granted = True
+                break
+
+    def _expire_leases(self) -> None:
+        now = self._clock()
+        if self.lease_seconds <= 0 or now < self._next_lease_check:
+            return
+        self._next_lease_check = now + LEASE_CHECK_INTERVAL_SECONDS
+        for slot in [s for s in self._slots if now - s.acquired_at > self.lease_seconds]:
+            log.warning("open-persona: releasing an expired admission slot for user %s", slot.user_id)
+            slot.release()
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        ADMISSION_REQUESTS.inc(reason)
+        return AdmissionRejected(reason, self.retry_after_seconds)
+
+    async def acquire(self, user_id: str) -> Slot:
+        """Wait for a slot for `user_id`; raises AdmissionRejected past the queue or deadline."""
+        user_id = str(user_id)
+        self._expire_leases()
+        # Requests of a user that is already waiting queue behind them (FIFO per user).
+        if self._has_room(user_id) and user_id not in self._waiting:
+            ADMISSION_REQUESTS.inc("admitted")
+            return self._grant(user_id)
+        if self._queued >= self.queue_size:
+            raise self._reject("queue_full")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(user_id, deque()).append(future)
+        self._queued += 1
+        started = self._clock()
+        try:
+            slot = await asyncio.wait_for(asyncio.shield(future), self.timeout_seconds)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as exc:
+            if future.done() and not future.cancelled():
+                # Granted just as we gave up: hand the slot back.
+                future.result().release()
+            else:
+                future.cancel()
+                self._queued -= 1
+            ADMISSION_WAIT_SECONDS.observe(self._clock() - started)
+            if isinstance(exc, asyncio.TimeoutError):
+                raise self._reject("timeout") from None
+            raise
+        ADMISSION_WAIT_SECONDS.observe(self._clock() - started)
+        ADMISSION_REQUESTS.inc("queued")
+        return slot
+
+    def stats(self) -> dict:
+        return {"inflight": self._total, "queued": self._queued, "users": len(self._inflight)}
+
+
+controller = AdmissionController()
+open_persona_metrics.register_admission(controller.stats)
+
+
+async def admit(user_id, admission: Optional[AdmissionController] = None) -> Optional[Slot]:
+    """A slot for a sidecar-bound completion by `user_id`, or a 429 HTTPException.
+
+    Returns None when no limit is configured.
+    """
+    admission = admission or controller
+    if not admission.enabled:
+        return None
+    try:
+        return await admission.acquire(user_id)
+    except AdmissionRejected as exc:
+        from fastapi import HTTPException
+
+        retry_after = max(1, math.ceil(exc.retry_after))
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many concurrent Open Persona requests; please retry in {retry_after}s.",
+            headers={"Retry-After": str(retry_after)},
+        ) from None
@@ -0,0 +1,227 @@
+"""Circuit breaker for sidecar-bound chat completions.
+
+While the sidecar is restarting or saturated, completions sent to it hang until
+upstream's timeouts, holding the worker's connections, admission slots and the
+user's tab the whole time. The patched openai router asks `allow()` before
+forwarding to an allowlisted sidecar; each sidecar host (`host[:port]` of the
+URL) has its own circuit:
+
+- closed: requests go through. `OPEN_PERSONA_BREAKER_FAILURES` consecutive
+  failures (default 5; 0 turns the breaker off) open the circuit. A failure is a
+  connection error or timeout, or a 5xx. Response headers taking longer than
+  `OPEN_PERSONA_BREAKER_SLOW_SECONDS` count too if that is set (default 0, off):
+  the sidecar sends no headers until opencode's run is done, so a long turn is
+  slow without anything being wrong.
+- open: requests fail fast with a 503 and `Retry-After`, without taking an
+  admission slot, for `OPEN_PERSONA_BREAKER_OPEN_SECONDS` (default 30).
+- half-open: then up to `OPEN_PERSONA_BREAKER_HALF_OPEN_PROBES` requests
+  (default 1) go through as probes; a probe that succeeds closes the circuit,
+  one that fails opens it again. A probe that never reports back is given up on
+  after another open period.
+
+The outcome is recorded when the sidecar's response headers arrive, or as slow
+once they are overdue if slowness counts (the sidecar session,
+open_persona_http); a request that
+ends before either (e.g. the client went away) counts as neither. State is per
+uvicorn worker and exported by open_persona_metrics
+(`open_persona_breaker_state{host}`).
+
+As with open_persona_admission's 429, the 503 status and `Retry-After` reach only
+direct callers of `/openai/chat/completions`. On the chat UI's
+`/api/chat/completions`, Open WebUI's `process_chat` reports just `str(e)` to the
+chat, so the detail names the delay as well.
+"""
+
+import logging
+import math
+import os
+import time
+from typing import Callable, Optional
+from urllib.parse import urlparse
+
+import open_persona_metrics
+from open_persona_metrics import BREAKER_FAILURES, BREAKER_REQUESTS, BREAKER_TRANSITIONS
+
+log = logging.getLogger(__name__)
+
+FAILURE_THRESHOLD = int(os.environ.get("OPEN_PERSONA_BREAKER_FAILURES", "5"))
+SLOW_SECONDS = float(os.environ.get("OPEN_PERSONA_BREAKER_SLOW_SECONDS", "0"))
+OPEN_SECONDS = float(os.environ.get("OPEN_PERSONA_BREAKER_OPEN_SECONDS", "30"))
+HALF_OPEN_PROBES = int(os.environ.get("OPEN_PERSONA_BREAKER_HALF_OPEN_PROBES", "1"))
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+# Exported as the value of open_persona_breaker_state.
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+def host_key(url: str) -> str:
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    return f"{host}:{parsed.port}" if parsed.port else host
+
+
+class CircuitOpen(Exception):
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(f"circuit open for {host}")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class _Circuit:
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.probe_started_at = 0.0
+
+
+class Ticket:
+    """One request's pass through a circuit; the first outcome reported counts."""
+
+    def __init__(self, breaker: "CircuitBreaker", host: str, probe: bool):
+        self._breaker = breaker
+        self.host = host
+        self.probe = probe
+        self.slow_seconds = breaker.slow_seconds
+        self.done = False
+
+    def _finish(self, ok: Optional[bool], reason: str = "") -> None:
+        if not self.done:
+            self.done = True
+            self._breaker._record(self, ok, reason)
+
+    def success(self) -> None:
+        self._finish(True)
+
+    def failure(self, reason: str) -> None:
+        self._finish(False, reason)
+
+    def cancel(self) -> None:
+        """The request ended without an outcome (not sent, or abandoned)."""
+        self._finish(None)
+
+    def record_response(self, status: int, elapsed: float) -> None:
+        if status >= 500:
+            self.failure("status")
+        elif self.slow_seconds > 0 and elapsed > self.slow_seconds:
+            self.failure("slow")
+        else:
+            self.success()
+
+
+class CircuitBreaker:
+    """Per-host circuits; use from one event loop."""
+
+    def __init__(
+        self,
+        failure_threshold: int = FAILURE_THRESHOLD,
+        slow_seconds: float = SLOW_SECONDS,
+        open_seconds: float = OPEN_SECONDS,
+        half_open_probes: int = HALF_OPEN_PROBES,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.slow_seconds = slow_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self._clock = clock
+        self._circuits: dict = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.failure_threshold > 0
+
+    def _transition(self, host: str, circuit: _Circuit, state: str) -> None:
+        circuit.state = state
+        BREAKER_TRANSITIONS.inc(state)
+        if state == OPEN:
+            circuit.opened_at = self._clock()
+            circuit.probes = 0
+            log.warning("open-persona: sidecar %s failing; circuit open for %.0fs", host, self.open_seconds)
+        elif state == CLOSED:
+            circuit.failures = 0
+            log.info("open-persona: sidecar %s recovered; circuit closed", host)
+
+    def _reject(self, host: str, until: float) -> CircuitOpen:
+        BREAKER_REQUESTS.inc("rejected")
+        return CircuitOpen(host, max(0.0, until - self._clock()))
+
+    def allow(self, url: str) -> Ticket:
+        """A ticket for a request to `url`; raises CircuitOpen while its circuit is open."""
+        host = host_key(url)
+        circuit = self._circuits.get(host)
+        if circuit is None:
+            circuit = self._circuits[host] = _Circuit()
+        now = self._clock()
+        if circuit.state == OPEN:
+            if now - circuit.opened_at < self.open_seconds:
+                raise self._reject(host, circuit.opened_at + self.open_seconds)
+            self._transition(host, circuit, HALF_OPEN)
+        if circuit.state == HALF_OPEN:
+            if circuit.probes >= self.half_open_probes:
+                if now - circuit.probe_started_at < self.open_seconds:
+                    raise self._reject(host, circuit.probe_started_at + self.open_seconds)
+                circuit.probes = 0  # the probes never reported back
+            circuit.probes += 1
+            circuit.probe_started_at = now
+            BREAKER_REQUESTS.inc("probe")
+            return Ticket(self, host, probe=True)
+        BREAKER_REQUESTS.inc("allowed")
+        return Ticket(self, host, probe=False)
+
+    def _record(self, ticket: Ticket, ok: Optional[bool], reason: str) -> None:
+        circuit = self._circuits.get(ticket.host)
+        if circuit is None:
+            return
+        if ticket.probe and circuit.state == HALF_OPEN:
+            circuit.probes = max(0, circuit.probes - 1)
+        if ok is None:
+            return
+        if not ok:
+            BREAKER_FAILURES.inc(reason)
+        if circuit.state == CLOSED:
+            circuit.failures = 0 if ok else circuit.failures + 1
+            if circuit.failures >= self.failure_threshold:
+                self._transition(ticket.host, circuit, OPEN)
+        elif circuit.state == HALF_OPEN and ticket.probe:
+            self._transition(ticket.host, circuit, CLOSED if ok else OPEN)
+        # Requests sent before the circuit opened do not change an open circuit.
+
+    def state(self, url: str) -> str:
+        circuit = self._circuits.get(host_key(url))
+        return circuit.state if circuit is not None else CLOSED
+
+    def stats(self) -> dict:
+        return {
+            host: {"state": STATE_VALUES[circuit.state], "failures": circuit.failures}
+            for host, circuit in self._circuits.items()
+        }
+
+
+breaker = CircuitBreaker()
+open_persona_metrics.register_breaker(breaker.stats)
+
+
+def allow(url: str, circuit_breaker: Optional[CircuitBreaker] = None) -> Optional[Ticket]:
+    """A ticket for a sidecar-bound completion to `url`, or a 503 HTTPException.
+
+    Returns None when the breaker is off.
+    """
+    circuit_breaker = circuit_breaker or breaker
+    if not circuit_breaker.enabled:
+        return None
+    try:
+        return circuit_breaker.allow(url)
+    except CircuitOpen as exc:
+        from fastapi import HTTPException
+
+        retry_after = max(1, math.ceil(exc.retry_after))
+        raise HTTPException(
+            status_code=503,
+            detail=f"The Open Persona sidecar is unavailable; please retry in {retry_after}s.",
+            headers={"Retry-After": str(retry_after)},
+        ) from None
@@ -0,0 +1,71 @@
+"""Bounded thread pool for Open Persona's blocking work inside Open WebUI.
+
+The openai router patch runs inside Open WebUI's async chat handler. Valve lookups
+go through synchronous SQLAlchemy calls and the meta header needs JSON/base64
+work, so the whole header-building stage is handed to this pool as one awaitable
+step instead of stalling every other stream on the uvicorn worker.
+
+Pool size comes from `OPEN_PERSONA_HEADER_WORKERS` (per uvicorn worker).
+
+Bulk provider-key imports (open_persona_admin_router) write in batches that can
+take much longer than a header lookup, so they get their own pool
+(`OPEN_PERSONA_IMPORT_WORKERS`, default 1) via `run_import` and never hold up
+chat completions waiting on the header pool.
+
+`run_in_executor` does not carry context variables over to the pool thread, so
+both run the call in a copy of the caller's context (as `asyncio.to_thread`
+does). That keeps the request's OpenTelemetry span current for
+open_persona_tracing's parent lookup.
+"""
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+HEADER_WORKERS = max(1, int(os.environ.get("OPEN_PERSONA_HEADER_WORKERS", "4")))
+IMPORT_WORKERS = max(1, int(os.environ.get("OPEN_PERSONA_IMPORT_WORKERS", "1")))
+
+_executors: "dict[str, ThreadPoolExecutor]" = {}
+_executor_lock = threading.Lock()
+
+
+def _pool(name: str, workers: int) -> ThreadPoolExecutor:
+    executor = _executors.get(name)
+    if executor is None:
+        with _executor_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                executor = _executors[name] = ThreadPoolExecutor(
+                    max_workers=workers, thread_name_prefix=f"open-persona-{name}"
+                )
+    return executor
+
+
+def get_executor() -> ThreadPoolExecutor:
+    return _pool("headers", HEADER_WORKERS)
+
+
+def get_import_executor() -> ThreadPoolExecutor:
+    return _pool("import", IMPORT_WORKERS)
+
+
+async def _run(executor: ThreadPoolExecutor, fn: Callable[..., T], *args, **kwargs) -> T:
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(executor, functools.partial(context.run, fn, *args, **kwargs))
+
+
+async def run_blocking(fn: Callable[..., T], *args, **kwargs) -> T:
+    """Run `fn(*args, **kwargs)` on the Open Persona pool without blocking the event loop."""
+    return await _run(get_executor(), fn, *args, **kwargs)
+
+
+async def run_import(fn: Callable[..., T], *args, **kwargs) -> T:
+    """Like `run_blocking`, on the separate pool for bulk key imports."""
+    return await _run(get_import_executor(), fn, *args, **kwargs)
@@ -0,0 +1,273 @@
+"""Open Persona forwarding logic for the patched Open WebUI openai router.
+
+The router patch only injects a call into this module; everything that decides
+whether a destination is the sidecar and which `x-openpersona-*` headers to send
+lives here so it is importable (and testable) outside Open WebUI.
+
+The host allowlist is parsed once at import from `OPEN_PERSONA_SIDECAR_ALLOWLIST`.
+
+Persona meta headers are memoized per model id and `updated_at`, so the
+dump/JSON/base64 work only happens when an admin edits the Model.
+`OPEN_PERSONA_META_ENCODING=zlib` switches to the compact wire format
+(`x-openpersona-meta-z64`, zlib-compressed); both formats carry
+`x-openpersona-meta-digest` so the sidecar can skip re-parsing a blob it has seen.
+
+On the way back, `response_headers` only lets the sidecar's
+`x-openpersona-model-details` through to the browser.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Optional
+from urllib.parse import urlparse
+
+import open_persona_metrics
+import open_persona_provider_cache
+import open_persona_tracing
+from open_persona_metrics import FORWARD_REQUESTS, FORWARD_STAGE_SECONDS
+from open_persona_provider_cache import ProviderKeys, clean_header_value
+
+log = logging.getLogger(__name__)
+
+DEFAULT_ALLOWLIST = "open-persona-sidecar,localhost,127.0.0.1"
+CLUSTER_LOCAL_SUFFIX = ".svc.cluster.local"
+
+META_ENCODING = os.environ.get("OPEN_PERSONA_META_ENCODING", "b64").strip().lower()
+META_CACHE_MAX_MODELS = int(os.environ.get("OPEN_PERSONA_META_CACHE_MAX_MODELS", "256"))
+
+# Set by the sidecar on completions (base64 JSON of the resolved models); the
+# patched frontend badge reads it instead of parsing response bodies.
+MODEL_DETAILS_HEADER = "x-openpersona-model-details"
+
+
+def compile_host_matcher(allowlist_csv: str) -> Callable[[str], bool]:
+    """Build a host predicate for a comma-separated allowlist.
+
+    A host matches if it is listed exactly, or if it is a Kubernetes service name
+    (`<name>.<namespace>.svc.cluster.local`) whose `<name>` is listed.
+    """
+    allowlist = frozenset(h.strip().lower() for h in allowlist_csv.split(",") if h.strip())
+
+    def host_allowed(host: str) -> bool:
+        if not host:
+            return False
+        h = host.lower()
+        if h in allowlist:
+            return True
+        return h.endswith(CLUSTER_LOCAL_SUFFIX) and h.partition(".")[0] in allowlist
+
+    return host_allowed
+
+
+host_allowed = compile_host_matcher(os.environ.get("OPEN_PERSONA_SIDECAR_ALLOWLIST", DEFAULT_ALLOWLIST))
+
+
+@lru_cache(maxsize=64)
+def is_sidecar_url(url: str) -> bool:
+    """Whether `url` points at an allowlisted sidecar (cached; base URLs are config)."""
+    try:
+        host = urlparse(url).hostname or ""
+    except ValueError:
+        host = ""
+    return host_allowed(host)
+
+
+def forwarding_allowed(url: str) -> bool:
+    """`is_sidecar_url`, counted and timed for open_persona_metrics."""
+    with FORWARD_STAGE_SECONDS.time("allowlist"):
+        allowed = is_sidecar_url(url)
+    FORWARD_REQUESTS.inc("forwarded" if allowed else "refused")
+    return allowed
+
+
+def encode_meta_headers(open_persona_meta, encoding: str = META_ENCODING) -> dict:
+    """Encode the `open_persona` meta extension as sidecar headers.
+
+    The JSON is canonical (sorted keys, no whitespace) so the digest only changes
+    when the meta does.
+    """
+    raw = json.dumps(open_persona_meta, sort_keys=True, separators=(",", ":")).encode()
+    headers = {"x-openpersona-meta-digest": "sha256:" + hashlib.sha256(raw).hexdigest()}
+    if encoding == "zlib":
+        headers["x-openpersona-meta-z64"] = base64.b64encode(zlib.compress(raw, 9)).decode()
+    else:
+        headers["x-openpersona-meta-b64"] = base64.b64encode(raw).decode()
+    return headers
+
+
+class ModelMetaHeaderCache:
+    """Encoded meta headers per model id, valid while the model's `updated_at` is unchanged."""
+
+    def __init__(self, max_models: int = META_CACHE_MAX_MODELS):
+        self.max_models = max_models
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple[object, dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Entries replaced because the model's updated_at (or the encoding) changed.
+        self.invalidations = 0
+
+    def headers_for(self, model_info, encoding: str = META_ENCODING) -> dict:
+        if model_info is None:
+            return {}
+        model_id = str(model_info.id)
+        version = (getattr(model_info, "updated_at", None), encoding)
+        with self._lock:
+            entry = self._entries.get(model_id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(model_id)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self.invalidations += 1
+            self.misses += 1
+
+        headers = {}
+        meta = model_info.meta.model_dump() if model_info.meta is not None else {}
+        # Only forward our extension meta to avoid leaking unrelated data.
+        open_persona_ext = meta.get("open_persona")
+        if open_persona_ext is not None:
+            try:
+                headers = encode_meta_headers(open_persona_ext, encoding)
+            except (TypeError, ValueError):
+                log.warning("open-persona: failed to forward open_persona_meta")
+
+        if version[0] is not None and self.max_models > 0:
+            with self._lock:
+                self._entries[model_id] = (version, headers)
+                self._entries.move_to_end(model_id)
+                while len(self._entries) > self.max_models:
+                    self._entries.popitem(last=False)
+        return headers
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "invalidations": self.invalidations, "size": len(self._entries)}
+
+
+meta_cache = ModelMetaHeaderCache()
+open_persona_metrics.register_cache("persona_meta", meta_cache.stats)
+
+
+def chat_identity_headers(metadata: Optional[dict], messages=None) -> dict:
+    """Session-affinity headers so the sidecar reuses one opencode session per chat.
+
+    `x-openwebui-chat-id` / `x-openwebui-message-id` come from Open WebUI's request
+    metadata; `x-openpersona-turn-index` is the number of user messages so far.
+    """
+    headers = {}
+    metadata = metadata or {}
+    for field, header in (("chat_id", "x-openwebui-chat-id"), ("message_id", "x-openwebui-message-id")):
+        value = metadata.get(field)
+        if value:
+            value = clean_header_value(value)
+            if value:
+                headers[header] = value
+    if isinstance(messages, list):
+        turns = sum(1 for m in messages if isinstance(m, dict) and m.get("role") == "user")
+        headers["x-openpersona-turn-index"] = str(turns)
+    return headers
+
+
+def build_sidecar_headers(
+    user_id,
+    original_model_id,
+    meta_headers: Optional[dict] = None,
+    provider_keys: Optional[ProviderKeys] = None,
+    chat_headers: Optional[dict] = None,
+) -> dict:
+    """Headers for a sidecar-bound chat completion.
+
+    Pure: callers encode the persona meta and resolve provider keys first (see
+    `resolve_sidecar_headers`).
+    """
+    headers = {
+        "x-openwebui-user-id": str(user_id),
+        "x-openpersona-original-model-id": str(original_model_id),
+    }
+    if chat_headers:
+        headers.update(chat_headers)
+    if meta_headers:
+        headers.update(meta_headers)
+    if provider_keys is not None:
+        headers.update(provider_keys.headers())
+    return headers
+
+
+def resolve_sidecar_headers(
+    user_id, original_model_id, model_info=None, metadata=None, messages=None, trace_headers=None
+) -> dict:
+    """Encode persona meta and resolve provider keys (both cached), then build headers.
+
+    `model_info` is the Open WebUI model row of the selected Persona; `metadata` and
+    `messages` are the chat completion's metadata and message list. Cache misses
+    do blocking work, so the router patch runs this on the open_persona_executor pool.
+
+    With tracing enabled (open_persona_tracing), this stage is a span whose parent
+    comes from `trace_headers` (the incoming request headers), and its
+    `traceparent`/`tracestate` are added to the returned headers.
+    """
+    with open_persona_tracing.span("open_persona.build_headers", trace_headers) as span:
+        headers = _resolve_sidecar_headers(user_id, original_model_id, model_info, metadata, messages)
+        if span is not None:
+            span.set_attribute("open_persona.original_model_id", str(original_model_id))
+            span.set_attribute("open_persona.persona_meta", "x-openpersona-meta-digest" in headers)
+            headers.update(span.headers())
+        return headers
+
+
+def _resolve_sidecar_headers(user_id, original_model_id, model_info, metadata, messages) -> dict:
+    with FORWARD_STAGE_SECONDS.time("total"):
+        try:
+            with FORWARD_STAGE_SECONDS.time("meta"):
+                meta_headers = meta_cache.headers_for(model_info)
+        except Exception:
+            log.warning("open-persona: failed to forward open_persona_meta")
+            meta_headers = None
+        try:
+            with FORWARD_STAGE_SECONDS.time("valves"):
+                provider_keys = open_persona_provider_cache.resolve_provider_keys(str(user_id))
+        except Exception:
+            log.warning("open-persona: failed to forward provider keys")
+            provider_keys = None
+        with FORWARD_STAGE_SECONDS.time("headers"):
+            return build_sidecar_headers(
+                user_id,
+                original_model_id,
+                meta_headers,
+                provider_keys,
+                chat_identity_headers(metadata, messages),
+            )
+
+
+def merge_headers(headers: dict, extra: dict) -> dict:
+    """Set `extra` on `headers`, replacing keys that differ only by case.
+
+    Upstream may already send e.g. `X-OpenWebUI-Chat-Id` (ENABLE_FORWARD_USER_INFO_HEADERS);
+    sending both spellings would make the sidecar see a comma-joined value.
+    """
+    lowered = {k.lower() for k in extra}
+    for key in [k for k in headers if k.lower() in lowered and k not in extra]:
+        del headers[key]
+    headers.update(extra)
+    return headers
+
+
+def response_headers(upstream_headers, url: str) -> dict:
+    """Upstream response headers to pass back to the browser.
+
+    `x-openpersona-model-details` drives the UI badge, so it is only passed
+    through from allowlisted sidecar hosts.
+    """
+    headers = dict(upstream_headers)
+    if not is_sidecar_url(url):
+        for key in [k for k in headers if k.lower() == MODEL_DETAILS_HEADER]:
+            del headers[key]
+    return headers
@@ -0,0 +1,189 @@
+"""Pooled keep-alive HTTP session for sidecar-bound chat completions.
+
+Upstream Open WebUI opens a new `aiohttp.ClientSession` (and so a new TCP
+connection) for every chat completion and closes it afterwards. For allowlisted
+sidecar URLs the patched openai router uses `sidecar_session()` instead: one
+long-lived session per uvicorn worker whose connector keeps connections to the
+sidecar open between turns. Other providers keep the upstream per-request session.
+
+The router calls `close()` on whatever session it used once the response is
+done; the pooled session ignores that and is closed by `close()` here, which the
+main.py patch calls on app shutdown. That `close()` (or, failing it, the
+response being garbage-collected) also releases the request's admission slot
+(open_persona_admission). The session also reports the request's outcome to the
+circuit breaker (open_persona_breaker) once the response headers arrive. So a
+sidecar request always gets a `SidecarSession` while it holds a slot or a
+breaker ticket, pooled or not.
+
+Settings (per uvicorn worker):
+
+- `OPEN_PERSONA_SIDECAR_POOL` (default on): `off` restores the upstream behaviour.
+- `OPEN_PERSONA_SIDECAR_POOL_SIZE`: max open connections to the sidecar (64).
+- `OPEN_PERSONA_SIDECAR_KEEPALIVE_SECONDS`: idle time before a pooled
+  connection is closed (60; keep it below the sidecar's `KEEP_ALIVE_TIMEOUT_MS`).
+- `OPEN_PERSONA_SIDECAR_CONNECT_TIMEOUT_SECONDS` (10) and
+  `OPEN_PERSONA_SIDECAR_TIMEOUT_SECONDS` (whole request). An empty value means no
+  limit. Unset, the whole-request limit is Open WebUI's `AIOHTTP_CLIENT_TIMEOUT`,
+  read the way upstream reads it: unset or empty is no limit, a non-integer 300.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+import open_persona_forwarding
+
+log = logging.getLogger(__name__)
+
+
+def _seconds(name: str, default: str) -> Optional[float]:
+    value = os.environ.get(name, default).strip()
+    return float(value) if value else None
+
+
+def _upstream_timeout() -> Optional[float]:
+    """Open WebUI's `AIOHTTP_CLIENT_TIMEOUT`, parsed as open_webui.env does."""
+    value = os.environ.get("AIOHTTP_CLIENT_TIMEOUT", "")
+    if value == "":
+        return None
+    try:
+        return float(int(value))
+    except ValueError:
+        return 300.0
+
+
+POOL_ENABLED = os.environ.get("OPEN_PERSONA_SIDECAR_POOL", "on").strip().lower() not in ("0", "off", "false", "no")
+POOL_SIZE = int(os.environ.get("OPEN_PERSONA_SIDECAR_POOL_SIZE", "64"))
+KEEPALIVE_SECONDS = float(os.environ.get("OPEN_PERSONA_SIDECAR_KEEPALIVE_SECONDS", "60"))
+CONNECT_TIMEOUT_SECONDS = _seconds("OPEN_PERSONA_SIDECAR_CONNECT_TIMEOUT_SECONDS", "10")
+TIMEOUT_SECONDS = (
+    _seconds("OPEN_PERSONA_SIDECAR_TIMEOUT_SECONDS", "")
+    if "OPEN_PERSONA_SIDECAR_TIMEOUT_SECONDS" in os.environ
+    else _upstream_timeout()
+)
+
+# The session is bound to the event loop it was created on (one per uvicorn worker).
+_session = None
+_session_loop: Optional[asyncio.AbstractEventLoop] = None
+# Closes of sessions left on an earlier loop, kept referenced until they finish.
+_retiring = set()
+
+
+def _create_session(pooled: bool = True):
+    import aiohttp
+
+    timeout = aiohttp.ClientTimeout(total=TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS)
+    if not pooled:
+        # What upstream would have opened for this one request.
+        return aiohttp.ClientSession(trust_env=True, timeout=timeout)
+    connector = aiohttp.TCPConnector(
+        limit=POOL_SIZE,
+        keepalive_timeout=KEEPALIVE_SECONDS,
+        ttl_dns_cache=300,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=timeout,
+        # Same proxy handling as upstream's per-request session.
+        trust_env=True,
+        # Shared by every user: never keep cookies the sidecar sets.
+        cookie_jar=aiohttp.DummyCookieJar(),
+    )
+
+
+def get_session():
+    """The worker's pooled session, created on first use (call from the event loop)."""
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        _retire(_session, _session_loop)
+        _session = _create_session()
+        _session_loop = loop
+    return _session
+
+
+def _retire(session, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+    """Close a pooled `session` that belongs to an earlier event `loop`."""
+    if session is None or session.closed:
+        return
+    if loop is not None and loop.is_running():
+        # Still running in another thread: close it there.
+        asyncio.run_coroutine_threadsafe(_close_session(session), loop)
+        return
+    # Its loop is gone: close the connector from here, which drops the pooled
+    # connections (their sockets go when the transports are collected).
+    task = asyncio.get_running_loop().create_task(_close_session(session))
+    _retiring.add(task)
+    task.add_done_callback(_retiring.discard)
+
+
+async def _close_session(session) -> None:
+    try:
+        await session.close()
+    except Exception:
+        log.warning("open-persona: failed to close the sidecar session", exc_info=True)
+
+
+class SidecarSession:
+    """A sidecar session as the router sees it.
+
+    `request()` reports its outcome on the breaker `ticket`, if any. `close()`
+    leaves the pool open (only an unpooled session is closed) and releases the
+    admission `slot`, if any.
+    """
+
+    def __init__(self, session, owned: bool = False, slot=None, ticket=None):
+        self._session = session
+        self._owned = owned
+        self._slot = slot
+        self._ticket = ticket
+
+    async def request(self, *args, **kwargs):
+        started = time.monotonic()
+        timer = None
+        if self._ticket is not None and self._ticket.slow_seconds > 0:
+            # A sidecar that hangs counts as slow without waiting for the request timeout.
+            timer = asyncio.get_running_loop().call_later(self._ticket.slow_seconds, self._ticket.failure, "slow")
+        try:
+            response = await self._session.request(*args, **kwargs)
+        except Exception as exc:
+            if self._ticket is not None:
+                self._ticket.failure("timeout" if isinstance(exc, asyncio.TimeoutError) else "error")
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+        if self._ticket is not None:
+            self._ticket.record_response(response.status, time.monotonic() - started)
+        if self._slot is not None:
+            self._slot.release_when_collected(response)
+        return response
+
+    async def close(self) -> None:
+        if self._ticket is not None:
+            self._ticket.cancel()
+        if self._slot is not None:
+            self._slot.release()
+        if self._owned:
+            await self._session.close()
+
+
+def sidecar_session(url: str, slot=None, ticket=None) -> Optional[SidecarSession]:
+    """The session for an allowlisted sidecar `url`, else None (use upstream's)."""
+    if not open_persona_forwarding.is_sidecar_url(url):
+        return None
+    if POOL_ENABLED:
+        return SidecarSession(get_session(), slot=slot, ticket=ticket)
+    if slot is None and ticket is None:
+        return None
+    return SidecarSession(_create_session(pooled=False), owned=True, slot=slot, ticket=ticket)
+
+
+async def close() -> None:
+    """Close the pooled session (app shutdown)."""
+    global _session, _session_loop
+    session, _session, _session_loop = _session, None, None
+    if session is not None and not session.closed:
+        await _close_session(session)
@@ -0,0 +1,255 @@
+"""Bulk import/export of per-user provider keys (User Valves of the keys tool).
+
+Open WebUI stores User Valves in `user.settings["tools"]["valves"][<tool id>]`, and
+its UI/API writes them one user per request. This module streams JSONL instead:
+
+    {"user_id": "<id>", "keys": {"openrouter_api_key": "sk-or-..."}}
+
+Each row is validated with `ProviderKeyUserValves` and merged into the user's
+existing valves (fields not in `keys` are kept; `null` clears one), in batched
+transactions through the seeder's `Database` (SQLite or Postgres). Export streams
+the same shape with every key redacted.
+
+CLI (inside the Open WebUI container):
+
+    python /app/backend/open_persona_key_import.py import < keys.jsonl
+    python /app/backend/open_persona_key_import.py export > keys.redacted.jsonl
+
+The admin-only HTTP endpoints live in `open_persona_admin_router.py`.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Iterable, Iterator, Optional
+
+from open_persona_provider_cache import USER_TOOL_ID, clean_header_value
+from open_persona_seed import Database, get_database
+
+BATCH_SIZE = int(os.environ.get("OPEN_PERSONA_KEY_IMPORT_BATCH_SIZE", "500"))
+
+# Keys shorter than this are fully masked; longer ones keep their last 4 characters
+# so an admin can tell which key a user has without seeing it.
+REDACT_MIN_LENGTH = 16
+
+
+def _user_valves_schema():
+    from open_persona_provider_keys_tool import ProviderKeyUserValves
+
+    return ProviderKeyUserValves
+
+
+def redact(value) -> str:
+    if not value:
+        return ""
+    value = str(value)
+    if len(value) < REDACT_MIN_LENGTH:
+        return "****"
+    return "****" + value[-4:]
+
+
+def parse_row(line: str, schema=None) -> tuple[str, dict]:
+    """Parse and validate one JSONL row; returns (user_id, keys set by the row).
+
+    Raises ValueError with a message that never includes key values.
+    """
+    schema = schema or _user_valves_schema()
+    try:
+        row = json.loads(line)
+    except ValueError:
+        raise ValueError("not valid JSON") from None
+    if not isinstance(row, dict):
+        raise ValueError("row must be an object")
+    user_id = row.get("user_id")
+    if not isinstance(user_id, str) or not user_id.strip():
+        raise ValueError("user_id must be a non-empty string")
+    keys = row.get("keys")
+    if not isinstance(keys, dict) or not keys:
+        raise ValueError("keys must be a non-empty object")
+    unknown = sorted(set(keys) - set(schema.model_fields))
+    if unknown:
+        raise ValueError(f"unknown key fields: {', '.join(unknown)}")
+    try:
+        valves = schema(**keys)
+    except Exception as e:
+        fields = sorted({str(err["loc"][0]) for err in getattr(e, "errors", lambda: [])() if err.get("loc")})
+        raise ValueError(f"invalid key fields: {', '.join(fields) or 'unknown'}") from None
+    values = valves.model_dump(include=set(keys))
+    return user_id.strip(), {k: clean_header_value(v) if v else None for k, v in values.items()}
+
+
+def _load_settings(raw) -> dict:
+    if raw is None:
+        return {}
+    if isinstance(raw, str):
+        try:
+            raw = json.loads(raw)
+        except ValueError:
+            return {}
+    return raw if isinstance(raw, dict) else {}
+
+
+def _user_valves(settings: dict) -> dict:
+    valves = settings.get("tools")
+    for key in ("valves", USER_TOOL_ID):
+        valves = valves.get(key) if isinstance(valves, dict) else None
+    return valves if isinstance(valves, dict) else {}
+
+
+def apply_batch(cur, rows: list[tuple[str, dict]], schema=None) -> dict:
+    """Merge a batch of (user_id, keys) into user settings on `cur`.
+
+    Returns counts plus the user ids that were changed or not found.
+    """
+    schema = schema or _user_valves_schema()
+    # Later rows for the same user win, as if they had been written one by one.
+    merged: dict[str, dict] = {}
+    for user_id, keys in rows:
+        merged.setdefault(user_id, {}).update(keys)
+
+    ids = list(merged)
+    cur.execute(f'SELECT id, settings FROM "user" WHERE id IN ({", ".join("?" for _ in ids)})', ids)
+    current = {row[0]: _load_settings(row[1]) for row in cur.fetchall()}
+
+    updates = []
+    updated, unchanged = [], 0
+    for user_id, keys in merged.items():
+        if user_id not in current:
+            continue
+        settings = current[user_id]
+        previous = {k: v for k, v in _user_valves(settings).items() if k in schema.model_fields}
+        valves = schema(**{**previous, **keys}).model_dump()
+        if valves == schema(**previous).model_dump():
+            unchanged += 1
+            continue
+        tools = settings["tools"] = settings.get("tools") if isinstance(settings.get("tools"), dict) else {}
+        if not isinstance(tools.get("valves"), dict):
+            tools["valves"] = {}
+        tools["valves"][USER_TOOL_ID] = valves
+        updates.append((json.dumps(settings), user_id))
+        updated.append(user_id)
+
+    if updates:
+        cur.executemany('UPDATE "user" SET settings = ? WHERE id = ?', updates)
+    return {
+        "updated": updated,
+        "unchanged": unchanged,
+        "missing": [user_id for user_id in merged if user_id not in current],
+    }
+
+
+def new_report() -> dict:
+    return {"updated": 0, "unchanged": 0, "missing": [], "invalid": [], "batches": 0, "updated_user_ids": []}
+
+
+def import_lines(
+    lines: Iterable,
+    db: Optional[Database] = None,
+    batch_size: int = BATCH_SIZE,
+    schema=None,
+    report: Optional[dict] = None,
+    first_line: int = 1,
+) -> dict:
+    """Stream JSONL rows into User Valves, one transaction per `batch_size` rows.
+
+    Invalid rows are reported (by line number) and skipped; they do not abort
+    the batch. A database error aborts the import; earlier batches stay committed.
+    Pass `report`/`first_line` to continue an import fed in chunks.
+    """
+    db = db or get_database()
+    schema = schema or _user_valves_schema()
+    report = new_report() if report is None else report
+
+    def flush(batch):
+        with db.transaction() as cur:
+            result = apply_batch(cur, batch, schema)
+        report["batches"] += 1
+        report["updated"] += len(result["updated"])
+        report["unchanged"] += result["unchanged"]
+        report["missing"].extend(result["missing"])
+        report["updated_user_ids"].extend(result["updated"])
+
+    batch = []
+    for lineno, line in enumerate(lines, first_line):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        if not line.strip():
+            continue
+        try:
+            batch.append(parse_row(line, schema))
+        except ValueError as e:
+            report["invalid"].append({"line": lineno, "error": str(e)})
+            continue
+        if len(batch) >= max(1, batch_size):
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    return report
+
+
+def export_rows(db: Optional[Database] = None, batch_size: int = BATCH_SIZE) -> Iterator[dict]:
+    """Yield `{user_id, keys}` for every user with keys set, keys redacted.
+
+    Pages through users by id, one short read-only transaction per page, so a
+    large export neither takes the write lock nor holds a read transaction open
+    while the caller writes it out.
+    """
+    db = db or get_database()
+    last_id = ""
+    while True:
+        with db.read_transaction() as cur:
+            cur.execute(
+                'SELECT id, settings FROM "user" WHERE id > ? ORDER BY id LIMIT ?',
+                (last_id, max(1, batch_size)),
+            )
+            rows = cur.fetchall()
+        if not rows:
+            return
+        for user_id, raw in rows:
+            keys = {k: redact(v) for k, v in _user_valves(_load_settings(raw)).items() if v}
+            if keys:
+                yield {"user_id": user_id, "keys": keys}
+        last_id = rows[-1][0]
+
+
+def format_report(report: dict) -> str:
+    return (
+        f"open-persona key import: updated={report['updated']} unchanged={report['unchanged']} "
+        f"missing={len(report['missing'])} invalid={len(report['invalid'])} batches={report['batches']}"
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk import/export Open Persona per-user provider keys (JSONL).")
+    parser.add_argument("command", choices=("import", "export"))
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    db = get_database()
+    if not db.available():
+        print("open-persona key import: database not found", file=sys.stderr)
+        return 1
+    try:
+        if args.command == "export":
+            for row in export_rows(db, args.batch_size):
+                sys.stdout.write(json.dumps(row) + "\n")
+            return 0
+
+        started = time.perf_counter()
+        report = import_lines(sys.stdin, db, args.batch_size)
+    finally:
+        db.close()
+    for item in report["invalid"]:
+        print(f"line {item['line']}: {item['error']}", file=sys.stderr)
+    for user_id in report["missing"]:
+        print(f"unknown user: {user_id}", file=sys.stderr)
+    # Other processes' provider-key caches pick the new keys up within their TTL.
+    print(f"{format_report(report)} total={(time.perf_counter() - started) * 1000.0:.1f}ms", file=sys.stderr)
+    return 1 if report["invalid"] or report["missing"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
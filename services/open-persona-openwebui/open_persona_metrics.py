@@ -0,0 +1,356 @@
+"""Prometheus metrics for the Open Persona layer in Open WebUI.
+
+A few counters and histograms in Prometheus text format (0.0.4), using only the
+stdlib, so the patched image does not need `prometheus_client`. Served by the
+admin-only `GET /api/v1/open-persona/metrics` route (open_persona_admin_router).
+
+Label values only ever come from the fixed sets below (stages, decisions, cache
+names, seed and startup phases, patched modules) or from configuration (the
+allowlisted sidecar hosts); nothing user-derived is used as a label, so
+cardinality is bounded. Metrics are per process: with several uvicorn workers each scrape sees
+the worker that served it.
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Optional
+
+# Seconds. Forwarding stages are microseconds on a cache hit and DB-bound on a miss.
+STAGE_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# Seconds a request waited in the admission queue (bounded by its deadline).
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0, 60.0)
+
+# Written by open_persona_seed.py after each run (it usually runs in its own
+# process before uvicorn starts) and read back at scrape time.
+SEED_REPORT_PATH = os.environ.get(
+    "OPEN_PERSONA_SEED_REPORT_PATH",
+    os.path.join(os.environ.get("DATA_DIR", "/app/backend/data"), "open_persona_seed_report.json"),
+)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values: dict = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        with self._lock:
+            return self._values.get(labelvalues, 0.0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labelvalues, value in items:
+            lines.append(f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = STAGE_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # labelvalues -> [per-bucket counts (non-cumulative, last is +Inf), sum]
+        self._values: dict = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labelvalues)
+            if entry is None:
+                entry = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][idx] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, *labelvalues: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def count(self, *labelvalues: str) -> int:
+        with self._lock:
+            entry = self._values.get(labelvalues)
+            return sum(entry[0]) if entry else 0
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._values.items())
+        names = self.labelnames + ("le",)
+        for labelvalues, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(names, labelvalues + (_number(bound),))} {cumulative}")
+            labels = _labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Callback:
+    """A metric read at scrape time from `fn() -> iterable of (labelvalues, value)`."""
+
+    def __init__(self, name: str, help: str, type: str, labelnames: tuple, fn: Callable[[], Iterable]):
+        self.name = name
+        self.help = help
+        self.type = type
+        self.labelnames = labelnames
+        self.fn = fn
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for labelvalues, value in self.fn():
+            lines.append(f"{self.name}{_labels(self.labelnames, labelvalues)} {_number(value)}")
+        return lines
+
+
+FORWARD_STAGE_SECONDS = Histogram(
+    "open_persona_forward_stage_seconds",
+    "Time spent in each stage of the Open Persona forwarding block (allowlist, valves, meta, headers, total).",
+    ("stage",),
+)
+FORWARD_REQUESTS = Counter(
+    "open_persona_forward_requests_total",
+    "Chat completions forwarded to an allowlisted sidecar or refused by the allowlist.",
+    ("decision",),
+)
+VALVES_ACCESS = Counter(
+    "open_persona_valves_access_total",
+    "Valves access-control decisions on the patched tools router.",
+    ("mode", "decision", "memoized"),
+)
+ADMISSION_REQUESTS = Counter(
+    "open_persona_admission_requests_total",
+    "Sidecar-bound completions admitted at once, admitted after queueing, or rejected (queue_full, timeout).",
+    ("decision",),
+)
+ADMISSION_WAIT_SECONDS = Histogram(
+    "open_persona_admission_wait_seconds",
+    "Time queued requests waited for an admission slot (admitted or not).",
+    buckets=WAIT_BUCKETS,
+)
+BREAKER_REQUESTS = Counter(
+    "open_persona_breaker_requests_total",
+    "Sidecar-bound completions let through a closed circuit, sent as half-open probes, or rejected while open.",
+    ("decision",),
+)
+BREAKER_FAILURES = Counter(
+    "open_persona_breaker_failures_total",
+    "Sidecar responses counted as failures by the circuit breaker (error, timeout, status, slow).",
+    ("reason",),
+)
+BREAKER_TRANSITIONS = Counter(
+    "open_persona_breaker_transitions_total",
+    "Circuit breaker state changes, by the state entered.",
+    ("state",),
+)
+
+# Cache name -> stats() callable ({"hits", "misses", "invalidations", "size"}).
+_caches: dict = {}
+
+
+def register_cache(name: str, stats: Callable[[], dict]) -> None:
+    _caches[name] = stats
+
+
+def _cache_samples(field: str):
+    def samples():
+        for name, stats in sorted(_caches.items()):
+            yield (name,), stats().get(field, 0)
+
+    return samples
+
+
+# () -> {"inflight", "queued", "users"} from open_persona_admission.
+_admission: Optional[Callable[[], dict]] = None
+
+
+def register_admission(stats: Callable[[], dict]) -> None:
+    global _admission
+    _admission = stats
+
+
+def _admission_samples(field: str):
+    def samples():
+        if _admission is not None:
+            yield (), _admission().get(field, 0)
+
+    return samples
+
+
+# () -> {host: {"state", "failures"}} from open_persona_breaker.
+_breaker: Optional[Callable[[], dict]] = None
+
+
+def register_breaker(stats: Callable[[], dict]) -> None:
+    global _breaker
+    _breaker = stats
+
+
+def _breaker_samples(field: str):
+    def samples():
+        if _breaker is not None:
+            for host, circuit in sorted(_breaker().items()):
+                yield (host,), circuit.get(field, 0)
+
+    return samples
+
+
+# () -> {"phases": {name: seconds}, "imports": {module: seconds}} from open_persona_startup.
+_startup: Optional[Callable[[], dict]] = None
+
+
+def register_startup(report: Callable[[], dict]) -> None:
+    global _startup
+    _startup = report
+
+
+def _startup_samples(field: str):
+    def samples():
+        if _startup is not None:
+            for name, seconds in _startup().get(field, {}).items():
+                yield (name,), seconds
+
+    return samples
+
+
+def read_seed_report(path: Optional[str] = None) -> Optional[dict]:
+    try:
+        with open(path or SEED_REPORT_PATH, "r", encoding="utf-8") as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return report if isinstance(report, dict) else None
+
+
+def _seed_phase_samples():
+    report = read_seed_report() or {}
+    for phase, ms in sorted((report.get("timings") or {}).items()):
+        yield (phase,), float(ms) / 1000.0
+
+
+def _seed_timestamp_samples():
+    report = read_seed_report()
+    if report and report.get("finished_at"):
+        yield (), float(report["finished_at"])
+
+
+METRICS = [
+    FORWARD_STAGE_SECONDS,
+    FORWARD_REQUESTS,
+    VALVES_ACCESS,
+    Callback("open_persona_cache_hits_total", "Open Persona cache hits.", "counter", ("cache",), _cache_samples("hits")),
+    Callback(
+        "open_persona_cache_misses_total", "Open Persona cache misses.", "counter", ("cache",), _cache_samples("misses")
+    ),
+    Callback(
+        "open_persona_cache_invalidations_total",
+        "Open Persona cache invalidations.",
+        "counter",
+        ("cache",),
+        _cache_samples("invalidations"),
+    ),
+    Callback("open_persona_cache_entries", "Open Persona cache entries.", "gauge", ("cache",), _cache_samples("size")),
+    ADMISSION_REQUESTS,
+    ADMISSION_WAIT_SECONDS,
+    Callback(
+        "open_persona_admission_inflight",
+        "Sidecar-bound completions holding an admission slot.",
+        "gauge",
+        (),
+        _admission_samples("inflight"),
+    ),
+    Callback(
+        "open_persona_admission_queue_depth",
+        "Sidecar-bound completions waiting for an admission slot.",
+        "gauge",
+        (),
+        _admission_samples("queued"),
+    ),
+    BREAKER_REQUESTS,
+    BREAKER_FAILURES,
+    BREAKER_TRANSITIONS,
+    Callback(
+        "open_persona_breaker_state",
+        "Circuit state per sidecar host (0 closed, 1 half-open, 2 open).",
+        "gauge",
+        ("host",),
+        _breaker_samples("state"),
+    ),
+    Callback(
+        "open_persona_breaker_consecutive_failures",
+        "Consecutive failures counted against each sidecar host's closed circuit.",
+        "gauge",
+        ("host",),
+        _breaker_samples("failures"),
+    ),
+    Callback(
+        "open_persona_startup_phase_seconds",
+        "Cold-start phases of this worker (start.sh, interpreter, import, lifespan, healthy).",
+        "gauge",
+        ("phase",),
+        _startup_samples("phases"),
+    ),
+    Callback(
+        "open_persona_startup_import_seconds",
+        "Import time of each patched Open WebUI router in this worker.",
+        "gauge",
+        ("module",),
+        _startup_samples("imports"),
+    ),
+    Callback(
+        "open_persona_seed_phase_seconds",
+        "Phase timings of the last open_persona_seed.py run.",
+        "gauge",
+        ("phase",),
+        _seed_phase_samples,
+    ),
+    Callback(
+        "open_persona_seed_last_run_timestamp_seconds",
+        "Unix time the last open_persona_seed.py run finished.",
+        "gauge",
+        (),
+        _seed_timestamp_samples,
+    ),
+]
+
+
+def render() -> str:
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,122 @@
+"""Cached sidecar model list for the patched Open WebUI openai router.
+
+Open WebUI refreshes the model list from every `OPENAI_API_BASE_URLS` entry on page
+loads and chat starts (its own cache is per user and one second by default), so
+many users turn into many identical `GET /v1/models` calls to the sidecar. For
+allowlisted sidecar URLs the patched router's `send_get_request` goes through
+`get()` here instead:
+
+- Responses are kept for `OPEN_PERSONA_MODELS_CACHE_TTL_SECONDS` (default 60;
+  0 turns the cache off) per URL and API key. The sidecar's list does not depend
+  on the user, so one entry serves everyone.
+- Concurrent misses share one upstream call (single flight).
+- When a refresh fails (upstream returns None or an `error` body), the last good
+  list is served and kept for another TTL; without one, the failure is returned
+  as upstream would.
+- `invalidate()` (admin `POST /api/v1/open-persona/models/refresh`) makes every
+  entry due for refresh; the old list remains the fallback.
+
+Callers get a deep copy: upstream rewrites the model dicts it is given
+(`prefix_id`, tags, connection type), and Persona models are merged on top of
+that result, so each caller must start from the sidecar's own response.
+Each uvicorn worker has its own cache.
+"""
+
+import asyncio
+import copy
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+import open_persona_forwarding
+import open_persona_metrics
+
+log = logging.getLogger(__name__)
+
+TTL_SECONDS = float(os.environ.get("OPEN_PERSONA_MODELS_CACHE_TTL_SECONDS", "60"))
+
+
+def _failed(response) -> bool:
+    return response is None or (isinstance(response, dict) and "error" in response)
+
+
+class ModelListCache:
+    """TTL cache with single-flight refresh; use from one event loop."""
+
+    def __init__(self, ttl_seconds: float = TTL_SECONDS, clock: Callable[[], float] = time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        # key -> (expires_at, response)
+        self._entries: dict = {}
+        self._inflight: dict = {}
+        # Bumped on invalidation so a refresh that started before it is not stored.
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale = 0
+
+    async def get(self, key, fetch: Callable[[], Awaitable]):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > self._clock():
+            self.hits += 1
+            return copy.deepcopy(entry[1])
+        self.misses += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._refresh(key, fetch, self._generation))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._inflight.pop(key) if self._inflight.get(key) is done else None)
+        # Shielded: a caller that goes away does not cancel the refresh for the others.
+        return copy.deepcopy(await asyncio.shield(task))
+
+    async def _refresh(self, key, fetch, generation: int):
+        try:
+            response = await fetch()
+        except Exception:
+            log.warning("open-persona: sidecar model list refresh failed", exc_info=True)
+            response = None
+        entry = self._entries.get(key)
+        if not _failed(response):
+            if generation == self._generation:
+                self._entries[key] = (self._clock() + self.ttl_seconds, response)
+            return response
+        if entry is None:
+            return response
+        self.stale += 1
+        log.warning("open-persona: serving the last sidecar model list; refresh failed")
+        self._entries[key] = (self._clock() + self.ttl_seconds, entry[1])
+        return entry[1]
+
+    def invalidate(self) -> None:
+        self._generation += 1
+        self._inflight.clear()
+        self._entries = {key: (0.0, response) for key, (_, response) in self._entries.items()}
+        self.invalidations += 1
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "stale": self.stale,
+            "size": len(self._entries),
+        }
+
+
+cache = ModelListCache()
+open_persona_metrics.register_cache("sidecar_models", cache.stats)
+
+
+def use_cache(url: str) -> bool:
+    return cache.ttl_seconds > 0 and open_persona_forwarding.is_sidecar_url(url)
+
+
+async def get(url: str, key: Optional[str], fetch: Callable[[], Awaitable], model_cache: Optional[ModelListCache] = None):
+    """The response of `fetch()` (upstream's GET of `url`), cached for sidecar URLs."""
+    return await (model_cache or cache).get((url, key or ""), fetch)
+
+
+def invalidate() -> None:
+    cache.invalidate()
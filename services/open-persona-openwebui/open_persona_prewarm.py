@@ -0,0 +1,170 @@
+"""Pre-warm the sidecar's opencode runners for recently active users.
+
+The first chat after a deploy otherwise pays for starting the user's runner and
+setting up their workspace. `start.sh` runs this script in the background next to
+uvicorn (it never delays startup). It reads the `OPEN_PERSONA_PREWARM_USERS`
+most recently active users from the Open WebUI DB and sends the sidecar one
+`POST /v1/warmup` per user, with the identity and provider-key headers a real
+completion would carry (so the same runner is started), at most
+`OPEN_PERSONA_PREWARM_CONCURRENCY` at a time.
+
+The sidecar is `OPEN_PERSONA_PREWARM_URL`, else the first allowlisted entry of
+`OPENAI_API_BASE_URLS`. If it does not answer `/healthz` within
+`OPEN_PERSONA_PREWARM_WAIT_SECONDS`, the script gives up quietly; failed
+warm-ups are only counted.
+"""
+
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from urllib.parse import urlparse
+
+import open_persona_forwarding
+import open_persona_provider_cache
+from open_persona_provider_cache import ADMIN_TOOL_ID, USER_TOOL_ID, ProviderKeyCache
+from open_persona_seed import get_database
+
+PREWARM_USERS = int(os.environ.get("OPEN_PERSONA_PREWARM_USERS", "0"))
+CONCURRENCY = int(os.environ.get("OPEN_PERSONA_PREWARM_CONCURRENCY", "4"))
+WAIT_SECONDS = float(os.environ.get("OPEN_PERSONA_PREWARM_WAIT_SECONDS", "30"))
+TIMEOUT_SECONDS = float(os.environ.get("OPEN_PERSONA_PREWARM_TIMEOUT_SECONDS", "120"))
+
+# Sent as x-openpersona-original-model-id; a warm-up selects no Persona.
+WARMUP_MODEL_ID = "open-persona/build"
+
+
+def _json(value) -> dict:
+    # JSON columns are text on SQLite and already decoded on Postgres.
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return {}
+    return value if isinstance(value, dict) else {}
+
+
+def sidecar_target(environ=os.environ) -> tuple[Optional[str], str]:
+    """(base URL, API key) of the sidecar, or (None, "") when none is configured."""
+    url = environ.get("OPEN_PERSONA_PREWARM_URL", "").strip()
+    if url:
+        return url.rstrip("/"), environ.get("OPEN_PERSONA_PREWARM_API_KEY", "").strip()
+    urls = environ.get("OPENAI_API_BASE_URLS", "").split(";")
+    keys = environ.get("OPENAI_API_KEYS", "").split(";")
+    for idx, url in enumerate(u.strip() for u in urls):
+        if url and open_persona_forwarding.is_sidecar_url(url):
+            return url.rstrip("/"), keys[idx].strip() if idx < len(keys) else ""
+    return None, ""
+
+
+def recent_users(cur, limit: int) -> list:
+    """[(user_id, provider key valves)] of the `limit` most recently active users."""
+    cur.execute(
+        'SELECT id, settings FROM "user" WHERE last_active_at IS NOT NULL ORDER BY last_active_at DESC LIMIT ?',
+        (limit,),
+    )
+    users = []
+    for user_id, settings in cur.fetchall():
+        valves = _json(_json(_json(settings).get("tools")).get("valves")).get(USER_TOOL_ID)
+        users.append((str(user_id), _json(valves)))
+    return users
+
+
+def admin_valves(cur) -> dict:
+    cur.execute("SELECT valves FROM tool WHERE id = ?", (ADMIN_TOOL_ID,))
+    row = cur.fetchone()
+    return _json(row[0]) if row else {}
+
+
+def warmup_headers(user_id: str, tool_valves: dict, user_valves: dict, api_key: str = "") -> dict:
+    """What the router patch sends for `user_id`, minus the per-chat and Persona headers."""
+    keys = open_persona_provider_cache.resolve_provider_keys(
+        user_id, load=lambda _: (tool_valves, user_valves), key_cache=ProviderKeyCache(max_users=1)
+    )
+    headers = open_persona_forwarding.build_sidecar_headers(user_id, WARMUP_MODEL_ID, provider_keys=keys)
+    headers["Content-Type"] = "application/json"
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+    return headers
+
+
+def _get(url: str, timeout: float) -> bool:
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return response.status == 200
+    except (OSError, ValueError):
+        return False
+
+
+def wait_for_sidecar(base_url: str, wait_seconds: float = WAIT_SECONDS) -> bool:
+    parsed = urlparse(base_url)
+    health = f"{parsed.scheme}://{parsed.netloc}/healthz"
+    deadline = time.monotonic() + wait_seconds
+    while True:
+        if _get(health, timeout=2):
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(1)
+
+
+def warm(base_url: str, headers: dict, timeout: float = TIMEOUT_SECONDS) -> bool:
+    request = urllib.request.Request(f"{base_url}/warmup", data=b"{}", headers=headers, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status == 200
+    except (OSError, ValueError):
+        return False
+
+
+def prewarm(base_url: str, api_key: str, users: list, tool_valves: dict, concurrency: int = CONCURRENCY) -> dict:
+    """Warm each user's runner, `concurrency` at a time; returns counts."""
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="open-persona-prewarm") as pool:
+        results = list(
+            pool.map(
+                lambda user: warm(base_url, warmup_headers(user[0], tool_valves, user[1], api_key)),
+                users,
+            )
+        )
+    return {"warmed": sum(results), "failed": len(results) - sum(results)}
+
+
+def main() -> int:
+    if PREWARM_USERS <= 0:
+        return 0
+    base_url, api_key = sidecar_target()
+    if base_url is None:
+        return 0
+
+    db = get_database()
+    if not db.available():
+        return 0
+    try:
+        with db.read_transaction() as cur:
+            if not cur.has_table("user") or not cur.has_table("tool"):
+                return 0
+            users = recent_users(cur, PREWARM_USERS)
+            tool_valves = admin_valves(cur)
+    except Exception as e:
+        print(f"open-persona prewarm: skipped ({type(e).__name__})")
+        return 0
+    finally:
+        db.close()
+    if not users:
+        return 0
+
+    started = time.perf_counter()
+    if not wait_for_sidecar(base_url):
+        print("open-persona prewarm: sidecar not reachable, skipped")
+        return 0
+    counts = prewarm(base_url, api_key, users, tool_valves)
+    elapsed = time.perf_counter() - started
+    print(f"open-persona prewarm: warmed={counts['warmed']} failed={counts['failed']} in {elapsed:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
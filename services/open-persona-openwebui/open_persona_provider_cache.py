@@ -0,0 +1,147 @@
+"""Cached provider-key resolution for the patched Open WebUI openai router.
+
+Every sidecar-bound chat completion forwards the caller's provider keys. Resolving
+them takes two valve lookups (admin defaults + per-user overrides) and a sanitize
+pass over each value, so the sanitized triple is kept in a small per-user LRU with
+a TTL. The patched tools router calls `invalidate()` after every valve write so a
+key rotation takes effect on the next request.
+
+Each uvicorn worker has its own cache; the TTL bounds how long a worker that did
+not serve the valve write can keep forwarding the previous keys.
+
+Alongside the keys, each entry carries a keyed HMAC-SHA256 signature of the
+triple (`x-openpersona-provider-key-sig`, full hex digest). A sidecar configured
+with the same secret verifies it against the keys it receives and folds it into
+the runner key; a signature that does not match is rejected. The HMAC secret is
+`OPEN_PERSONA_KEY_SIGNATURE_SECRET`, falling back to Open WebUI's
+`WEBUI_SECRET_KEY`; with neither set no signature is sent.
+"""
+
+import hashlib
+import hmac
+import os
+import time
+from typing import Callable, NamedTuple, Optional
+
+import open_persona_metrics
+from open_persona_ttl_cache import TTLCache
+
+USER_TOOL_ID = "open_persona_provider_keys"
+ADMIN_TOOL_ID = "open_persona_provider_defaults"
+
+CACHE_MAX_USERS = int(os.environ.get("OPEN_PERSONA_KEY_CACHE_MAX_USERS", "1024"))
+CACHE_TTL_SECONDS = float(os.environ.get("OPEN_PERSONA_KEY_CACHE_TTL_SECONDS", "60"))
+
+MAX_KEY_LENGTH = 4096
+
+SIGNATURE_HEADER = "x-openpersona-provider-key-sig"
+SIGNATURE_SECRET = (
+    os.environ.get("OPEN_PERSONA_KEY_SIGNATURE_SECRET")
+    or os.environ.get("WEBUI_SECRET_KEY")
+    or os.environ.get("WEBUI_JWT_SECRET_KEY")
+    or ""
+)
+
+# (valve field, env fallback, sidecar header)
+KEY_FIELDS = (
+    ("openai_api_key", "OPEN_PERSONA_DEFAULT_OPENAI_API_KEY", "x-openpersona-openai-api-key"),
+    ("anthropic_api_key", "OPEN_PERSONA_DEFAULT_ANTHROPIC_API_KEY", "x-openpersona-anthropic-api-key"),
+    ("openrouter_api_key", "OPEN_PERSONA_DEFAULT_OPENROUTER_API_KEY", "x-openpersona-openrouter-api-key"),
+)
+
+
+class ProviderKeys(NamedTuple):
+    openai_api_key: str = ""
+    anthropic_api_key: str = ""
+    openrouter_api_key: str = ""
+    signature: str = ""
+
+    def headers(self) -> dict:
+        """Sidecar headers for the keys that are set, plus their signature."""
+        headers = {header: value for (_, _, header), value in zip(KEY_FIELDS, self) if value}
+        if self.signature:
+            headers[SIGNATURE_HEADER] = self.signature
+        return headers
+
+
+def sign_keys(keys, secret: str = SIGNATURE_SECRET) -> str:
+    """Keyed signature of a key triple; reveals nothing about the keys without the secret."""
+    if not secret:
+        return ""
+    material = "\x00".join(keys).encode()
+    return hmac.new(secret.encode(), material, hashlib.sha256).hexdigest()
+
+
+def clean_header_value(value) -> str:
+    """Strip CR/LF and other control characters so a key is safe to send as a header."""
+    s = str(value).replace("\n", "").replace("\r", "").strip()
+    if not s.isprintable():
+        s = "".join(ch for ch in s if ch.isprintable())
+    return s[:MAX_KEY_LENGTH]
+
+
+def _load_valves(user_id: str) -> tuple[dict, dict]:
+    from open_webui.models.tools import Tools
+
+    tool_valves = Tools.get_tool_valves_by_id(ADMIN_TOOL_ID) or {}
+    user_valves = Tools.get_user_valves_by_id_and_user_id(USER_TOOL_ID, user_id) or {}
+    return tool_valves, user_valves
+
+
+def _resolve(tool_valves: dict, user_valves: dict) -> ProviderKeys:
+    # Precedence: per-user override > admin default > deployment env default.
+    keys = [
+        clean_header_value(user_valves.get(field) or tool_valves.get(field) or os.environ.get(env, ""))
+        for field, env, _ in KEY_FIELDS
+    ]
+    return ProviderKeys(*keys, signature=sign_keys(keys))
+
+
+class ProviderKeyCache(TTLCache[ProviderKeys]):
+    """Thread-safe LRU + TTL cache of resolved provider keys, keyed by user id."""
+
+    def __init__(
+        self,
+        max_users: int = CACHE_MAX_USERS,
+        ttl_seconds: float = CACHE_TTL_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        super().__init__(max_users, ttl_seconds, clock)
+
+
+cache = ProviderKeyCache()
+open_persona_metrics.register_cache("provider_keys", cache.stats)
+
+
+def resolve_provider_keys(
+    user_id: str,
+    load: Callable[[str], tuple[dict, dict]] = _load_valves,
+    key_cache: Optional[ProviderKeyCache] = None,
+) -> ProviderKeys:
+    """Return the sanitized provider keys for `user_id`, loading valves on a miss."""
+    key_cache = key_cache or cache
+    user_id = str(user_id)
+    keys = key_cache.get(user_id)
+    if keys is not None:
+        return keys
+
+    generation = key_cache.generation()
+    keys = _resolve(*load(user_id))
+    key_cache.put(user_id, keys, generation)
+    return keys
+
+
+def invalidate(tool_id: str, user_id: Optional[str] = None, key_cache: Optional[ProviderKeyCache] = None) -> None:
+    """Drop cached keys after a valve write on `tool_id`.
+
+    Admin defaults apply to every user, so writing them clears the whole cache.
+    Per-user valve writes only drop that user's entry.
+    """
+    key_cache = key_cache or cache
+    if tool_id == ADMIN_TOOL_ID:
+        key_cache.clear()
+    elif tool_id == USER_TOOL_ID:
+        if user_id is None:
+            key_cache.clear()
+        else:
+            key_cache.invalidate_user(str(user_id))
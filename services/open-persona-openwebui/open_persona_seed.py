@@ -1,10 +1,30 @@
+import hashlib
 import json
 import os
 import sqlite3
+import threading
 import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Optional
+
+from open_persona_metrics import SEED_REPORT_PATH
 
 DB_PATH = os.environ.get("WEBUI_DB_PATH", "/app/backend/data/webui.db")
 
+# Open WebUI's own setting; when it points at Postgres we seed there instead of
+# the SQLite file (the same group/membership/tool upserts, native ON CONFLICT).
+DATABASE_URL = os.environ.get("DATABASE_URL", "")
+
+# Parallel uvicorn workers / restarts may seed at the same time; wait for the
+# write lock instead of failing with "database is locked".
+BUSY_TIMEOUT_MS = int(os.environ.get("OPEN_PERSONA_SEED_BUSY_TIMEOUT_MS", "10000"))
+
+DB_POOL_SIZE = int(os.environ.get("OPEN_PERSONA_DB_POOL_SIZE", "4"))
+
+# pg_advisory_xact_lock key serializing concurrent seeders on Postgres.
+SEED_LOCK_KEY = 0x6F70_7365_6564  # "opseed"
+
 ADMIN_GROUP_ID = "open_persona_admins"
 
 USER_TOOL_ID = "open_persona_provider_keys"
@@ -15,118 +35,350 @@ ADMIN_TOOL_ID = "open_persona_provider_defaults"
 ADMIN_TOOL_NAME = "Open Persona Provider Defaults"
 ADMIN_TOOL_PATH = "/app/backend/open_persona_provider_defaults_tool.py"
 
+# Stored in tool.meta so unchanged tools are not rewritten (a new updated_at makes
+# Open WebUI reload and re-exec the tool module).
+CONTENT_HASH_KEY = "open_persona_content_hash"
 
-def main() -> int:
-    if not os.path.exists(DB_PATH):
-        # DB might not exist on first boot until migrations run.
-        return 0
+SPECS = "[]"  # No callable tools.
 
-    if not os.path.exists(USER_TOOL_PATH) or not os.path.exists(ADMIN_TOOL_PATH):
-        return 0
+# Admin defaults tool: visible only to the admin group.
+ADMIN_ACCESS_CONTROL = json.dumps(
+    {
+        "read": {"group_ids": [ADMIN_GROUP_ID], "user_ids": []},
+        "write": {"group_ids": [ADMIN_GROUP_ID], "user_ids": []},
+    }
+)
+
+
+def content_hash(*parts) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(b"\x00" if part is None else str(part).encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+@contextmanager
+def phase(timings: dict, name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = (time.perf_counter() - start) * 1000.0
+
+
+class Cursor:
+    """DB-API cursor wrapper: statements are written with `?` placeholders."""
+
+    def __init__(self, cur, dialect: str):
+        self.cur = cur
+        self.dialect = dialect
+
+    def _sql(self, sql: str) -> str:
+        return sql.replace("?", "%s") if self.dialect == "postgres" else sql
+
+    def execute(self, sql: str, params=()):
+        self.cur.execute(self._sql(sql), params)
+        return self
+
+    def executemany(self, sql: str, rows):
+        self.cur.executemany(self._sql(sql), rows)
+        return self
+
+    def fetchone(self):
+        return self.cur.fetchone()
+
+    def fetchall(self):
+        return self.cur.fetchall()
+
+    @property
+    def rowcount(self) -> int:
+        return self.cur.rowcount
+
+    def has_table(self, name: str) -> bool:
+        if self.dialect == "postgres":
+            self.execute("SELECT to_regclass(?)", (f'"{name}"',))
+            return self.fetchone()[0] is not None
+        self.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,))
+        return self.fetchone() is not None
+
+
+class Database:
+    """Open WebUI database access shared by the Open Persona scripts.
+
+    SQLite (the default, `WEBUI_DB_PATH`) or Postgres when `DATABASE_URL` says so;
+    Postgres connections come from a small per-process pool.
+    """
+
+    def __init__(self, database_url: str = "", sqlite_path: str = DB_PATH):
+        url = database_url.strip()
+        scheme = url.split("://", 1)[0].split("+", 1)[0].lower() if "://" in url else ""
+        if scheme in ("postgres", "postgresql"):
+            self.dialect = "postgres"
+            # psycopg2 wants a plain libpq URI (no SQLAlchemy "+driver" suffix).
+            self.dsn = "postgresql://" + url.split("://", 1)[1]
+            self.sqlite_path = None
+        elif scheme == "sqlite" and url.split("://", 1)[1].startswith("/"):
+            self.dialect = "sqlite"
+            self.dsn = None
+            self.sqlite_path = url.split("://", 1)[1][1:] or sqlite_path
+        else:
+            self.dialect = "sqlite"
+            self.dsn = None
+            self.sqlite_path = sqlite_path
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def available(self) -> bool:
+        # The SQLite DB might not exist on first boot until migrations run.
+        return self.dialect == "postgres" or os.path.exists(self.sqlite_path)
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    from psycopg2.pool import ThreadedConnectionPool
+
+                    self._pool = ThreadedConnectionPool(1, max(1, DB_POOL_SIZE), self.dsn)
+        return self._pool
+
+    @contextmanager
+    def transaction(self, lock_key: Optional[int] = None, timings: Optional[dict] = None):
+        """One write transaction; with `lock_key`, concurrent holders are serialized.
+
+        With `timings`, the time spent waiting for the lock and committing is recorded.
+        """
+        timings = {} if timings is None else timings
+        if self.dialect == "postgres":
+            pool = self._get_pool()
+            conn = pool.getconn()
+            try:
+                conn.autocommit = False
+                cur = Cursor(conn.cursor(), "postgres")
+                with phase(timings, "lock"):
+                    cur.execute(f"SET LOCAL lock_timeout = '{BUSY_TIMEOUT_MS}ms'")
+                    if lock_key is not None:
+                        cur.execute("SELECT pg_advisory_xact_lock(?)", (lock_key,))
+                try:
+                    yield cur
+                    with phase(timings, "commit"):
+                        conn.commit()
+                except BaseException:
+                    conn.rollback()
+                    raise
+            finally:
+                pool.putconn(conn)
+            return
+
+        # Autocommit mode so the transaction is exactly the BEGIN IMMEDIATE below,
+        # which takes the write lock up front (waiting up to busy_timeout).
+        conn = sqlite3.connect(self.sqlite_path, timeout=BUSY_TIMEOUT_MS / 1000.0, isolation_level=None)
+        try:
+            conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+            with phase(timings, "lock"):
+                conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield Cursor(conn.cursor(), "sqlite")
+                with phase(timings, "commit"):
+                    conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
 
-    with open(USER_TOOL_PATH, "r", encoding="utf-8") as f:
-        user_content = f.read()
+    @contextmanager
+    def read_transaction(self):
+        """One read-only transaction, for queries that must not take the write lock.
 
-    with open(ADMIN_TOOL_PATH, "r", encoding="utf-8") as f:
-        admin_content = f.read()
+        On SQLite a deferred `BEGIN` only takes a shared lock while reading, so Open
+        WebUI's writers are not blocked the way `transaction()`'s `BEGIN IMMEDIATE`
+        blocks them. On Postgres the transaction is `READ ONLY`.
+        """
+        if self.dialect == "postgres":
+            pool = self._get_pool()
+            conn = pool.getconn()
+            try:
+                conn.autocommit = False
+                cur = Cursor(conn.cursor(), "postgres")
+                cur.execute("SET TRANSACTION READ ONLY")
+                try:
+                    yield cur
+                finally:
+                    conn.rollback()
+            finally:
+                pool.putconn(conn)
+            return
 
+        conn = sqlite3.connect(self.sqlite_path, timeout=BUSY_TIMEOUT_MS / 1000.0, isolation_level=None)
+        try:
+            conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+            conn.execute("PRAGMA query_only = ON")
+            conn.execute("BEGIN")
+            try:
+                yield Cursor(conn.cursor(), "sqlite")
+            finally:
+                conn.execute("ROLLBACK")
+        finally:
+            conn.close()
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.closeall()
+            self._pool = None
+
+
+@lru_cache(maxsize=None)
+def get_database(database_url: str = DATABASE_URL, sqlite_path: str = DB_PATH) -> Database:
+    return Database(database_url, sqlite_path)
+
+
+def ensure_admin_group(cur: Cursor, now: int) -> bool:
+    cur.execute(
+        'INSERT INTO "group" (id, user_id, name, description, data, meta, permissions, created_at, updated_at) '
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO NOTHING",
+        (
+            ADMIN_GROUP_ID,
+            "system",
+            "Open Persona Admins",
+            "Admins allowed to manage Open Persona defaults.",
+            json.dumps({}),
+            json.dumps({}),
+            json.dumps({}),
+            now,
+            now,
+        ),
+    )
+    return cur.rowcount > 0
+
+
+def sync_admin_members(cur: Cursor, now: int) -> int:
+    """Add admin-role users missing from the admin group; returns how many were added.
+
+    A single set-difference INSERT ... SELECT. Membership is only ever added, so
+    members granted through the UI (with their own row ids) are kept.
+    """
+    cur.execute(
+        "INSERT INTO group_member (id, group_id, user_id, created_at, updated_at) "
+        "SELECT ? || ':' || u.id, ?, u.id, ?, ? FROM \"user\" u "
+        "WHERE u.role = 'admin' AND NOT EXISTS ("
+        "SELECT 1 FROM group_member m WHERE m.group_id = ? AND m.user_id = u.id"
+        ") ON CONFLICT (id) DO NOTHING",
+        (ADMIN_GROUP_ID, ADMIN_GROUP_ID, now, now, ADMIN_GROUP_ID),
+    )
+    return max(cur.rowcount, 0)
+
+
+def upsert_tool(cur: Cursor, tool_id: str, name: str, content: str, description: str, access_control, now: int) -> str:
+    """Insert or update a tool row; returns "inserted", "updated" or "unchanged"."""
+    digest = content_hash(content, SPECS, description, access_control)
+    meta = json.dumps({"description": description, CONTENT_HASH_KEY: digest})
+
+    cur.execute("SELECT meta FROM tool WHERE id = ?", (tool_id,))
+    row = cur.fetchone()
+    if row is not None:
+        try:
+            existing = json.loads(row[0]) if isinstance(row[0], str) else (row[0] or {})
+        except ValueError:
+            existing = {}
+        if isinstance(existing, dict) and existing.get(CONTENT_HASH_KEY) == digest:
+            return "unchanged"
+
+    cur.execute(
+        "INSERT INTO tool (id, user_id, name, content, specs, meta, created_at, updated_at, valves, access_control) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (id) DO UPDATE SET content = excluded.content, meta = excluded.meta, specs = excluded.specs, "
+        "access_control = excluded.access_control, updated_at = excluded.updated_at",
+        (tool_id, "system", name, content, SPECS, meta, now, now, json.dumps({}), access_control),
+    )
+    return "inserted" if row is None else "updated"
+
+
+def seed(cur: Cursor, user_content: str, admin_content: str, timings: dict) -> dict:
+    """Run every seeding step on `cur` (inside the caller's transaction)."""
     now = int(time.time())
-    specs = "[]"  # No callable tools.
+    summary = {}
 
-    user_meta = json.dumps({"description": "Per-user provider keys for Open Persona"})
-    admin_meta = json.dumps({"description": "Admin defaults for Open Persona provider keys"})
+    # Ensure an admin group exists for restricting defaults UI.
+    with phase(timings, "group"):
+        summary["group_created"] = ensure_admin_group(cur, now)
 
-    conn = sqlite3.connect(DB_PATH)
-    try:
-        cur = conn.cursor()
-
-        # Ensure an admin group exists for restricting defaults UI.
-        cur.execute("SELECT 1 FROM 'group' WHERE id = ?", (ADMIN_GROUP_ID,))
-        if not cur.fetchone():
-            cur.execute(
-                "INSERT INTO 'group' (id, user_id, name, description, data, meta, permissions, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                (
-                    ADMIN_GROUP_ID,
-                    "system",
-                    "Open Persona Admins",
-                    "Admins allowed to manage Open Persona defaults.",
-                    json.dumps({}),
-                    json.dumps({}),
-                    json.dumps({}),
-                    now,
-                    now,
-                ),
-            )
-
-        # Ensure all admin-role users are members.
-        cur.execute("SELECT id FROM user WHERE role = 'admin'")
-        admin_user_ids = [r[0] for r in cur.fetchall()]
-        for uid in admin_user_ids:
-            member_id = f"{ADMIN_GROUP_ID}:{uid}"
-            cur.execute(
-                "INSERT OR IGNORE INTO group_member (id, group_id, user_id, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
-                (member_id, ADMIN_GROUP_ID, uid, now, now),
-            )
+    # Ensure all admin-role users are members.
+    with phase(timings, "members"):
+        summary["members_added"] = sync_admin_members(cur, now)
 
+    with phase(timings, "tools"):
         # Public per-user keys tool: readable by all (access_control NULL), user valves store per-user keys.
-        cur.execute("SELECT 1 FROM tool WHERE id = ?", (USER_TOOL_ID,))
-        if cur.fetchone():
-            cur.execute(
-                "UPDATE tool SET content = ?, meta = ?, specs = ?, updated_at = ? WHERE id = ?",
-                (user_content, user_meta, specs, now, USER_TOOL_ID),
-            )
-        else:
-            cur.execute(
-                "INSERT INTO tool (id, user_id, name, content, specs, meta, created_at, updated_at, valves, access_control) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                (
-                    USER_TOOL_ID,
-                    "system",
-                    USER_TOOL_NAME,
-                    user_content,
-                    specs,
-                    user_meta,
-                    now,
-                    now,
-                    json.dumps({}),
-                    None,
-                ),
-            )
-
-        # Admin defaults tool: visible only to the admin group.
-        admin_access_control = json.dumps(
-            {
-                "read": {"group_ids": [ADMIN_GROUP_ID], "user_ids": []},
-                "write": {"group_ids": [ADMIN_GROUP_ID], "user_ids": []},
-            }
+        summary[USER_TOOL_ID] = upsert_tool(
+            cur, USER_TOOL_ID, USER_TOOL_NAME, user_content, "Per-user provider keys for Open Persona", None, now
         )
+        summary[ADMIN_TOOL_ID] = upsert_tool(
+            cur,
+            ADMIN_TOOL_ID,
+            ADMIN_TOOL_NAME,
+            admin_content,
+            "Admin defaults for Open Persona provider keys",
+            ADMIN_ACCESS_CONTROL,
+            now,
+        )
+    return summary
 
-        cur.execute("SELECT 1 FROM tool WHERE id = ?", (ADMIN_TOOL_ID,))
-        if cur.fetchone():
-            cur.execute(
-                "UPDATE tool SET content = ?, meta = ?, specs = ?, access_control = ?, updated_at = ? WHERE id = ?",
-                (admin_content, admin_meta, specs, admin_access_control, now, ADMIN_TOOL_ID),
-            )
-        else:
-            cur.execute(
-                "INSERT INTO tool (id, user_id, name, content, specs, meta, created_at, updated_at, valves, access_control) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                (
-                    ADMIN_TOOL_ID,
-                    "system",
-                    ADMIN_TOOL_NAME,
-                    admin_content,
-                    specs,
-                    admin_meta,
-                    now,
-                    now,
-                    json.dumps({}),
-                    admin_access_control,
-                ),
-            )
-
-        conn.commit()
+
+def format_report(summary: dict, timings: dict) -> str:
+    phases = " ".join(f"{name}={ms:.1f}ms" for name, ms in timings.items())
+    return (
+        f"open-persona seed: {phases} | "
+        f"members_added={summary.get('members_added', 0)} "
+        f"{USER_TOOL_ID}={summary.get(USER_TOOL_ID)} {ADMIN_TOOL_ID}={summary.get(ADMIN_TOOL_ID)}"
+    )
+
+
+def write_report(summary: dict, timings: dict, dialect: str, path: str = SEED_REPORT_PATH) -> None:
+    """Persist the run's timings for the metrics route (best effort)."""
+    report = {"summary": summary, "timings": timings, "dialect": dialect, "finished_at": time.time()}
+    try:
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(report, f)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def main() -> int:
+    db = get_database()
+    if not db.available():
         return 0
+
+    if not os.path.exists(USER_TOOL_PATH) or not os.path.exists(ADMIN_TOOL_PATH):
+        return 0
+
+    timings = {}
+    started = time.perf_counter()
+
+    with phase(timings, "read"):
+        with open(USER_TOOL_PATH, "r", encoding="utf-8") as f:
+            user_content = f.read()
+
+        with open(ADMIN_TOOL_PATH, "r", encoding="utf-8") as f:
+            admin_content = f.read()
+
+    try:
+        with db.transaction(lock_key=SEED_LOCK_KEY, timings=timings) as cur:
+            if not cur.has_table("tool"):
+                # Migrations have not run yet (first boot); seed on the next start.
+                summary = None
+            else:
+                summary = seed(cur, user_content, admin_content, timings)
     finally:
-        conn.close()
+        db.close()
+
+    if summary is None:
+        return 0
+    timings["total"] = (time.perf_counter() - started) * 1000.0
+    print(f"{format_report(summary, timings)} ({db.dialect})")
+    write_report(summary, timings, db.dialect)
+    return 0
 
 
 if __name__ == "__main__":
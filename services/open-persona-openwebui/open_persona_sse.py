@@ -0,0 +1,115 @@
+"""SSE pass-through for streamed completions from the sidecar.
+
+Upstream relays a streamed completion line by line: `StreamReader` iteration
+awaits `readline()` per line (or, with CHAT_STREAM_RESPONSE_CHUNK_MAX_BUFFER_SIZE
+set, re-splits every chunk), so each event reaches Open WebUI's chat middleware
+and the client as two items, its `data:` line and a blank separator.
+
+For allowlisted sidecars the patched openai router uses `relay()` instead. It
+reads whatever bytes have arrived and yields each complete event
+(`data: ...` up to its blank line) as one item, without decoding it. Any of the
+SSE line endings (`\\n`, `\\r\\n`, `\\r`) can end the blank line, and a separator
+split across reads is joined before it is looked for. Reads that hold exactly
+whole events are forwarded as-is. Only event boundaries are looked at; parsing
+the deltas to persist the message is left to Open WebUI's middleware, which
+accepts a whole event per item just as it accepts a line.
+
+The sidecar emits single-line `data:` events; a block with several `data:`
+lines is split back into lines so the middleware still sees one JSON document
+per item.
+
+`OPEN_PERSONA_SSE_PASSTHROUGH=off` restores upstream's relay.
+"""
+
+import os
+import re
+from typing import AsyncIterator, Optional
+
+import open_persona_forwarding
+
+PASSTHROUGH = os.environ.get("OPEN_PERSONA_SSE_PASSTHROUGH", "on").strip().lower() not in ("0", "off", "false", "no")
+
+EVENT_SEPARATOR = b"\n\n"
+# Two line endings in a row (`\n`, `\r\n` or a lone `\r` each), i.e. a blank line.
+EVENT_END = re.compile(rb"(?:\r\n|\r(?!\n)|\n)(?:\r\n|\r|\n)")
+# Longest separator (`\r\n\r\n`) minus one byte: all of it a read can end on.
+SEPARATOR_TAIL = 3
+DATA_PREFIX = b"data:"
+
+# Same knob as upstream's stream_chunks_handler: oversized events become `data: {}`.
+_max = os.environ.get("CHAT_STREAM_RESPONSE_CHUNK_MAX_BUFFER_SIZE", "").strip()
+MAX_EVENT_SIZE: Optional[int] = int(_max) if _max.isdigit() and int(_max) > 0 else None
+
+OVERSIZED_EVENT = b"data: {}\n\n"
+
+
+def _event_end(data: bytes, start: int, has_cr: bool) -> int:
+    """Index just past the first event separator in `data[start:]`, or -1."""
+    if not has_cr:
+        end = data.find(EVENT_SEPARATOR, start)
+        return end + len(EVENT_SEPARATOR) if end >= 0 else -1
+    match = EVENT_END.search(data, start)
+    if match is None:
+        return -1
+    end = match.end()
+    if end == len(data) and data.endswith(b"\r"):
+        # `\r\r` / `\n\r` may continue as `\r\r\n` / `\n\r\n` in the next read.
+        return -1
+    return end
+
+
+def _split(event: bytes) -> list:
+    if event.count(DATA_PREFIX) <= 1:
+        return [event]
+    return [line + b"\n" for line in event.splitlines() if line] + [b"\n"]
+
+
+async def relay(chunks: AsyncIterator[bytes], max_event_size: Optional[int] = MAX_EVENT_SIZE):
+    """Yield complete SSE events from raw byte `chunks` (e.g. `response.content.iter_any()`)."""
+    pending = b""
+    skipping = False
+    async for data in chunks:
+        if not data:
+            continue
+        if pending:
+            data = pending + data
+            pending = b""
+        start = 0
+        has_cr = b"\r" in data
+        end = _event_end(data, 0, has_cr)
+        single = end == len(data)
+        if single and not skipping and (max_event_size is None or len(data) <= max_event_size):
+            # Fast path: the read is exactly one event; forward the same bytes object.
+            for item in _split(data):
+                yield item
+            continue
+        while end >= 0:
+            event = data[start:end]
+            if skipping:
+                skipping = False
+            elif max_event_size is not None and len(event) > max_event_size:
+                yield OVERSIZED_EVENT
+            else:
+                for item in _split(event):
+                    yield item
+            start = end
+            end = _event_end(data, start, has_cr)
+        pending = data[start:]
+        if not skipping and max_event_size is not None and len(pending) > max_event_size:
+            # Drop the rest of an oversized event instead of buffering it.
+            yield OVERSIZED_EVENT
+            skipping = True
+        if skipping:
+            # Keep the bytes a separator split across reads may have started with.
+            pending = pending[-SEPARATOR_TAIL:]
+    if pending and not skipping:
+        yield pending if pending.endswith((b"\n", b"\r")) else pending + EVENT_SEPARATOR
+
+
+def use_passthrough(url: str) -> bool:
+    return PASSTHROUGH and open_persona_forwarding.is_sidecar_url(url)
+
+
+def sidecar_stream(stream):
+    """`relay()` over an aiohttp `StreamReader` (`r.content` in the router)."""
+    return relay(stream.iter_any())
@@ -0,0 +1,160 @@
+"""Startup timing for the patched Open WebUI image.
+
+Each uvicorn worker records where its cold start went, so a regression shows up
+as a phase that grew:
+
+- `start.sh` exports wall-clock marks of its own phases in
+  `OPEN_PERSONA_STARTUP_MARKS` (`name=epoch;name=epoch;...`, last one `exec`).
+- The main.py patch calls `mark("main")` before main.py's own imports,
+  `install_import_timer()` to time the import of each router we patch,
+  `mark("lifespan")` when the app's lifespan starts and `ready()` just before it
+  yields (the app answers `/health` from then on).
+
+Phases (seconds): the script's own (`deps`, `secret_key`, `exec`), then
+`interpreter` (exec to main.py; Python, uvicorn and the `open_webui` package),
+`import` (main.py, including every router), `lifespan` (startup tasks) and
+`healthy` (script start, or main.py without the script, to ready). Import times
+are cumulative (they include whatever each router imports first).
+
+`ready()` logs one line and writes the report to `OPEN_PERSONA_STARTUP_REPORT_PATH`
+(default `$DATA_DIR/open_persona_startup_report.json`; the last worker to start
+wins). The metrics route serves the serving worker's numbers.
+"""
+
+import importlib.abc
+import importlib.util
+import json
+import logging
+import os
+import sys
+import time
+from typing import Optional
+
+import open_persona_metrics
+
+log = logging.getLogger(__name__)
+
+REPORT_PATH = os.environ.get(
+    "OPEN_PERSONA_STARTUP_REPORT_PATH",
+    os.path.join(os.environ.get("DATA_DIR", "/app/backend/data"), "open_persona_startup_report.json"),
+)
+
+# Modules rewritten by patch_*.py besides main.py (timed by install_import_timer).
+PATCHED_MODULES = ("open_webui.routers.openai", "open_webui.routers.tools", "open_webui.routers.groups")
+
+# name -> wall-clock time, in the order they were recorded.
+marks: dict = {}
+import_seconds: dict = {}
+
+
+def parse_script_marks(value: str) -> list:
+    """[(name, epoch)] from `OPEN_PERSONA_STARTUP_MARKS`; malformed entries are skipped."""
+    parsed = []
+    for item in (value or "").split(";"):
+        name, _, stamp = item.partition("=")
+        try:
+            # bash's EPOCHREALTIME uses the locale's decimal separator.
+            parsed.append((name.strip(), float(stamp.strip().replace(",", "."))))
+        except ValueError:
+            continue
+    return [(name, stamp) for name, stamp in parsed if name]
+
+
+def mark(name: str) -> None:
+    marks[name] = time.time()
+
+
+class _TimedLoader(importlib.abc.Loader):
+    def __init__(self, loader, name: str):
+        self._loader = loader
+        self._name = name
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            import_seconds[self._name] = time.perf_counter() - started
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    def __init__(self, names):
+        self.pending = set(names)
+
+    def find_spec(self, name, path=None, target=None):
+        if name not in self.pending:
+            return None
+        self.pending.discard(name)
+        if not self.pending:
+            sys.meta_path.remove(self)
+        spec = importlib.util.find_spec(name)
+        if spec is not None and spec.loader is not None:
+            spec.loader = _TimedLoader(spec.loader, name)
+        return spec
+
+
+def install_import_timer(names=PATCHED_MODULES) -> None:
+    """Time the first import of `names` (modules not imported yet)."""
+    pending = [name for name in names if name not in sys.modules]
+    if pending:
+        sys.meta_path.insert(0, _ImportTimer(pending))
+
+
+def report(environ=os.environ) -> dict:
+    script = parse_script_marks(environ.get("OPEN_PERSONA_STARTUP_MARKS", ""))
+    phases = {}
+    for (_, previous), (name, stamp) in zip(script, script[1:]):
+        phases[name] = stamp - previous
+    timeline = ([("exec", script[-1][1])] if script else []) + [
+        (name, marks[name]) for name in ("main", "lifespan", "ready") if name in marks
+    ]
+    labels = {"main": "interpreter", "lifespan": "import", "ready": "lifespan"}
+    for (_, previous), (name, stamp) in zip(timeline, timeline[1:]):
+        phases[labels[name]] = stamp - previous
+    start = script[0][1] if script else marks.get("main")
+    if start is not None and "ready" in marks:
+        phases["healthy"] = marks["ready"] - start
+    return {
+        "pid": os.getpid(),
+        "phases": {name: round(seconds, 6) for name, seconds in phases.items()},
+        "imports": {name: round(seconds, 6) for name, seconds in import_seconds.items()},
+        "finished_at": marks.get("ready"),
+    }
+
+
+def format_report(data: dict) -> str:
+    phases = " ".join(f"{name}={seconds * 1000.0:.0f}ms" for name, seconds in data["phases"].items())
+    imports = " ".join(f"{name.rsplit('.', 1)[-1]}={s * 1000.0:.0f}ms" for name, s in data["imports"].items())
+    return f"open-persona startup (pid {data['pid']}): {phases} | imports: {imports or 'n/a'}"
+
+
+def write_report(data: dict, path: str = REPORT_PATH) -> None:
+    try:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def ready(path: Optional[str] = None) -> dict:
+    """Record that the app is about to serve; log and persist the report."""
+    mark("ready")
+    data = report()
+    log.info(format_report(data))
+    write_report(data, path or REPORT_PATH)
+    return data
+
+
+def _stats() -> dict:
+    return report() if "ready" in marks else {"phases": {}, "imports": {}}
+
+
+open_persona_metrics.register_startup(_stats)
@@ -0,0 +1,214 @@
+"""W3C trace-context propagation for sidecar-bound chat completions.
+
+The patched openai router wraps the Open Persona header-building stage in a span
+and sends `traceparent`/`tracestate` to the sidecar next to the `x-openpersona-*`
+headers; the sidecar passes them on to the opencode runner. One chat turn then
+shows up as one trace across Open WebUI, the sidecar and the runner.
+
+The parent context is taken from the incoming browser/proxy request's
+`traceparent`, else from Open WebUI's OpenTelemetry span when ENABLE_OTEL is on,
+else a new trace is started.
+
+`OPEN_PERSONA_TRACING` selects the mode:
+
+- unset/`off`: disabled; `span()` returns a shared no-op context (no ids, no
+  headers), so the forwarding path pays one attribute check.
+- `propagate`: headers only, nothing exported.
+- `stdout` / `file`: also export finished spans as OTLP/JSON lines (one
+  `resourceSpans` document per span) to stdout or `OPEN_PERSONA_TRACE_FILE`.
+  Stdlib only; the file can be replayed into any OTLP/HTTP collector.
+"""
+
+import contextlib
+import json
+import logging
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from typing import Mapping, Optional
+
+log = logging.getLogger(__name__)
+
+MODE = os.environ.get("OPEN_PERSONA_TRACING", "").strip().lower()
+ENABLED = MODE not in ("", "0", "off", "false", "no")
+TRACE_FILE = os.environ.get(
+    "OPEN_PERSONA_TRACE_FILE",
+    os.path.join(os.environ.get("DATA_DIR", "/app/backend/data"), "open_persona_traces.jsonl"),
+)
+SERVICE_NAME = "open-persona-openwebui"
+
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+INVALID_TRACE_ID = "0" * 32
+INVALID_SPAN_ID = "0" * 16
+# OTLP SpanKind: the header-building stage runs inside Open WebUI, ahead of the
+# HTTP client call to the sidecar.
+SPAN_KIND_INTERNAL = 1
+
+_DISABLED = contextlib.nullcontext()
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[tuple]:
+    """`(trace_id, span_id, flags)` from a version-00 `traceparent`, or None if invalid."""
+    if not value:
+        return None
+    match = TRACEPARENT_RE.match(value.strip().lower())
+    if not match:
+        return None
+    trace_id, span_id, flags = match.groups()
+    if trace_id == INVALID_TRACE_ID or span_id == INVALID_SPAN_ID:
+        return None
+    return trace_id, span_id, int(flags, 16)
+
+
+def _header(headers: Optional[Mapping], name: str) -> Optional[str]:
+    if not headers:
+        return None
+    value = headers.get(name)
+    if value is None:
+        # Plain dicts are case-sensitive; Starlette's Headers are not.
+        for key, candidate in headers.items():
+            if key.lower() == name:
+                return candidate
+    return value
+
+
+def _otel_parent() -> Optional[tuple]:
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        return None
+    ctx = trace.get_current_span().get_span_context()
+    if not ctx.is_valid:
+        return None
+    return f"{ctx.trace_id:032x}", f"{ctx.span_id:016x}", int(ctx.trace_flags)
+
+
+class Span:
+    def __init__(self, name: str, parent: Optional[tuple] = None, tracestate: Optional[str] = None):
+        if parent is None:
+            self.trace_id = secrets.token_hex(16)
+            self.parent_span_id = None
+            self.flags = 1
+        else:
+            self.trace_id, self.parent_span_id, self.flags = parent
+        self.span_id = secrets.token_hex(8)
+        self.name = name
+        self.tracestate = tracestate
+        self.attributes: dict = {}
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+
+    @property
+    def sampled(self) -> bool:
+        return bool(self.flags & 1)
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{self.flags:02x}"
+
+    def headers(self) -> dict:
+        """Headers that make this span the parent of the sidecar's work."""
+        headers = {"traceparent": self.traceparent()}
+        if self.tracestate:
+            headers["tracestate"] = self.tracestate
+        return headers
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": SPAN_KIND_INTERNAL,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in sorted(self.attributes.items())],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 0},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        if self.tracestate:
+            span["traceState"] = self.tracestate
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                    "scopeSpans": [{"scope": {"name": __name__}, "spans": [span]}],
+                }
+            ]
+        }
+
+
+def _otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class JsonLinesExporter:
+    """Append finished spans as OTLP/JSON lines to a stream or file (thread-safe)."""
+
+    def __init__(self, mode: str = MODE, path: str = TRACE_FILE):
+        self.mode = mode
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        if self.mode not in ("stdout", "file") or not span.sampled:
+            return
+        line = json.dumps(span.to_otlp(), separators=(",", ":")) + "\n"
+        try:
+            with self._lock:
+                if self.mode == "stdout":
+                    sys.stdout.write(line)
+                    sys.stdout.flush()
+                else:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(line)
+        except OSError:
+            log.warning("open-persona: failed to export trace span", exc_info=True)
+
+
+exporter = JsonLinesExporter()
+
+
+@contextlib.contextmanager
+def _traced(name: str, parent_headers: Optional[Mapping], span_exporter: JsonLinesExporter):
+    parent = parse_traceparent(_header(parent_headers, "traceparent"))
+    tracestate = _header(parent_headers, "tracestate") if parent else None
+    if parent is None:
+        parent = _otel_parent()
+    span = Span(name, parent, tracestate)
+    try:
+        yield span
+    except BaseException as exc:
+        span.error = type(exc).__name__
+        raise
+    finally:
+        span.end_ns = time.time_ns()
+        span_exporter.export(span)
+
+
+def span(
+    name: str,
+    parent_headers: Optional[Mapping] = None,
+    enabled: Optional[bool] = None,
+    span_exporter: Optional[JsonLinesExporter] = None,
+):
+    """Context manager yielding a `Span` (or None when tracing is disabled).
+
+    `parent_headers` are the incoming request headers; their `traceparent` (and
+    `tracestate`) become the parent of the new span.
+    """
+    if not (ENABLED if enabled is None else enabled):
+        return _DISABLED
+    return _traced(name, parent_headers, span_exporter or exporter)
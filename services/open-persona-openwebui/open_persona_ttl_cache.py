@@ -0,0 +1,83 @@
+"""Per-user LRU + TTL cache shared by the Open Persona lookup caches.
+
+`open_persona_provider_cache.ProviderKeyCache` and
+`open_persona_access.GroupMembershipCache` both keep one entry per user id for a
+short TTL and drop entries when Open WebUI writes the underlying rows. Each
+invalidation bumps a generation counter: a lookup reads `generation()` before
+loading and passes it to `put()`, so a load that started before a write cannot
+store what it read from before the write.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Optional, TypeVar
+
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    """Thread-safe LRU + TTL cache keyed by user id."""
+
+    def __init__(self, max_users: int, ttl_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple[float, V]]" = OrderedDict()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id: str) -> Optional[V]:
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+
+    def generation(self) -> int:
+        with self._lock:
+            return self._generation
+
+    def put(self, user_id: str, value: V, generation: Optional[int] = None) -> V:
+        """Store `value` unless caching is disabled or an invalidation ran since `generation`."""
+        if self.max_users <= 0 or self.ttl_seconds <= 0:
+            return value
+        expires = self._clock() + self.ttl_seconds
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return value
+            self._entries[user_id] = (expires, value)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate_user(self, user_id: str) -> None:
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "size": len(self._entries),
+            }
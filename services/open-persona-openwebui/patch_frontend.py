@@ -1,15 +1,37 @@
+import os
 import pathlib
 
-TARGET_ROOT = pathlib.Path("/app")
+# Only the SPA entry page is patched: Open WebUI serves every route through it.
+FRONTEND_BUILD_DIR = pathlib.Path(os.environ.get("FRONTEND_BUILD_DIR", "/app/build"))
+TARGET = FRONTEND_BUILD_DIR / "index.html"
+
+BODY_CLOSE = "</body>"
+
+# Upstream snippets this patch relies on (checked and reported by patch_openwebui.py).
+ANCHORS = {"</body>": BODY_CLOSE}
 
 # JavaScript snippet to inject
-INJECT_SNIPPET = """
+INJECT_SNIPPET = r"""
 <script>
 (function(){
-  // Injected by open-persona overlay: show model used for responses
+  // Injected by open-persona overlay: show model used for responses.
+  // The sidecar reports its resolved models in the x-openpersona-model-details
+  // response header (base64 JSON), which Open WebUI passes through on streamed
+  // completions. Only that header is read; bodies are never cloned or parsed,
+  // except a completion stream that arrives without it: that one is cloned and
+  // the first events of the clone are scanned. The page keeps the original
+  // Response (url, redirected, type and all).
+  var HEADER = 'x-openpersona-model-details';
+  var COMPLETION_PATH = /\/(api|openai)(\/v1)?\/chat\/completions(\?|$)/;
+  var MAX_SCAN_BYTES = 65536;
+
+  var pending = null;
+  var frame = 0;
+
   function ensureBadge(){
-    if (document.getElementById('openpersona-model-badge')) return;
-    const badge = document.createElement('div');
+    var badge = document.getElementById('openpersona-model-badge');
+    if (badge) return badge;
+    badge = document.createElement('div');
     badge.id = 'openpersona-model-badge';
     badge.style.position = 'fixed';
     badge.style.right = '12px';
@@ -22,74 +44,97 @@ INJECT_SNIPPET = """
     badge.style.zIndex = 999999;
     badge.innerText = 'Model: unknown';
     document.body.appendChild(badge);
+    return badge;
+  }
+
+  function render(){
+    frame = 0;
+    var md = pending;
+    pending = null;
+    if (!md || !document.body) return;
+    var model = md.model || md.model_id || 'unknown';
+    var small = md.small_model ? (' | sub: ' + md.small_model) : '';
+    var src = md.resolved_from ? (' (' + md.resolved_from + ')') : '';
+    var text = 'Model: ' + model + small + src;
+    var badge = ensureBadge();
+    if (badge.innerText !== text) badge.innerText = text;
   }
 
+  // Coalesce updates: at most one DOM write per animation frame.
   function updateBadge(md){
-    ensureBadge();
-    const badge = document.getElementById('openpersona-model-badge');
-    const model = md?.model ?? md?.model_id ?? 'unknown';
-    const small = md?.small_model ? (' | sub: '+md.small_model) : '';
-    const src = md?.resolved_from ? (' ('+md.resolved_from+')') : '';
-    badge.innerText = 'Model: ' + model + small + src;
+    pending = md;
+    if (!frame) frame = requestAnimationFrame(render);
+  }
+
+  function decodeHeader(value){
+    var bytes = Uint8Array.from(atob(value), function(c){ return c.charCodeAt(0); });
+    return JSON.parse(new TextDecoder().decode(bytes));
+  }
+
+  // Read SSE events until one carries model_details (or MAX_SCAN_BYTES), then stop.
+  async function scanStream(body){
+    var reader = body.getReader();
+    var decoder = new TextDecoder();
+    var buffer = '';
+    var seen = 0;
+    try {
+      while (seen < MAX_SCAN_BYTES) {
+        var chunk = await reader.read();
+        if (chunk.done) return;
+        seen += chunk.value.byteLength;
+        buffer += decoder.decode(chunk.value, { stream: true });
+        var lines = buffer.split('\n');
+        buffer = lines.pop();
+        for (var i = 0; i < lines.length; i++) {
+          var line = lines[i];
+          if (line.indexOf('data:') !== 0 || line.indexOf('model_details') < 0) continue;
+          var data = JSON.parse(line.slice(5));
+          if (data && data.model_details) { updateBadge(data.model_details); return; }
+        }
+      }
+    } catch (e) { /* ignore */ }
+    finally { reader.cancel().catch(function(){}); }
   }
 
-  // Monkeypatch fetch to inspect JSON responses for model_details
-  const _fetch = window.fetch;
-  window.fetch = function(){
-    return _fetch.apply(this, arguments).then(async (resp)=>{
-      try{
-        const clone = resp.clone();
-        const ct = clone.headers.get('content-type') || '';
-        if (ct.includes('application/json')){
-          const json = await clone.json();
-          const md = json?.model_details ?? json?.modelDetails ?? null;
-          if (md) updateBadge(md);
+  var _fetch = window.fetch;
+  window.fetch = function(input){
+    // A string, a URL (href) or a Request (url).
+    var url = typeof input === 'string' ? input : (input && (input.href || input.url)) || '';
+    return _fetch.apply(this, arguments).then(function(resp){
+      try {
+        var header = resp.headers.get(HEADER);
+        if (header) {
+          updateBadge(decodeHeader(header));
+          return resp;
+        }
+        var ct = resp.headers.get('content-type') || '';
+        if (resp.body && ct.indexOf('text/event-stream') >= 0 && COMPLETION_PATH.test(url)) {
+          scanStream(resp.clone().body);
         }
-      } catch(e){ /* ignore */ }
+      } catch (e) { /* ignore */ }
       return resp;
     });
   };
-
-  // Also try to monitor EventSource SSE data if used by the UI
-  const _EventSource = window.EventSource;
-  if(_EventSource){
-    window.EventSource = function(url, opts){
-      const es = new _EventSource(url, opts);
-      es.addEventListener('message', function(evt){
-        try{
-          const data = JSON.parse(evt.data || '{}');
-          const md = data?.model_details ?? data?.modelDetails;
-          if(md) updateBadge(md);
-        }catch(e){}
-      });
-      return es;
-    };
-    window.EventSource.prototype = _EventSource.prototype;
-  }
-
 })();
 </script>
 """
 
-# Find HTML files and inject snippet before </body>
-
-html_files = list(TARGET_ROOT.rglob('*.html'))
-if not html_files:
-    print('no html files found in /app')
-    raise SystemExit(1)
-
-injected = 0
-for f in html_files:
-    try:
-        text = f.read_text(encoding='utf-8')
-        if 'openpersona-model-badge' in text:
-            continue
-        if '</body>' in text.lower():
-            new = text.replace('</body>', INJECT_SNIPPET + '\n</body>')
-            f.write_text(new, encoding='utf-8')
-            injected += 1
-    except Exception as e:
-        # ignore files we cannot read
-        continue
-
-print(f'injected into {injected} html files')
+
+def patch(text: str) -> str:
+    if "openpersona-model-badge" in text:
+        return text
+    idx = text.rfind(BODY_CLOSE)
+    if idx < 0:
+        raise SystemExit("Patch failed: </body> not found in SPA entry HTML")
+    return text[:idx] + INJECT_SNIPPET + "\n" + text[idx:]
+
+
+def main() -> None:
+    if not TARGET.exists():
+        raise SystemExit(f"SPA entry HTML not found: {TARGET}")
+    TARGET.write_text(patch(TARGET.read_text(encoding="utf-8")), encoding="utf-8")
+    print(f"Injected model badge into {TARGET}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import os
+import pathlib
+import re
+
+TARGET = pathlib.Path(os.environ.get("OPENWEBUI_GROUPS_ROUTER", "/app/backend/open_webui/routers/groups.py"))
+
+ERROR_MESSAGES_IMPORT = "from open_webui.constants import ERROR_MESSAGES\n"
+
+# Open Persona: drop cached group memberships whenever a group is written.
+#
+# The patched tools router caches each user's group ids (and valves access
+# decisions) in open_persona_access. Invalidating right after the group API writes
+# makes e.g. adding an admin to open_persona_admins take effect immediately on this
+# worker; other workers and non-API changes (OAuth/SCIM sync) follow within the TTL.
+WRITES = (
+    ("update_group_by_id", "open_persona_access.invalidate_group(id)"),
+    ("add_users_to_group", "open_persona_access.invalidate_group(id, form_data.user_ids)"),
+    ("remove_users_from_group", "open_persona_access.invalidate_group(id, form_data.user_ids)"),
+    ("delete_group_by_id", "open_persona_access.invalidate_group(id)"),
+)
+
+
+def write_pattern(method: str) -> re.Pattern:
+    return re.compile(rf"^( +)\w+ = Groups\.{method}\(.*\)\n", re.M)
+
+
+# Upstream snippets this patch relies on (checked and reported by patch_openwebui.py).
+ANCHORS = {
+    "ERROR_MESSAGES import": ERROR_MESSAGES_IMPORT,
+    **{f"Groups.{method}": write_pattern(method) for method, _ in WRITES},
+}
+
+
+def patch(text: str) -> str:
+    if "import open_persona_access" not in text:
+        if ERROR_MESSAGES_IMPORT not in text:
+            raise SystemExit("Patch failed: ERROR_MESSAGES import not found")
+        text = text.replace(ERROR_MESSAGES_IMPORT, ERROR_MESSAGES_IMPORT + "import open_persona_access\n", 1)
+
+    for method, invalidation in WRITES:
+        match = write_pattern(method).search(text)
+        if not match:
+            raise SystemExit(f"Patch failed: group write not found: Groups.{method}")
+        indent = match.group(1)
+        if text[match.end() :].startswith(indent + invalidation):
+            continue
+        text = text[: match.end()] + indent + invalidation + "\n" + text[match.end() :]
+    return text
+
+
+def main() -> None:
+    if not TARGET.exists():
+        raise SystemExit(f"Target router not found: {TARGET}")
+    TARGET.write_text(patch(TARGET.read_text(encoding="utf-8")), encoding="utf-8")
+    print("Patched Open WebUI groups router (membership cache invalidation)")
+
+
+if __name__ == "__main__":
+    main()
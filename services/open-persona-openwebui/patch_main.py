@@ -0,0 +1,74 @@
+import os
+import pathlib
+
+TARGET = pathlib.Path(os.environ.get("OPENWEBUI_MAIN", "/app/backend/open_webui/main.py"))
+
+# Mount the Open Persona admin API (open_persona_admin_router.py, installed next to
+# open_persona_seed.py) alongside Open WebUI's own /api/v1 routers.
+TOOLS_ROUTER_INCLUDE = 'app.include_router(tools.router, prefix="/api/v1/tools", tags=["tools"])\n'
+
+# Close the pooled sidecar session (open_persona_http) when the app shuts down.
+LIFESPAN = "async def lifespan(app: FastAPI):\n"
+LIFESPAN_YIELD = "\n    yield\n"
+SHUTDOWN = "\n    await open_persona_http.close()\n"
+
+# Startup timing (open_persona_startup): mark the start of main.py and time the
+# patched routers' imports, then the lifespan start and the point the app is ready.
+STARTUP_HEAD = (
+    "import open_persona_startup\n"
+    "\n"
+    'open_persona_startup.mark("main")\n'
+    "open_persona_startup.install_import_timer()\n"
+    "\n"
+)
+LIFESPAN_START = '    open_persona_startup.mark("lifespan")\n'
+READY = "    open_persona_startup.ready()\n"
+
+# Upstream snippets this patch relies on (checked and reported by patch_openwebui.py).
+ANCHORS = {"tools router include": TOOLS_ROUTER_INCLUDE, "lifespan": LIFESPAN}
+
+INJECTION = (
+    "import open_persona_admin_router\n"
+    "import open_persona_http\n"
+    "\n"
+    "app.include_router(\n"
+    '    open_persona_admin_router.router, prefix="/api/v1/open-persona", tags=["open-persona"]\n'
+    ")\n"
+)
+
+
+def patch(text: str) -> str:
+    if "open_persona_admin_router.router" not in text:
+        if TOOLS_ROUTER_INCLUDE not in text:
+            raise SystemExit("Patch failed: tools router include not found")
+        text = text.replace(TOOLS_ROUTER_INCLUDE, TOOLS_ROUTER_INCLUDE + INJECTION, 1)
+
+    if "open_persona_http.close()" not in text:
+        if LIFESPAN not in text:
+            raise SystemExit("Patch failed: lifespan not found")
+        idx = text.find(LIFESPAN_YIELD, text.index(LIFESPAN))
+        if idx < 0:
+            raise SystemExit("Patch failed: lifespan yield not found")
+        idx += len(LIFESPAN_YIELD)
+        text = text[:idx] + SHUTDOWN + text[idx:]
+
+    if "open_persona_startup.ready()" not in text:
+        if LIFESPAN not in text:
+            raise SystemExit("Patch failed: lifespan not found")
+        start = text.index(LIFESPAN) + len(LIFESPAN)
+        idx = text.find(LIFESPAN_YIELD, start)
+        if idx < 0:
+            raise SystemExit("Patch failed: lifespan yield not found")
+        idx += 1  # before `    yield`
+        text = text[:start] + LIFESPAN_START + text[start:idx] + READY + text[idx:]
+        text = STARTUP_HEAD + text
+    return text
+
+
+def main() -> None:
+    TARGET.write_text(patch(TARGET.read_text(encoding="utf-8")), encoding="utf-8")
+    print("Patched Open WebUI main")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,145 +1,233 @@
+import os
 import pathlib
+import re
 
-TARGET = pathlib.Path("/app/backend/open_webui/routers/openai.py")
+TARGET = pathlib.Path(os.environ.get("OPENWEBUI_OPENAI_ROUTER", "/app/backend/open_webui/routers/openai.py"))
 
-text = TARGET.read_text(encoding="utf-8")
+USER_MODEL_IMPORT = "from open_webui.models.users import UserModel\n"
+MODEL_ID_LINE = "    model_id = form_data.get(\"model\")\n"
+# The indentation of this block can change across Open WebUI versions, and other
+# functions (e.g. get_filtered_models) have their own `if model_info:`; only look
+# after the model_id assignment in generate_chat_completion.
+MODEL_INFO_IF = re.compile(r"^( +)if model_info:\n", re.M)
+CALL_BLOCK = (
+    "    headers, cookies = await get_headers_and_cookies(\n"
+    "        request, url, key, api_config, metadata, user=user\n"
+    "    )\n"
+)
+STREAM_HEADERS = "                headers=dict(r.headers),\n"
+SESSION_CREATE = "        session = aiohttp.ClientSession(\n"
+# The completion's StreamingResponse body: `r.content` up to 0.6.3x,
+# `stream_chunks_handler(r.content)` in 0.6.4x-0.7, and from 0.8
+# `stream_wrapper(r, session, stream_chunks_handler)`, which applies the handler to
+# `r.content` and closes the response and session when the stream ends.
+STREAM_BODY = re.compile(
+    r"^( +)(stream_wrapper\(r, session, stream_chunks_handler\)|stream_chunks_handler\(r\.content\)|r\.content),\n",
+    re.M,
+)
+ROUTE_DECORATOR = "\n@router."
+SEND_GET = "async def send_get_request(url, key=None, user: UserModel = None):\n"
+
+# Upstream snippets this patch relies on (checked and reported by patch_openwebui.py).
+ANCHORS = {
+    "UserModel import": USER_MODEL_IMPORT,
+    "model_id assignment": MODEL_ID_LINE,
+    "model_info if-block": MODEL_INFO_IF,
+    "get_headers_and_cookies call": CALL_BLOCK,
+    "streaming response headers": STREAM_HEADERS,
+    "client session": SESSION_CREATE,
+    "streaming response body": STREAM_BODY,
+    "send_get_request": SEND_GET,
+}
+
+INJECTION = '''
+    # Open Persona: forward identity, persona meta and provider keys, but only to
+    # allowlisted sidecar hosts (see open_persona_forwarding). Key resolution may hit
+    # the DB, so headers are built in one step on the open_persona_executor pool.
+    # The chat id (and turn index) give the sidecar a stable opencode session key.
+    # Each stage is timed in open_persona_metrics; with OPEN_PERSONA_TRACING on, the
+    # stage is also a span and traceparent/tracestate are sent (open_persona_tracing).
+    # While the sidecar host's circuit is open the request fails fast with a 503
+    # (open_persona_breaker). Then admission: over the per-user/global in-flight
+    # limits the request queues or gets a 429 (open_persona_admission). The slot is
+    # released, and the breaker ticket settled, by the sidecar session (open_persona_http).
+    open_persona_slot = None
+    open_persona_ticket = None
+    if open_persona_forwarding.forwarding_allowed(url):
+        open_persona_ticket = open_persona_breaker.allow(url)
+        try:
+            open_persona_slot = await open_persona_admission.admit(user.id)
+            open_persona_forwarding.merge_headers(
+                headers,
+                await open_persona_executor.run_blocking(
+                    open_persona_forwarding.resolve_sidecar_headers,
+                    user.id,
+                    open_persona_original_model_id,
+                    open_persona_model,
+                    metadata,
+                    payload.get("messages"),
+                    request.headers,
+                ),
+            )
+        except BaseException:
+            if open_persona_slot is not None:
+                open_persona_slot.release()
+            if open_persona_ticket is not None:
+                open_persona_ticket.cancel()
+            raise
+    else:
+        log.debug("open-persona: not forwarding keys to a host outside the sidecar allowlist")
+'''
+
+MODELS_WRAPPER = '''async def send_get_request(url, key=None, user: UserModel = None):
+    # Open Persona: sidecar model lists come from a short-TTL, single-flight cache
+    # (open_persona_model_cache); other URLs are fetched as upstream does.
+    if open_persona_model_cache.use_cache(url):
+        return await open_persona_model_cache.get(
+            url, key, lambda: _open_persona_send_get_request(url, key, user=user)
+        )
+    return await _open_persona_send_get_request(url, key, user=user)
 
-# Ensure required imports exist (we inject base64 encoding + os for env defaults).
-if "import base64" not in text:
-    text = text.replace("import json\n", "import json\nimport base64\n", 1) if "import json\n" in text else ("import base64\n" + text)
 
-if "import os" not in text:
-    # Open WebUI openai.py uses plain imports at the top.
-    # Insert after the base64 import if present, else after json.
-    if "import base64\n" in text:
-        text = text.replace("import base64\n", "import base64\nimport os\n", 1)
-    elif "import json\n" in text:
-        text = text.replace("import json\n", "import json\nimport os\n", 1)
-    else:
-        text = "import os\n" + text
-
-# Ensure the Tools model import exists for valve lookup.
-if "from open_webui.models.tools import Tools" not in text:
-    anchor = "from open_webui.models.users import UserModel\n"
-    if anchor in text:
-        text = text.replace(anchor, anchor + "from open_webui.models.tools import Tools\n", 1)
-
-# 1) Preserve the original Open WebUI model id (Persona)
-orig_model_line = "    model_id = form_data.get(\"model\")\n"
-if orig_model_line not in text:
-    raise SystemExit("Patch failed: model_id assignment not found")
-
-if "open_persona_original_model_id" not in text:
-    text = text.replace(
-        orig_model_line,
-        orig_model_line + "    open_persona_original_model_id = model_id\n",
-        1,
-    )
-
-# 2b) Preserve Open Persona meta (ModelMeta allows extra fields)
-# The indentation of this block can change across Open WebUI versions.
-if "open_persona_model_meta" not in text:
-    if "        if model_info:\n" in text:
+'''
+
+
+def patch(text: str) -> str:
+    # Ensure the Open Persona modules (installed next to open_persona_seed.py) are imported.
+    if "import open_persona_forwarding" not in text:
+        if USER_MODEL_IMPORT not in text:
+            raise SystemExit("Patch failed: UserModel import not found")
         text = text.replace(
-            "        if model_info:\n",
-            "        if model_info:\n            open_persona_model_meta = model_info.meta.model_dump()\n",
+            USER_MODEL_IMPORT,
+            USER_MODEL_IMPORT
+            + "import open_persona_admission\n"
+            + "import open_persona_breaker\n"
+            + "import open_persona_executor\n"
+            + "import open_persona_forwarding\n"
+            + "import open_persona_http\n"
+            + "import open_persona_model_cache\n"
+            + "import open_persona_sse\n",
             1,
         )
-    elif "    if model_info:\n" in text:
+
+    # 1) Preserve the original Open WebUI model id (Persona)
+    if MODEL_ID_LINE not in text:
+        raise SystemExit("Patch failed: model_id assignment not found")
+
+    if "open_persona_original_model_id" not in text:
         text = text.replace(
-            "    if model_info:\n",
-            "    if model_info:\n        open_persona_model_meta = model_info.meta.model_dump()\n",
+            MODEL_ID_LINE,
+            MODEL_ID_LINE
+            + "    open_persona_original_model_id = model_id\n"
+            + "    open_persona_model = None\n",
             1,
         )
-    else:
-        raise SystemExit("Patch failed: model_info if-block not found")
 
-# 3) Inject headers when forwarding to open-persona-sidecar
-call_block = (
-    "    headers, cookies = await get_headers_and_cookies(\n"
-    "        request, url, key, api_config, metadata, user=user\n"
-    "    )\n"
-)
+    # 2b) Preserve the Persona model row; its `open_persona` meta (ModelMeta allows extra
+    # fields) is encoded lazily and memoized per model id/updated_at by open_persona_forwarding.
+    if "open_persona_model = model_info" not in text:
+        start = text.index(MODEL_ID_LINE)
+        match = MODEL_INFO_IF.search(text, start)
+        if not match:
+            raise SystemExit("Patch failed: model_info if-block not found")
+        indent = match.group(1) + "    "
+        text = (
+            text[: match.end()]
+            + f"{indent}open_persona_model = model_info\n"
+            + text[match.end() :]
+        )
 
-if call_block not in text:
-    raise SystemExit("Patch failed: get_headers_and_cookies call block not found")
-
-injection = '''
-    # Open Persona: validate destination host strictly before forwarding any secrets.
-    try:
-        from urllib.parse import urlparse
-        parsed = urlparse(url)
-        host = (parsed.hostname or '').lower()
-    except Exception:
-        host = ''
-    allowlist_csv = os.environ.get('OPEN_PERSONA_SIDECAR_ALLOWLIST', 'open-persona-sidecar,localhost,127.0.0.1')
-    allowlist = set([h.strip().lower() for h in allowlist_csv.split(',') if h.strip()])
-
-    def host_allowed(h):
-        if not h:
-            return False
-        if h in allowlist:
-            return True
-        if h.endswith('.svc.cluster.local'):
-            base = h.split('.')[0]
-            if base in allowlist:
-                return True
-        return False
-
-    if host_allowed(host):
-        headers["x-openwebui-user-id"] = str(user.id)
-        headers["x-openpersona-original-model-id"] = str(open_persona_original_model_id)
-        try:
-            # Only forward our extension meta to avoid leaking unrelated data.
-            open_persona_ext = (open_persona_model_meta or {}).get("open_persona")
-            if open_persona_ext is not None:
-                headers["x-openpersona-meta-b64"] = base64.b64encode(json.dumps(open_persona_ext).encode()).decode()
-        except Exception:
-            import logging
-            logging.getLogger(__name__).warning('open-persona: failed to forward open_persona_meta')
-
-        # Open Persona: forward provider keys from the Open Persona tool valves.
-        # - Tool Valves = admin defaults
-        # - User Valves = per-user overrides
-        # Keys are sanitized to avoid CR/LF in headers.
-        try:
-            user_tool_id = 'open_persona_provider_keys'
-            admin_tool_id = 'open_persona_provider_defaults'
-            tool_valves = Tools.get_tool_valves_by_id(admin_tool_id) or {}
-            user_valves = Tools.get_user_valves_by_id_and_user_id(user_tool_id, str(user.id)) or {}
-
-            def _clean(v):
-                s = str(v).replace('\\n', '').replace('\\r', '').strip()
-                # remove other control chars and enforce reasonable max length
-                s = ''.join(ch for ch in s if ch.isprintable())[:4096]
-                return s
-
-            openai_key = _clean(user_valves.get('openai_api_key') or tool_valves.get('openai_api_key') or os.environ.get('OPEN_PERSONA_DEFAULT_OPENAI_API_KEY', ''))
-            anthropic_key = _clean(user_valves.get('anthropic_api_key') or tool_valves.get('anthropic_api_key') or os.environ.get('OPEN_PERSONA_DEFAULT_ANTHROPIC_API_KEY', ''))
-            openrouter_key = _clean(user_valves.get('openrouter_api_key') or tool_valves.get('openrouter_api_key') or os.environ.get('OPEN_PERSONA_DEFAULT_OPENROUTER_API_KEY', ''))
-
-            if openai_key:
-                headers['x-openpersona-openai-api-key'] = openai_key
-            if anthropic_key:
-                headers['x-openpersona-anthropic-api-key'] = anthropic_key
-            if openrouter_key:
-                headers['x-openpersona-openrouter-api-key'] = openrouter_key
-
-            # clear sensitive variables from local scope to reduce accidental leakage
-            try:
-                del openai_key, anthropic_key, openrouter_key
-            except Exception:
-                pass
-        except Exception:
-            import logging
-            logging.getLogger(__name__).warning('open-persona: failed to forward provider keys')
-    else:
-        import logging
-        logging.getLogger(__name__).debug(f'open-persona: not forwarding keys to disallowed host: {host}')
-'''
+    # 3) Inject headers when forwarding to open-persona-sidecar
+    if CALL_BLOCK not in text:
+        raise SystemExit("Patch failed: get_headers_and_cookies call block not found")
+
+    if "open_persona_forwarding.resolve_sidecar_headers" not in text:
+        text = text.replace(CALL_BLOCK, CALL_BLOCK + INJECTION, 1)
+
+    # 4) Streamed completions pass the upstream response headers through to the browser;
+    # only keep the sidecar's x-openpersona-model-details (read by the frontend badge).
+    if "open_persona_forwarding.response_headers" not in text:
+        start = text.index(CALL_BLOCK)
+        idx = text.find(STREAM_HEADERS, start)
+        if idx < 0:
+            raise SystemExit("Patch failed: streaming response headers not found")
+        text = (
+            text[:idx]
+            + "                headers=open_persona_forwarding.response_headers(r.headers, url),\n"
+            + text[idx + len(STREAM_HEADERS) :]
+        )
+
+    # 5) Sidecar-bound requests use the worker's pooled keep-alive session, which also
+    # releases the admission slot and reports to the circuit breaker (open_persona_http);
+    # other providers keep upstream's per-request session.
+    if "open_persona_http.sidecar_session" not in text:
+        if "import open_persona_http\n" not in text:
+            text = text.replace(
+                "import open_persona_forwarding\n", "import open_persona_forwarding\nimport open_persona_http\n", 1
+            )
+        start = text.index(CALL_BLOCK)
+        idx = text.find(SESSION_CREATE, start)
+        if idx < 0:
+            raise SystemExit("Patch failed: client session not found")
+        text = (
+            text[:idx]
+            + "        session = open_persona_http.sidecar_session(url, open_persona_slot, open_persona_ticket) or aiohttp.ClientSession(\n"
+            + text[idx + len(SESSION_CREATE) :]
+        )
+
+    # 6) Relay the sidecar's SSE a whole event at a time without re-splitting lines
+    # (open_persona_sse); other providers keep upstream's chunk handler. This is only
+    # a fast path: if the body has a shape not known here, upstream's relay is kept.
+    if "open_persona_sse.sidecar_stream" not in text:
+        if "import open_persona_sse\n" not in text:
+            text = text.replace("import open_persona_http\n", "import open_persona_http\nimport open_persona_sse\n", 1)
+        start = text.index(CALL_BLOCK)
+        end = text.find(ROUTE_DECORATOR, start)
+        match = STREAM_BODY.search(text, start, end if end >= 0 else len(text))
+        if not match:
+            print("open-persona: streaming response body not found; keeping upstream's SSE relay")
+        else:
+            indent, body = match.group(1), match.group(2)
+            if body.startswith("stream_wrapper("):
+                replacement = (
+                    f"{indent}stream_wrapper(\n"
+                    + f"{indent}    r,\n"
+                    + f"{indent}    session,\n"
+                    + f"{indent}    open_persona_sse.sidecar_stream\n"
+                    + f"{indent}    if open_persona_sse.use_passthrough(url)\n"
+                    + f"{indent}    else stream_chunks_handler,\n"
+                    + f"{indent}),\n"
+                )
+            else:
+                replacement = (
+                    f"{indent}(\n"
+                    + f"{indent}    open_persona_sse.sidecar_stream(r.content)\n"
+                    + f"{indent}    if open_persona_sse.use_passthrough(url)\n"
+                    + f"{indent}    else {body}\n"
+                    + f"{indent}),\n"
+                )
+            text = text[: match.start()] + replacement + text[match.end() :]
+
+    # 7) Sidecar model lists are cached with single-flight refresh (open_persona_model_cache);
+    # upstream's fetch is kept under another name for misses and other providers.
+    if "open_persona_model_cache.get" not in text:
+        if "import open_persona_model_cache\n" not in text:
+            text = text.replace(
+                "import open_persona_http\n", "import open_persona_http\nimport open_persona_model_cache\n", 1
+            )
+        if SEND_GET not in text:
+            raise SystemExit("Patch failed: send_get_request not found")
+        text = text.replace(
+            SEND_GET, MODELS_WRAPPER + SEND_GET.replace("send_get_request", "_open_persona_send_get_request"), 1
+        )
+
+    return text
+
+
+def main() -> None:
+    TARGET.write_text(patch(TARGET.read_text(encoding="utf-8")), encoding="utf-8")
+    print("Patched Open WebUI openai router")
 
-if "x-openpersona-original-model-id" not in text:
-    text = text.replace(call_block, call_block + injection, 1)
 
-TARGET.write_text(text, encoding="utf-8")
-print("Patched Open WebUI openai router")
+if __name__ == "__main__":
+    main()
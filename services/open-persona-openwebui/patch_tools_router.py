@@ -3,16 +3,64 @@ import pathlib
 
 TARGET = pathlib.Path(os.environ.get("OPENWEBUI_TOOLS_ROUTER", "/app/backend/open_webui/routers/tools.py"))
 
-if not TARGET.exists():
-    raise SystemExit(f"Target router not found: {TARGET}")
+# The patched output depends on this flag (patch_openwebui.py keys its cache on it).
+BYPASS_ENV = "OPEN_PERSONA_BYPASS_VALVES_ACCESS_CONTROL"
+
+ERROR_MESSAGES_IMPORT = "from open_webui.constants import ERROR_MESSAGES\n"
+TOOL_VALVES_WRITE = "Tools.update_tool_valves_by_id("
+USER_VALVES_WRITE = "Tools.update_user_valves_by_id_and_user_id("
+GET_VALVES = "async def get_tools_valves_by_id(id: str, user=Depends(get_verified_user)):"
+GET_VALVES_SPEC = "async def get_tools_valves_spec_by_id(\n    request: Request, id: str, user=Depends(get_verified_user)\n):"
+UPDATE_VALVES = (
+    "async def update_tools_valves_by_id(\n"
+    "    request: Request, id: str, form_data: dict, user=Depends(get_verified_user)\n"
+    "):"
+)
+
+# Upstream snippets this patch relies on (checked and reported by patch_openwebui.py).
+ANCHORS = {
+    "ERROR_MESSAGES import": ERROR_MESSAGES_IMPORT,
+    "tool valves write": TOOL_VALVES_WRITE,
+    "user valves write": USER_VALVES_WRITE,
+    "get valves endpoint": GET_VALVES,
+    "get valves spec endpoint": GET_VALVES_SPEC,
+    "update valves endpoint": UPDATE_VALVES,
+}
 
-text = TARGET.read_text(encoding="utf-8")
 
-# If bypass flag is set, skip injecting access_control enforcement.
-if os.environ.get("OPEN_PERSONA_BYPASS_VALVES_ACCESS_CONTROL", "").lower() in ("1", "true", "yes"):
-    print("Skipping valves access_control injection (OPEN_PERSONA_BYPASS_VALVES_ACCESS_CONTROL enabled)")
-    TARGET.write_text(text, encoding="utf-8")
-    raise SystemExit(0)
+# Open Persona: drop cached provider keys whenever their valves are written.
+#
+# The patched openai router caches resolved provider keys per user
+# (open_persona_provider_cache). Invalidating right after the DB write makes a key
+# rotation take effect on the next chat completion. This runs regardless of the
+# access_control bypass flag below.
+
+def invalidate_after_write(text: str, call: str, invalidation: str) -> str:
+    if call not in text:
+        raise SystemExit(f"Patch failed: valve write not found: {call}")
+
+    start = text.index(call)
+    line_start = text.rindex("\n", 0, start) + 1
+    indent = text[line_start:start]
+
+    # The call may be wrapped over several lines; find the closing paren.
+    depth = 0
+    pos = start + len(call) - 1
+    while True:
+        ch = text[pos]
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+            if depth == 0:
+                break
+        pos += 1
+    line_end = text.index("\n", pos) + 1
+
+    if text[line_end:].startswith(indent + invalidation):
+        return text
+
+    return text[:line_end] + indent + invalidation + "\n" + text[line_end:]
 
 
 # Open Persona: enforce access_control for tool valves endpoints.
@@ -23,9 +71,7 @@ if os.environ.get("OPEN_PERSONA_BYPASS_VALVES_ACCESS_CONTROL", "").lower() in ("
 #
 # This patch is deliberately narrow: it only affects the *valves* endpoints.
 
-def patch_endpoint(signature: str, mode: str) -> None:
-    global text
-
+def patch_endpoint(text: str, signature: str, mode: str) -> str:
     if signature not in text:
         raise SystemExit(f"Patch failed: endpoint signature not found: {signature}")
 
@@ -35,15 +81,16 @@ def patch_endpoint(signature: str, mode: str) -> None:
     window = text[start : start + 2000]
 
     if "Open Persona: enforce access_control for tool valves" in window:
-        return
+        return text
 
-    idx = window.index(marker)
+    if marker not in window:
+        raise SystemExit(f"Patch failed: tools check not found after: {signature}")
     injected = (
         marker
         + "\n"
         + "        # Open Persona: enforce access_control for tool valves\n"
-        + "        user_group_ids = {group.id for group in Groups.get_groups_by_member_id(user.id)}\n"
-        + f"        if not has_access(user.id, \"{mode}\", tools.access_control, user_group_ids, strict=True):\n"
+        + "        # (group ids and the decision are cached; see open_persona_access)\n"
+        + f"        if not open_persona_access.has_tool_access(user.id, \"{mode}\", tools):\n"
         + "            raise HTTPException(\n"
         + "                status_code=status.HTTP_401_UNAUTHORIZED,\n"
         + "                detail=ERROR_MESSAGES.UNAUTHORIZED,\n"
@@ -51,27 +98,52 @@ def patch_endpoint(signature: str, mode: str) -> None:
     )
 
     window = window.replace(marker, injected, 1)
-    text = text[:start] + window + text[start + 2000 :]
+    return text[:start] + window + text[start + 2000 :]
 
 
-# Read valves
-patch_endpoint(
-    "async def get_tools_valves_by_id(id: str, user=Depends(get_verified_user)):",
-    "read",
-)
+def bypass_access_control() -> bool:
+    return os.environ.get(BYPASS_ENV, "").lower() in ("1", "true", "yes")
 
-# Read valves schema
-patch_endpoint(
-    "async def get_tools_valves_spec_by_id(\n    request: Request, id: str, user=Depends(get_verified_user)\n):",
-    "read",
-)
 
-# Write/update valves
-# This endpoint has more logic below; we enforce write access early.
-patch_endpoint(
-    "async def update_tools_valves_by_id(\n    request: Request, id: str, form_data: dict, user=Depends(get_verified_user)\n):",
-    "write",
-)
+def patch(text: str) -> str:
+    if "import open_persona_provider_cache" not in text:
+        if ERROR_MESSAGES_IMPORT not in text:
+            raise SystemExit("Patch failed: ERROR_MESSAGES import not found")
+        text = text.replace(ERROR_MESSAGES_IMPORT, ERROR_MESSAGES_IMPORT + "import open_persona_provider_cache\n", 1)
+
+    text = invalidate_after_write(text, TOOL_VALVES_WRITE, "open_persona_provider_cache.invalidate(id)")
+    text = invalidate_after_write(text, USER_VALVES_WRITE, "open_persona_provider_cache.invalidate(id, user.id)")
+
+    # If bypass flag is set, skip injecting access_control enforcement.
+    if bypass_access_control():
+        return text
+
+    if "import open_persona_access" not in text:
+        text = text.replace(
+            "import open_persona_provider_cache\n",
+            "import open_persona_provider_cache\nimport open_persona_access\n",
+            1,
+        )
+
+    # Read valves
+    text = patch_endpoint(text, GET_VALVES, "read")
+    # Read valves schema
+    text = patch_endpoint(text, GET_VALVES_SPEC, "read")
+    # Write/update valves
+    # This endpoint has more logic below; we enforce write access early.
+    text = patch_endpoint(text, UPDATE_VALVES, "write")
+    return text
+
+
+def main() -> None:
+    if not TARGET.exists():
+        raise SystemExit(f"Target router not found: {TARGET}")
+    TARGET.write_text(patch(TARGET.read_text(encoding="utf-8")), encoding="utf-8")
+    if bypass_access_control():
+        print(f"Skipping valves access_control injection ({BYPASS_ENV} enabled)")
+    else:
+        print("Patched Open WebUI tools router (valves access_control)")
+
 
-TARGET.write_text(text, encoding="utf-8")
-print("Patched Open WebUI tools router (valves access_control)")
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,22 @@
 
 set -eo pipefail
 
+# Startup timing (open_persona_startup.py): wall-clock marks of this script's phases,
+# reported by each worker once it is ready.
+op_mark() {
+  OPEN_PERSONA_STARTUP_MARKS="${OPEN_PERSONA_STARTUP_MARKS:+$OPEN_PERSONA_STARTUP_MARKS;}$1=${EPOCHREALTIME:-$(date +%s.%N)}"
+}
+# Microseconds since the epoch, for durations measured inside this script.
+op_now_us() {
+  if [[ -n "${EPOCHREALTIME:-}" ]]; then
+    echo "${EPOCHREALTIME/[.,]/}"
+  else
+    date +%s%6N
+  fi
+}
+OPEN_PERSONA_STARTUP_MARKS=""
+op_mark script_start
+
 SCRIPT_DIR=$( cd -- "$( dirname -- "${BASH_SOURCE[0]}" )" &> /dev/null && pwd )
 cd "$SCRIPT_DIR" || exit
 
@@ -15,6 +31,7 @@ if [[ "${WEB_LOADER_ENGINE:-}" != "" ]] && [[ "${WEB_LOADER_ENGINE,,}" == "playw
 
     python -c "import nltk; nltk.download('punkt_tab')"
 fi
+op_mark deps
 
 if [ -n "${WEBUI_SECRET_KEY_FILE:-}" ]; then
     KEY_FILE="${WEBUI_SECRET_KEY_FILE}"
@@ -36,6 +53,7 @@ if test "${WEBUI_SECRET_KEY:-} ${WEBUI_JWT_SECRET_KEY:-}" = " "; then
   echo "Loading WEBUI_SECRET_KEY from $KEY_FILE"
   WEBUI_SECRET_KEY=$(cat "$KEY_FILE")
 fi
+op_mark secret_key
 
 if [[ "${USE_OLLAMA_DOCKER,,}" == "true" ]]; then
     echo "USE_OLLAMA is set to true, starting ollama serve."
@@ -47,9 +65,29 @@ if [[ "${USE_CUDA_DOCKER,,}" == "true" ]]; then
   export LD_LIBRARY_PATH="$LD_LIBRARY_PATH:/usr/local/lib/python3.11/site-packages/torch/lib:/usr/local/lib/python3.11/site-packages/nvidia/cudnn/lib"
 fi
 
-# Seed Open Persona helper tool (idempotent)
+# Seed Open Persona helper tool (idempotent), then optionally pre-warm sidecar runners
+# for recently active users (OPEN_PERSONA_PREWARM_USERS). Both run in the background,
+# in parallel with uvicorn's import: the seeder waits on the DB lock if uvicorn is
+# migrating, and nothing at startup depends on its rows. The pre-warm needs the same
+# WEBUI_SECRET_KEY as uvicorn to send the same provider-key signature. The job times
+# itself and logs one line when done. After the exec below it is uvicorn's child,
+# and uvicorn never waits for it: run the container with an init (`init: true` in
+# docker-compose.yml, `docker run --init`) so it is reaped.
+if [[ $$ -eq 1 ]]; then
+  echo "open-persona: start.sh is PID 1; run the container with an init (docker run --init) to reap the background seeder."
+fi
 PYTHON_CMD=$(command -v python3 || command -v python)
-"$PYTHON_CMD" /app/backend/open_persona_seed.py || true
+(
+  started=$(op_now_us)
+  "$PYTHON_CMD" /app/backend/open_persona_seed.py || true
+  background="seed=$(( ($(op_now_us) - started) / 1000 ))ms"
+  if [[ "${OPEN_PERSONA_PREWARM_USERS:-0}" != "0" ]]; then
+    started=$(op_now_us)
+    WEBUI_SECRET_KEY="$WEBUI_SECRET_KEY" "$PYTHON_CMD" /app/backend/open_persona_prewarm.py || true
+    background="$background prewarm=$(( ($(op_now_us) - started) / 1000 ))ms"
+  fi
+  echo "open-persona startup (background): $background"
+) &
 
 # Check if SPACE_ID is set, if so, configure for space
 if [ -n "${SPACE_ID:-}" ]; then
@@ -85,6 +123,8 @@ else
 fi
 
 # Run uvicorn
+op_mark exec
+export OPEN_PERSONA_STARTUP_MARKS
 WEBUI_SECRET_KEY="$WEBUI_SECRET_KEY" exec "$PYTHON_CMD" -m uvicorn open_webui.main:app \
     --host "$HOST" \
     --port "$PORT" \
@@ -0,0 +1,5 @@
+import pathlib
+import sys
+
+# Open Persona modules are installed flat into /app/backend; make them importable here.
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
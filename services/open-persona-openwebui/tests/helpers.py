@@ -0,0 +1,8 @@
+class FakeClock:
+    """Manually advanced stand-in for time.monotonic; bump `now` to move time."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
@@ -0,0 +1,81 @@
+import unittest
+
+import open_persona_access as oa
+from helpers import FakeClock
+
+
+class FakeTool:
+    def __init__(self, id, updated_at, access_control):
+        self.id = id
+        self.updated_at = updated_at
+        self.access_control = access_control
+
+
+def check(user_id, mode, access_control, group_ids):
+    if access_control is None:
+        return mode == "read"
+    return bool(set(access_control.get(mode, {}).get("group_ids", [])) & group_ids)
+
+
+class TestHasToolAccess(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock(0.0)
+        self.cache = oa.GroupMembershipCache(max_users=2, ttl_seconds=10, clock=self.clock)
+        self.groups = {"u1": frozenset({"open_persona_admins"}), "u2": frozenset()}
+        self.loads = 0
+        self.checks = 0
+        acl = {"read": {"group_ids": ["open_persona_admins"]}, "write": {"group_ids": ["open_persona_admins"]}}
+        self.tool = FakeTool("open_persona_provider_defaults", 100, acl)
+
+    def load(self, user_id):
+        self.loads += 1
+        return self.groups.get(user_id, frozenset())
+
+    def counted_check(self, *args):
+        self.checks += 1
+        return check(*args)
+
+    def access(self, user_id, mode="read", tool=None):
+        return oa.has_tool_access(
+            user_id, mode, tool or self.tool, load=self.load, check=self.counted_check, membership_cache=self.cache
+        )
+
+    def test_groups_loaded_once_and_decision_memoized(self):
+        self.assertTrue(self.access("u1"))
+        self.assertTrue(self.access("u1"))
+        self.assertTrue(self.access("u1", "write"))
+        self.assertFalse(self.access("u2"))
+        self.assertEqual((self.loads, self.checks), (2, 3))
+
+    def test_tool_update_rechecks(self):
+        self.assertTrue(self.access("u1"))
+        self.tool.updated_at, self.tool.access_control = 101, {"read": {"group_ids": []}}
+        self.assertFalse(self.access("u1"))
+        self.assertEqual((self.loads, self.checks), (1, 2))
+
+    def test_ttl_expiry_reloads(self):
+        self.access("u1")
+        self.clock.now = 11
+        self.groups["u1"] = frozenset()
+        self.assertFalse(self.access("u1"))
+        self.assertEqual(self.loads, 2)
+
+    def test_invalidate_group(self):
+        self.assertFalse(self.access("u2"))
+        self.groups["u2"] = frozenset({"open_persona_admins"})
+        oa.invalidate_group("open_persona_admins", ["u2"], membership_cache=self.cache)
+        self.assertTrue(self.access("u2"))
+        oa.invalidate_group("open_persona_admins", membership_cache=self.cache)
+        self.assertEqual(self.cache.stats()["size"], 0)
+
+    def test_invalidation_during_load_is_not_cached(self):
+        def load(user_id):
+            oa.invalidate_group("open_persona_admins", membership_cache=self.cache)
+            return frozenset({"open_persona_admins"})
+
+        oa.user_membership("u1", load=load, membership_cache=self.cache)
+        self.assertIsNone(self.cache.get("u1"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import asyncio
+import importlib.util
+import unittest
+
+import open_persona_admission as adm
+import open_persona_metrics as m
+from helpers import FakeClock
+
+HAS_FASTAPI = importlib.util.find_spec("fastapi") is not None
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class TestAdmission(unittest.TestCase):
+    def controller(self, **kwargs):
+        options = dict(max_per_user=2, max_total=0, queue_size=8, timeout_seconds=1.0, retry_after_seconds=3)
+        options.update(kwargs)
+        return adm.AdmissionController(**options)
+
+    def test_disabled_admits_without_a_slot(self):
+        async def go():
+            return await adm.admit("u1", self.controller(max_per_user=0, max_total=0))
+
+        self.assertIsNone(run(go()))
+
+    def test_per_user_limit_queues_until_release(self):
+        async def go():
+            c = self.controller()
+            first = await c.acquire("u1")
+            await c.acquire("u1")
+            waiter = asyncio.ensure_future(c.acquire("u1"))
+            await asyncio.sleep(0)
+            other = await c.acquire("u2")  # another user is not held up
+            self.assertFalse(waiter.done())
+            self.assertEqual(c.stats(), {"inflight": 3, "queued": 1, "users": 2})
+            first.release()
+            first.release()  # idempotent
+            slot = await waiter
+            self.assertEqual(slot.user_id, "u1")
+            other.release()
+            return c.stats()
+
+        self.assertEqual(run(go()), {"inflight": 2, "queued": 0, "users": 1})
+
+    def test_global_limit_is_fair_across_users(self):
+        async def go():
+            c = self.controller(max_per_user=0, max_total=1)
+            held = await c.acquire("busy")
+            order = []
+
+            async def request(user_id):
+                slot = await c.acquire(user_id)
+                order.append(user_id)
+                await asyncio.sleep(0)
+                slot.release()
+
+            # One user queues three requests before anyone else; the others still alternate in.
+            tasks = [asyncio.ensure_future(request(u)) for u in ("a", "a", "a", "b", "c")]
+            await asyncio.sleep(0)
+            held.release()
+            await asyncio.gather(*tasks)
+            return order
+
+        self.assertEqual(run(go()), ["a", "b", "c", "a", "a"])
+
+    def test_full_queue_is_rejected_at_once(self):
+        async def go():
+            c = self.controller(max_per_user=1, queue_size=1)
+            await c.acquire("u1")
+            waiter = asyncio.ensure_future(c.acquire("u1"))
+            await asyncio.sleep(0)
+            before = m.ADMISSION_REQUESTS.value("queue_full")
+            with self.assertRaises(adm.AdmissionRejected) as ctx:
+                await c.acquire("u1")
+            self.assertEqual(ctx.exception.reason, "queue_full")
+            self.assertEqual(m.ADMISSION_REQUESTS.value("queue_full"), before + 1)
+            waiter.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+            return c.stats()
+
+        self.assertEqual(run(go())["queued"], 0)
+
+    def test_deadline_rejects(self):
+        async def go():
+            c = self.controller(max_per_user=1, timeout_seconds=0.01)
+            await c.acquire("u1")
+            waits = m.ADMISSION_WAIT_SECONDS.count()
+            timeouts = m.ADMISSION_REQUESTS.value("timeout")
+            with self.assertRaises(adm.AdmissionRejected) as ctx:
+                await c.acquire("u1")
+            self.assertEqual(m.ADMISSION_WAIT_SECONDS.count(), waits + 1)
+            self.assertEqual(m.ADMISSION_REQUESTS.value("timeout"), timeouts + 1)
+            return ctx.exception, c.stats()
+
+        exc, stats = run(go())
+        self.assertEqual((exc.reason, exc.retry_after), ("timeout", 3))
+        self.assertEqual(stats, {"inflight": 1, "queued": 0, "users": 1})
+
+    @unittest.skipUnless(HAS_FASTAPI, "fastapi not installed")
+    def test_rejection_is_a_429_with_retry_after(self):
+        from fastapi import HTTPException
+
+        async def go():
+            c = self.controller(max_per_user=1, timeout_seconds=0.01, retry_after_seconds=2.5)
+            await c.acquire("u1")
+            with self.assertRaises(HTTPException) as ctx:
+                await adm.admit("u1", c)
+            return ctx.exception
+
+        exc = run(go())
+        self.assertEqual(exc.status_code, 429)
+        self.assertEqual(exc.headers, {"Retry-After": "3"})
+        # What Open WebUI's process_chat shows in the chat.
+        self.assertEqual(str(exc), "429: Too many concurrent Open Persona requests; please retry in 3s.")
+
+    def test_slot_released_when_response_is_collected(self):
+        class Response:
+            pass
+
+        async def go():
+            c = self.controller(max_per_user=1)
+            slot = await c.acquire("u1")
+            response = Response()
+            slot.release_when_collected(response)
+            del response
+            await asyncio.sleep(0)
+            return c.stats()["inflight"]
+
+        self.assertEqual(run(go()), 0)
+
+    def test_expired_lease_is_released(self):
+        async def go():
+            clock = FakeClock()
+            c = self.controller(max_per_user=1, lease_seconds=60, clock=clock)
+            await c.acquire("u1")
+            clock.now += 61
+            await c.acquire("u1")
+            return c.stats()["inflight"]
+
+        self.assertEqual(run(go()), 1)
+
+    def test_stats_are_exported(self):
+        text = m.render()
+        self.assertIn("# TYPE open_persona_admission_queue_depth gauge", text)
+        self.assertIn("open_persona_admission_inflight ", text)
+        self.assertIn("# TYPE open_persona_admission_wait_seconds histogram", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,20 +1,10 @@
 import unittest
-from urllib.parse import urlparse
 
-# Simple host_allowed implementation mirroring the patched logic in patch_openai_router.py
+from open_persona_forwarding import DEFAULT_ALLOWLIST, compile_host_matcher, is_sidecar_url
 
-def host_allowed(host: str, allowlist_csv: str = "open-persona-sidecar,localhost,127.0.0.1") -> bool:
-    if not host:
-        return False
-    allowlist = set([h.strip().lower() for h in allowlist_csv.split(',') if h.strip()])
-    h = host.lower()
-    if h in allowlist:
-        return True
-    if h.endswith('.svc.cluster.local'):
-        base = h.split('.')[0]
-        if base in allowlist:
-            return True
-    return False
+
+def host_allowed(host: str, allowlist_csv: str = DEFAULT_ALLOWLIST) -> bool:
+    return compile_host_matcher(allowlist_csv)(host)
 
 class TestAllowlist(unittest.TestCase):
     def test_exact_match(self):
@@ -27,6 +17,13 @@ class TestAllowlist(unittest.TestCase):
         self.assertFalse(host_allowed('example.com'))
     def test_empty(self):
         self.assertFalse(host_allowed(''))
+    def test_custom_allowlist(self):
+        self.assertTrue(host_allowed('Sidecar-B', ' sidecar-a, sidecar-b ,'))
+        self.assertFalse(host_allowed('open-persona-sidecar', 'sidecar-a'))
+    def test_url(self):
+        self.assertTrue(is_sidecar_url('http://open-persona-sidecar:8000/v1'))
+        self.assertFalse(is_sidecar_url('https://api.openai.com/v1'))
+        self.assertFalse(is_sidecar_url('not a url'))
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,190 @@
+import asyncio
+import importlib.util
+import unittest
+
+import open_persona_breaker as br
+import open_persona_http
+import open_persona_metrics as m
+from helpers import FakeClock
+
+HAS_FASTAPI = importlib.util.find_spec("fastapi") is not None
+
+SIDECAR = "http://open-persona-sidecar:8000/v1"
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = br.CircuitBreaker(
+            failure_threshold=3, slow_seconds=5, open_seconds=10, half_open_probes=1, clock=self.clock
+        )
+
+    def fail(self, times, reason="error"):
+        for _ in range(times):
+            self.breaker.allow(SIDECAR).failure(reason)
+
+    def test_opens_after_consecutive_failures_only(self):
+        self.fail(2)
+        self.breaker.allow(SIDECAR).success()  # resets the count
+        self.fail(2)
+        self.assertEqual(self.breaker.state(SIDECAR), br.CLOSED)
+        self.fail(1)
+        self.assertEqual(self.breaker.state(SIDECAR), br.OPEN)
+
+        self.clock.now += 4
+        with self.assertRaises(br.CircuitOpen) as ctx:
+            self.breaker.allow(SIDECAR)
+        self.assertEqual(ctx.exception.retry_after, 6)
+
+    def test_hosts_have_their_own_circuit(self):
+        self.fail(3)
+        self.breaker.allow("http://other-sidecar:8000/v1").success()
+        self.assertEqual(self.breaker.state("http://OPEN-PERSONA-SIDECAR:8000/v1/chat"), br.OPEN)
+        self.assertEqual(
+            self.breaker.stats(),
+            {"open-persona-sidecar:8000": {"state": 2, "failures": 3}, "other-sidecar:8000": {"state": 0, "failures": 0}},
+        )
+
+    def test_slow_responses_count_only_when_enabled(self):
+        breaker = br.CircuitBreaker(failure_threshold=1, open_seconds=10, clock=self.clock)
+        self.assertEqual(breaker.slow_seconds, 0)
+        breaker.allow(SIDECAR).record_response(200, 3600.0)
+        self.assertEqual(breaker.state(SIDECAR), br.CLOSED)
+
+    def test_status_and_slow_responses_count_as_failures(self):
+        self.breaker.allow(SIDECAR).record_response(503, 0.1)
+        self.breaker.allow(SIDECAR).record_response(200, 6.0)
+        self.assertEqual(self.breaker.stats()["open-persona-sidecar:8000"]["failures"], 2)
+        self.breaker.allow(SIDECAR).record_response(400, 0.1)  # the sidecar answered
+        self.assertEqual(self.breaker.stats()["open-persona-sidecar:8000"]["failures"], 0)
+
+    def test_half_open_probe_closes_or_reopens(self):
+        self.fail(3)
+        self.clock.now += 10
+        probe = self.breaker.allow(SIDECAR)
+        self.assertTrue(probe.probe)
+        self.assertEqual(self.breaker.state(SIDECAR), br.HALF_OPEN)
+        with self.assertRaises(br.CircuitOpen):
+            self.breaker.allow(SIDECAR)  # one probe at a time
+        probe.failure("timeout")
+        self.assertEqual(self.breaker.state(SIDECAR), br.OPEN)
+
+        self.clock.now += 10
+        self.breaker.allow(SIDECAR).success()
+        self.assertEqual(self.breaker.state(SIDECAR), br.CLOSED)
+        self.assertFalse(self.breaker.allow(SIDECAR).probe)
+
+    def test_cancelled_probe_frees_its_place(self):
+        self.fail(3)
+        self.clock.now += 10
+        probe = self.breaker.allow(SIDECAR)
+        probe.cancel()
+        probe.success()  # only the first outcome counts
+        self.assertEqual(self.breaker.state(SIDECAR), br.HALF_OPEN)
+        self.assertTrue(self.breaker.allow(SIDECAR).probe)
+
+    def test_lost_probe_is_replaced_after_an_open_period(self):
+        self.fail(3)
+        self.clock.now += 10
+        self.breaker.allow(SIDECAR)  # never reports back
+        self.clock.now += 10
+        self.assertTrue(self.breaker.allow(SIDECAR).probe)
+
+    def test_requests_from_before_opening_do_not_change_an_open_circuit(self):
+        late = self.breaker.allow(SIDECAR)
+        self.fail(3)
+        late.success()
+        self.assertEqual(self.breaker.state(SIDECAR), br.OPEN)
+
+    def test_metrics(self):
+        self.fail(3, reason="slow")
+        with self.assertRaises(br.CircuitOpen):
+            self.breaker.allow(SIDECAR)
+        self.assertGreaterEqual(m.BREAKER_FAILURES.value("slow"), 3)
+        self.assertGreaterEqual(m.BREAKER_REQUESTS.value("rejected"), 1)
+        self.assertGreaterEqual(m.BREAKER_TRANSITIONS.value("open"), 1)
+        self.assertIn("open_persona_breaker_state", m.render())
+
+    def test_disabled(self):
+        self.assertIsNone(br.allow(SIDECAR, br.CircuitBreaker(failure_threshold=0)))
+
+    @unittest.skipUnless(HAS_FASTAPI, "fastapi not installed")
+    def test_open_circuit_is_a_503_with_retry_after(self):
+        from fastapi import HTTPException
+
+        self.fail(3)
+        self.clock.now += 2.5
+        with self.assertRaises(HTTPException) as ctx:
+            br.allow(SIDECAR, self.breaker)
+        self.assertEqual(ctx.exception.status_code, 503)
+        self.assertEqual(ctx.exception.headers, {"Retry-After": "8"})
+        self.assertEqual(str(ctx.exception), "503: The Open Persona sidecar is unavailable; please retry in 8s.")
+
+
+class TestSidecarSessionOutcomes(unittest.TestCase):
+    def setUp(self):
+        self.breaker = br.CircuitBreaker(failure_threshold=1, slow_seconds=0.05, open_seconds=10)
+
+    def request(self, session):
+        async def go():
+            ticket = self.breaker.allow(SIDECAR)
+            wrapper = open_persona_http.SidecarSession(session, ticket=ticket)
+            try:
+                await wrapper.request(method="POST", url=f"{SIDECAR}/chat/completions")
+            finally:
+                await wrapper.close()
+
+        asyncio.run(go())
+
+    def test_connection_error_opens_the_circuit(self):
+        class Session:
+            async def request(self, **kwargs):
+                raise ConnectionRefusedError()
+
+        with self.assertRaises(ConnectionRefusedError):
+            self.request(Session())
+        self.assertEqual(self.breaker.state(SIDECAR), br.OPEN)
+
+    def test_overdue_headers_count_as_slow_before_the_response(self):
+        breaker = self.breaker
+
+        class Session:
+            async def request(self, **kwargs):
+                await asyncio.sleep(0.2)
+                # Already counted while still waiting.
+                assert breaker.state(SIDECAR) == br.OPEN
+                return type("Response", (), {"status": 200})()
+
+        self.request(Session())
+        self.assertEqual(self.breaker.state(SIDECAR), br.OPEN)
+
+    def test_long_healthy_response_leaves_the_circuit_closed(self):
+        self.breaker = br.CircuitBreaker(failure_threshold=1, open_seconds=10)
+
+        class Session:
+            async def request(self, **kwargs):
+                await asyncio.sleep(0.2)  # a long opencode run: no headers until it is done
+                return type("Response", (), {"status": 200})()
+
+        self.request(Session())
+        self.assertEqual(self.breaker.state(SIDECAR), br.CLOSED)
+
+    def test_success_and_unsent_requests(self):
+        class Session:
+            async def request(self, **kwargs):
+                return type("Response", (), {"status": 200})()
+
+        self.request(Session())
+        self.assertEqual(self.breaker.state(SIDECAR), br.CLOSED)
+
+        async def unsent():
+            ticket = self.breaker.allow(SIDECAR)
+            await open_persona_http.SidecarSession(Session(), ticket=ticket).close()
+            return ticket
+
+        self.assertTrue(asyncio.run(unsent()).done)
+        self.assertEqual(self.breaker.state(SIDECAR), br.CLOSED)
+
+
+if __name__ == "__main__":
+    unittest.main()
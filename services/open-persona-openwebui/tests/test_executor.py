@@ -0,0 +1,76 @@
+import asyncio
+import contextvars
+import time
+import unittest
+
+import open_persona_executor
+
+request_id = contextvars.ContextVar("request_id", default=None)
+
+def slow_key_resolution(delay):
+    # Stands in for the blocking valve lookups done while building headers.
+    time.sleep(delay)
+    return {"x-openpersona-openai-api-key": "sk-test"}
+
+
+class TestRunBlocking(unittest.TestCase):
+    def test_streams_keep_flowing_while_resolving_keys(self):
+        async def stream(ticks):
+            for _ in range(20):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        async def scenario():
+            ticks = []
+            started = time.monotonic()
+            headers, _ = await asyncio.gather(
+                open_persona_executor.run_blocking(slow_key_resolution, 0.3),
+                stream(ticks),
+            )
+            return headers, ticks, started
+
+        headers, ticks, started = asyncio.run(scenario())
+        self.assertEqual(headers, {"x-openpersona-openai-api-key": "sk-test"})
+        # The stream ticked throughout the 300ms lookup instead of waiting behind it.
+        self.assertGreaterEqual(len([t for t in ticks if t - started < 0.25]), 10)
+
+    def test_concurrent_resolutions_are_not_serialized(self):
+        self.assertGreaterEqual(open_persona_executor.HEADER_WORKERS, 2)
+
+        async def scenario():
+            started = time.monotonic()
+            await asyncio.gather(
+                open_persona_executor.run_blocking(slow_key_resolution, 0.2),
+                open_persona_executor.run_blocking(slow_key_resolution, 0.2),
+            )
+            return time.monotonic() - started
+
+        self.assertLess(asyncio.run(scenario()), 0.35)
+
+    def test_imports_do_not_queue_behind_header_building(self):
+        async def scenario():
+            busy = [
+                asyncio.ensure_future(open_persona_executor.run_blocking(slow_key_resolution, 0.3))
+                for _ in range(open_persona_executor.HEADER_WORKERS)
+            ]
+            await asyncio.sleep(0.02)
+            started = time.monotonic()
+            await open_persona_executor.run_import(time.sleep, 0)
+            elapsed = time.monotonic() - started
+            await asyncio.gather(*busy)
+            return elapsed
+
+        # Every header worker is busy for 300ms; the import still runs at once.
+        self.assertLess(asyncio.run(scenario()), 0.15)
+
+    def test_runs_in_the_callers_context(self):
+        async def scenario():
+            request_id.set("req-1")
+            return await open_persona_executor.run_blocking(request_id.get)
+
+        self.assertEqual(asyncio.run(scenario()), "req-1")
+        self.assertIsNone(request_id.get())
+
+
+if __name__ == '__main__':
+    unittest.main()
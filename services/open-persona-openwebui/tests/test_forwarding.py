@@ -0,0 +1,107 @@
+import base64
+import json
+import unittest
+import zlib
+
+import open_persona_forwarding as fwd
+from open_persona_provider_cache import ProviderKeys
+
+
+class FakeMeta:
+    def __init__(self, data):
+        self.data = data
+        self.dumps = 0
+
+    def model_dump(self):
+        self.dumps += 1
+        return dict(self.data)
+
+
+class FakeModel:
+    def __init__(self, model_id, updated_at, meta):
+        self.id = model_id
+        self.updated_at = updated_at
+        self.meta = FakeMeta(meta)
+
+
+PERSONA_META = {"open_persona": {"template": "izzy"}, "description": "not forwarded"}
+
+
+class TestBuildSidecarHeaders(unittest.TestCase):
+    def test_identity_only(self):
+        self.assertEqual(
+            fwd.build_sidecar_headers(42, "persona-a"),
+            {"x-openwebui-user-id": "42", "x-openpersona-original-model-id": "persona-a"},
+        )
+
+    def test_provider_keys(self):
+        headers = fwd.build_sidecar_headers("u1", "m", None, ProviderKeys(anthropic_api_key="sk-ant"))
+        self.assertEqual(headers["x-openpersona-anthropic-api-key"], "sk-ant")
+        self.assertNotIn("x-openpersona-openai-api-key", headers)
+
+    def test_chat_identity(self):
+        messages = [
+            {"role": "system", "content": "s"},
+            {"role": "user", "content": "hi"},
+            {"role": "assistant", "content": "hello"},
+            {"role": "user", "content": "again"},
+        ]
+        headers = fwd.chat_identity_headers({"chat_id": "chat-1\r\n", "message_id": "msg-2"}, messages)
+        self.assertEqual(
+            headers,
+            {"x-openwebui-chat-id": "chat-1", "x-openwebui-message-id": "msg-2", "x-openpersona-turn-index": "2"},
+        )
+        self.assertEqual(fwd.chat_identity_headers(None), {})
+
+    def test_merge_headers_replaces_other_case(self):
+        headers = {"X-OpenWebUI-Chat-Id": "upstream", "Authorization": "Bearer x"}
+        fwd.merge_headers(headers, {"x-openwebui-chat-id": "chat-1"})
+        self.assertEqual(headers, {"Authorization": "Bearer x", "x-openwebui-chat-id": "chat-1"})
+
+    def test_model_details_header_only_from_sidecar(self):
+        upstream = {"Content-Type": "text/event-stream", "X-OpenPersona-Model-Details": "e30="}
+        self.assertEqual(fwd.response_headers(upstream, "http://open-persona-sidecar:8000/v1"), upstream)
+        self.assertEqual(
+            fwd.response_headers(upstream, "https://api.openai.com/v1"), {"Content-Type": "text/event-stream"}
+        )
+
+
+class TestMetaHeaders(unittest.TestCase):
+    def test_b64_forwards_only_open_persona_meta(self):
+        headers = fwd.encode_meta_headers(PERSONA_META["open_persona"], "b64")
+        self.assertEqual(json.loads(base64.b64decode(headers["x-openpersona-meta-b64"])), {"template": "izzy"})
+        self.assertTrue(headers["x-openpersona-meta-digest"].startswith("sha256:"))
+
+    def test_zlib_roundtrip_and_stable_digest(self):
+        meta = {"b": [1, 2], "a": {"enabled": True}}
+        z = fwd.encode_meta_headers(meta, "zlib")
+        self.assertNotIn("x-openpersona-meta-b64", z)
+        self.assertEqual(json.loads(zlib.decompress(base64.b64decode(z["x-openpersona-meta-z64"]))), meta)
+        reordered = fwd.encode_meta_headers({"a": {"enabled": True}, "b": [1, 2]}, "b64")
+        self.assertEqual(z["x-openpersona-meta-digest"], reordered["x-openpersona-meta-digest"])
+
+    def test_memoized_per_model_and_updated_at(self):
+        cache = fwd.ModelMetaHeaderCache(max_models=8)
+        model = FakeModel("persona-a", 100, PERSONA_META)
+        first = cache.headers_for(model)
+        self.assertEqual(cache.headers_for(model), first)
+        self.assertEqual(model.meta.dumps, 1)
+
+        model.updated_at = 101
+        model.meta.data = {"open_persona": {"template": "other"}}
+        self.assertNotEqual(cache.headers_for(model), first)
+        self.assertEqual(model.meta.dumps, 2)
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 2, "invalidations": 1, "size": 1})
+
+    def test_model_without_persona_meta(self):
+        cache = fwd.ModelMetaHeaderCache()
+        self.assertEqual(cache.headers_for(FakeModel("plain", 1, {"description": "x"})), {})
+        self.assertEqual(cache.headers_for(None), {})
+
+    def test_unserializable_meta_is_skipped(self):
+        cache = fwd.ModelMetaHeaderCache()
+        self.assertEqual(cache.headers_for(FakeModel("bad", 1, {"open_persona": {"x": object()}})), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import asyncio
+import importlib.util
+import unittest
+from unittest import mock
+
+import open_persona_http
+
+HAS_AIOHTTP = importlib.util.find_spec("aiohttp") is not None
+
+
+class FakeSlot:
+    def __init__(self):
+        self.released = 0
+
+    def release(self):
+        self.released += 1
+
+    def release_when_collected(self, obj):
+        pass
+
+
+class TestSidecarSession(unittest.TestCase):
+    def test_other_providers_keep_upstream_session(self):
+        self.assertIsNone(open_persona_http.sidecar_session("https://api.openai.com/v1"))
+
+    def test_disabled(self):
+        with mock.patch.object(open_persona_http, "POOL_ENABLED", False):
+            self.assertIsNone(open_persona_http.sidecar_session("http://open-persona-sidecar:8000/v1"))
+
+    def test_close_releases_admission_slot(self):
+        class Session:
+            closed = False
+
+            async def close(self):
+                self.closed = True
+
+        slot, pooled, owned = FakeSlot(), Session(), Session()
+        asyncio.run(open_persona_http.SidecarSession(pooled, slot=slot).close())
+        asyncio.run(open_persona_http.SidecarSession(owned, owned=True, slot=slot).close())
+        self.assertEqual(slot.released, 2)
+        self.assertFalse(pooled.closed)
+        self.assertTrue(owned.closed)
+
+    def test_timeout_follows_upstream_aiohttp_client_timeout(self):
+        for value, expected in (("", None), ("120", 120.0), ("soon", 300.0)):
+            with mock.patch.dict("os.environ", {"AIOHTTP_CLIENT_TIMEOUT": value}):
+                self.assertEqual(open_persona_http._upstream_timeout(), expected)
+        with mock.patch.dict("os.environ", clear=True):
+            self.assertIsNone(open_persona_http._upstream_timeout())
+
+
+@unittest.skipUnless(HAS_AIOHTTP, "aiohttp not installed")
+class TestPooledSession(unittest.TestCase):
+    def test_reuses_connections_and_survives_router_close(self):
+        from aiohttp import web
+
+        async def run():
+            peers = []
+
+            async def handler(request):
+                peers.append(request.transport.get_extra_info("peername"))
+                response = web.json_response({"ok": True})
+                response.set_cookie("sid", "user-a")
+                return response
+
+            app = web.Application()
+            app.router.add_post("/v1/chat/completions", handler)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            url = f"http://127.0.0.1:{runner.addresses[0][1]}/v1"
+            try:
+                for _ in range(3):
+                    # What the patched router does per chat completion.
+                    session = open_persona_http.sidecar_session(url)
+                    r = await session.request(method="POST", url=f"{url}/chat/completions", data="{}")
+                    self.assertEqual(await r.json(), {"ok": True})
+                    r.close()
+                    await session.close()
+                pooled = open_persona_http.get_session()
+                self.assertFalse(pooled.closed)
+                self.assertEqual(len(pooled.cookie_jar), 0)
+                await open_persona_http.close()
+                self.assertTrue(pooled.closed)
+            finally:
+                await runner.cleanup()
+            return peers
+
+        peers = asyncio.run(run())
+        self.assertEqual(len(peers), 3)
+        self.assertEqual(len(set(peers)), 1)
+
+    def test_new_event_loop_closes_the_old_session(self):
+        async def pooled():
+            return open_persona_http.get_session()
+
+        async def replace(old):
+            new = open_persona_http.get_session()
+            await asyncio.sleep(0)
+            return new, old.closed
+
+        old = asyncio.run(pooled())
+        try:
+            new, old_closed = asyncio.run(replace(old))
+            self.assertIsNot(new, old)
+            self.assertTrue(old_closed)
+        finally:
+            asyncio.run(open_persona_http.close())
+
+
+if __name__ == "__main__":
+    unittest.main()
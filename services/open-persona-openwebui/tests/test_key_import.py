@@ -0,0 +1,91 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import pydantic  # noqa: F401
+except ImportError:  # The tool schema is a pydantic model (always present in Open WebUI).
+    pydantic = None
+
+import open_persona_key_import as ki
+import open_persona_seed as seed
+from open_persona_provider_cache import USER_TOOL_ID
+
+
+@unittest.skipIf(pydantic is None, "pydantic not installed")
+class TestKeyImport(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.db = seed.Database("", os.path.join(self.tmp, "webui.db"))
+        open(self.db.sqlite_path, "w").close()
+        existing = {"ui": {"theme": "dark"}, "tools": {"valves": {USER_TOOL_ID: {"openai_api_key": "sk-old"}}}}
+        with self.db.transaction() as cur:
+            cur.execute('CREATE TABLE "user" (id TEXT PRIMARY KEY, role TEXT, settings JSON)')
+            cur.executemany(
+                'INSERT INTO "user" (id, role, settings) VALUES (?, ?, ?)',
+                [("u1", "user", json.dumps(existing)), ("u2", "user", None), ("u3", "user", "{}")],
+            )
+
+    def valves(self, user_id):
+        with self.db.transaction() as cur:
+            cur.execute('SELECT settings FROM "user" WHERE id = ?', (user_id,))
+            settings = json.loads(cur.fetchone()[0])
+        return settings
+
+    def run_import(self, rows, batch_size=2):
+        lines = [r if isinstance(r, str) else json.dumps(r) for r in rows]
+        return ki.import_lines(lines, self.db, batch_size=batch_size)
+
+    def test_merges_keys_and_keeps_other_settings(self):
+        report = self.run_import(
+            [
+                {"user_id": "u1", "keys": {"openrouter_api_key": "sk-or-u1\n"}},
+                {"user_id": "u2", "keys": {"anthropic_api_key": "sk-ant-u2"}},
+                {"user_id": "u3", "keys": {"openai_api_key": None}},
+            ]
+        )
+        self.assertEqual((report["updated"], report["unchanged"], report["batches"]), (2, 1, 2))
+        u1 = self.valves("u1")
+        self.assertEqual(u1["ui"], {"theme": "dark"})
+        self.assertEqual(
+            u1["tools"]["valves"][USER_TOOL_ID],
+            {"openai_api_key": "sk-old", "anthropic_api_key": None, "openrouter_api_key": "sk-or-u1"},
+        )
+        self.assertEqual(self.valves("u2")["tools"]["valves"][USER_TOOL_ID]["anthropic_api_key"], "sk-ant-u2")
+
+    def test_null_clears_a_key(self):
+        self.run_import([{"user_id": "u1", "keys": {"openai_api_key": None}}])
+        self.assertIsNone(self.valves("u1")["tools"]["valves"][USER_TOOL_ID]["openai_api_key"])
+
+    def test_invalid_and_missing_rows_are_reported_without_values(self):
+        report = self.run_import(
+            [
+                "not json",
+                {"user_id": "u1", "keys": {"opneai_api_key": "sk-typo"}},
+                {"user_id": "u1", "keys": {"openai_api_key": ["sk-secret"]}},
+                {"user_id": "ghost", "keys": {"openai_api_key": "sk-ghost"}},
+                {"user_id": "u2", "keys": {"openai_api_key": "sk-u2"}},
+            ]
+        )
+        self.assertEqual([i["line"] for i in report["invalid"]], [1, 2, 3])
+        self.assertNotIn("sk-", json.dumps(report["invalid"]))
+        self.assertEqual(report["missing"], ["ghost"])
+        self.assertEqual(report["updated_user_ids"], ["u2"])
+
+    def test_export_redacts(self):
+        self.run_import([{"user_id": "u2", "keys": {"openrouter_api_key": "or-v1-0123456789abcdef"}}])
+        rows = list(ki.export_rows(self.db, batch_size=1))
+        self.assertEqual(
+            rows,
+            [
+                {"user_id": "u1", "keys": {"openai_api_key": "****"}},
+                {"user_id": "u2", "keys": {"openrouter_api_key": "****cdef"}},
+            ],
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import open_persona_forwarding as fwd
+import open_persona_metrics as m
+import open_persona_seed as seed
+
+
+class TestMetrics(unittest.TestCase):
+    def test_histogram_render(self):
+        h = m.Histogram("t_seconds", "Test.", ("stage",), buckets=(0.001, 0.01))
+        h.observe(0.0005, "meta")
+        h.observe(0.005, "meta")
+        h.observe(2, "meta")
+        lines = h.render()
+        self.assertIn('t_seconds_bucket{stage="meta",le="0.001"} 1', lines)
+        self.assertIn('t_seconds_bucket{stage="meta",le="0.01"} 2', lines)
+        self.assertIn('t_seconds_bucket{stage="meta",le="+Inf"} 3', lines)
+        self.assertIn('t_seconds_count{stage="meta"} 3', lines)
+
+    def test_counter_escapes_labels(self):
+        c = m.Counter("c_total", "Test.", ("decision",))
+        c.inc('a"b')
+        self.assertEqual(c.render()[-1], 'c_total{decision="a\\"b"} 1')
+
+    def test_forwarding_decisions_and_stages(self):
+        forwarded = m.FORWARD_REQUESTS.value("forwarded")
+        refused = m.FORWARD_REQUESTS.value("refused")
+        allowlist = m.FORWARD_STAGE_SECONDS.count("allowlist")
+        self.assertTrue(fwd.forwarding_allowed("http://open-persona-sidecar:8000/v1"))
+        self.assertFalse(fwd.forwarding_allowed("https://api.openai.com/v1"))
+        self.assertEqual(m.FORWARD_REQUESTS.value("forwarded"), forwarded + 1)
+        self.assertEqual(m.FORWARD_REQUESTS.value("refused"), refused + 1)
+        self.assertEqual(m.FORWARD_STAGE_SECONDS.count("allowlist"), allowlist + 2)
+
+        text = m.render()
+        self.assertIn("# TYPE open_persona_forward_stage_seconds histogram", text)
+        self.assertIn('open_persona_cache_entries{cache="provider_keys"}', text)
+        self.assertIn('open_persona_cache_hits_total{cache="persona_meta"}', text)
+
+    def test_seed_report_round_trip(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, "report.json")
+        seed.write_report({"members_added": 1}, {"lock": 2.0, "total": 12.5}, "sqlite", path)
+        report = m.read_seed_report(path)
+        self.assertEqual(report["timings"], {"lock": 2.0, "total": 12.5})
+        self.assertIsNone(m.read_seed_report(os.path.join(tmp, "missing.json")))
+        with open(path, "w") as f:
+            json.dump([], f)
+        self.assertIsNone(m.read_seed_report(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
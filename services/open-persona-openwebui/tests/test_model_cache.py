@@ -0,0 +1,135 @@
+import asyncio
+import unittest
+
+import open_persona_model_cache as mc
+from helpers import FakeClock
+
+SIDECAR = "http://open-persona-sidecar:8000/v1/models"
+MODELS = {"object": "list", "data": [{"id": "open-persona/build", "name": None}, {"id": "open-persona/plan"}]}
+
+
+class Upstream:
+    """Stands in for upstream's send_get_request."""
+
+    def __init__(self, responses=None):
+        self.calls = 0
+        self.responses = list(responses or [])
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def fetch(self):
+        self.calls += 1
+        await self.release.wait()
+        response = self.responses.pop(0) if self.responses else MODELS
+        if isinstance(response, Exception):
+            raise response
+        return {"object": "list", "data": [dict(m) for m in response["data"]]} if response else response
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class TestModelListCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = mc.ModelListCache(ttl_seconds=60, clock=self.clock)
+
+    def get(self, upstream):
+        return mc.get(SIDECAR, "key", upstream.fetch, model_cache=self.cache)
+
+    def test_only_sidecar_urls_are_cached(self):
+        self.assertTrue(mc.use_cache(SIDECAR))
+        self.assertFalse(mc.use_cache("https://api.openai.com/v1/models"))
+
+    def test_hit_within_ttl_then_refresh(self):
+        async def go():
+            upstream = Upstream()
+            await self.get(upstream)
+            await self.get(upstream)
+            self.clock.now += 61
+            await self.get(upstream)
+            return upstream.calls
+
+        self.assertEqual(run(go()), 2)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_concurrent_misses_share_one_call(self):
+        async def go():
+            upstream = Upstream()
+            upstream.release.clear()
+            tasks = [asyncio.ensure_future(self.get(upstream)) for _ in range(20)]
+            await asyncio.sleep(0)
+            upstream.release.set()
+            results = await asyncio.gather(*tasks)
+            return upstream.calls, results
+
+        calls, results = run(go())
+        self.assertEqual(calls, 1)
+        self.assertTrue(all(r == results[0] for r in results))
+        self.assertIsNot(results[0], results[1])
+
+    def test_callers_cannot_corrupt_the_cached_copy(self):
+        async def go():
+            upstream = Upstream()
+            for _ in range(2):
+                response = await self.get(upstream)
+                # What get_all_models_responses does with a prefix_id / None name.
+                for model in response["data"]:
+                    if "name" in model and model["name"] is None:
+                        del model["name"]
+                    model["id"] = f"op.{model['id']}"
+            return response
+
+        self.assertEqual([m["id"] for m in run(go())["data"]], ["op.open-persona/build", "op.open-persona/plan"])
+
+    def test_failed_refresh_serves_stale(self):
+        async def go():
+            upstream = Upstream([MODELS, None, {"error": "boom"}, RuntimeError("down")])
+            first = await self.get(upstream)
+            results = []
+            for _ in range(3):
+                self.clock.now += 61
+                results.append(await self.get(upstream))
+            return first, results
+
+        first, results = run(go())
+        self.assertEqual(results, [first] * 3)
+        self.assertEqual(self.cache.stats()["stale"], 3)
+
+    def test_failure_without_a_copy_is_returned(self):
+        self.assertIsNone(run(self.get(Upstream([None]))))
+        self.assertEqual(self.cache.stats()["size"], 0)
+
+    def test_invalidate_refetches_but_keeps_fallback(self):
+        async def go():
+            upstream = Upstream([MODELS, {"object": "list", "data": [{"id": "open-persona/new"}]}, None])
+            await self.get(upstream)
+            self.cache.invalidate()
+            refreshed = await self.get(upstream)
+            self.cache.invalidate()
+            fallback = await self.get(upstream)
+            return upstream.calls, refreshed, fallback
+
+        calls, refreshed, fallback = run(go())
+        self.assertEqual(calls, 3)
+        self.assertEqual(refreshed["data"], [{"id": "open-persona/new"}])
+        self.assertEqual(fallback, refreshed)
+
+    def test_refresh_started_before_invalidation_is_not_stored(self):
+        async def go():
+            upstream = Upstream()
+            upstream.release.clear()
+            old = asyncio.ensure_future(self.get(upstream))
+            await asyncio.sleep(0)
+            self.cache.invalidate()
+            upstream.release.set()
+            await old
+            await self.get(upstream)
+            return upstream.calls
+
+        self.assertEqual(run(go()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
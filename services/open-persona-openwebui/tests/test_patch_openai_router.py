@@ -0,0 +1,151 @@
+import contextlib
+import io
+import unittest
+
+import patch_openai_router
+
+# generate_chat_completion as Open WebUI lays it out, trimmed to what the patch
+# touches; {body} is the StreamingResponse body of the release under test.
+UPSTREAM = '''import aiohttp
+from open_webui.models.users import UserModel
+
+from open_webui.utils.misc import (
+    cleanup_response,
+    stream_chunks_handler,
+    stream_wrapper,
+)
+
+
+async def send_get_request(url, key=None, user: UserModel = None):
+    return None
+
+
+@router.post("/chat/completions")
+async def generate_chat_completion(
+    request: Request,
+    form_data: dict,
+    user=Depends(get_verified_user),
+    bypass_filter: Optional[bool] = False,
+):
+    payload = {**form_data}
+    metadata = payload.pop("metadata", None)
+
+    model_id = form_data.get("model")
+    model_info = Models.get_model_by_id(model_id)
+
+    # Check model info and override the payload
+    if model_info:
+        if model_info.base_model_id:
+            payload["model"] = model_info.base_model_id
+
+    url = request.app.state.config.OPENAI_API_BASE_URLS[idx]
+    key = request.app.state.config.OPENAI_API_KEYS[idx]
+
+    headers, cookies = await get_headers_and_cookies(
+        request, url, key, api_config, metadata, user=user
+    )
+
+    r = None
+    session = None
+    streaming = False
+    response = None
+
+    try:
+        session = aiohttp.ClientSession(
+            trust_env=True, timeout=aiohttp.ClientTimeout(total=AIOHTTP_CLIENT_TIMEOUT)
+        )
+
+        r = await session.request(
+            method="POST",
+            url=request_url,
+            data=payload,
+            headers=headers,
+            cookies=cookies,
+        )
+
+        # Check if response is SSE
+        if "text/event-stream" in r.headers.get("Content-Type", ""):
+            streaming = True
+            return StreamingResponse(
+                {body},
+                status_code=r.status,
+                headers=dict(r.headers),
+            )
+        return await r.json()
+    finally:
+        if not streaming:
+            await cleanup_response(r, session)
+
+
+@router.post("/embeddings")
+async def embeddings(request: Request, form_data: dict, user=Depends(get_verified_user)):
+    if "text/event-stream" in r.headers.get("Content-Type", ""):
+        return StreamingResponse(
+            stream_wrapper(r, session),
+            status_code=r.status,
+            headers=dict(r.headers),
+        )
+'''
+
+WRAPPED_0_8 = "stream_wrapper(r, session, stream_chunks_handler)"
+HANDLER_0_6 = "stream_chunks_handler(r.content)"
+
+
+def upstream(body: str) -> str:
+    return UPSTREAM.replace("{body}", body)
+
+
+def patch(text: str):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        patched = patch_openai_router.patch(text)
+    compile(patched, "openai.py", "exec")
+    return patched, out.getvalue()
+
+
+class TestPatchOpenAIRouter(unittest.TestCase):
+    def test_stream_wrapper_body(self):
+        patched, output = patch(upstream(WRAPPED_0_8))
+        self.assertEqual(output, "")
+        self.assertIn(
+            "                stream_wrapper(\n"
+            "                    r,\n"
+            "                    session,\n"
+            "                    open_persona_sse.sidecar_stream\n"
+            "                    if open_persona_sse.use_passthrough(url)\n"
+            "                    else stream_chunks_handler,\n"
+            "                ),\n",
+            patched,
+        )
+        # Only generate_chat_completion's body is touched.
+        self.assertIn("            stream_wrapper(r, session),\n", patched)
+        self.assertIn("open_persona_http.sidecar_session(url, open_persona_slot, open_persona_ticket)", patched)
+        self.assertEqual(patch(patched)[0], patched)
+
+    def test_stream_chunks_handler_body(self):
+        patched, _ = patch(upstream(HANDLER_0_6))
+        self.assertIn(
+            "                    open_persona_sse.sidecar_stream(r.content)\n"
+            "                    if open_persona_sse.use_passthrough(url)\n"
+            "                    else stream_chunks_handler(r.content)\n",
+            patched,
+        )
+        self.assertEqual(patch(patched)[0], patched)
+
+    def test_unknown_body_keeps_upstream_relay(self):
+        body = "stream_wrapper(r, session, handler=stream_chunks_handler)"
+        patched, output = patch(upstream(body))
+        self.assertIn("keeping upstream's SSE relay", output)
+        self.assertIn(f"                {body},\n", patched)
+        self.assertNotIn("open_persona_sse.sidecar_stream", patched)
+        # Everything else is still patched.
+        self.assertIn("open_persona_forwarding.resolve_sidecar_headers", patched)
+        self.assertIn("open_persona_forwarding.response_headers(r.headers, url)", patched)
+
+    def test_missing_required_anchor_fails(self):
+        with self.assertRaises(SystemExit):
+            patch_openai_router.patch(upstream(WRAPPED_0_8).replace("headers, cookies = await", "headers = await"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import pathlib
+import re
+import shutil
+import tempfile
+import types
+import unittest
+
+import patch_frontend
+import patch_openwebui
+
+
+class TestPatchRunner(unittest.TestCase):
+    def setUp(self):
+        self.tmp = pathlib.Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp)
+        self.file = self.tmp / "router.py"
+        self.file.write_text("import os\n\ndef handler():\n    pass\n", encoding="utf-8")
+        self.calls = 0
+
+        def patch(text):
+            self.calls += 1
+            return text.replace("    pass\n", "    pass\n    patched()\n")
+
+        module = types.SimpleNamespace(
+            __file__=__file__,
+            TARGET=self.file,
+            ANCHORS={"handler": "def handler():\n", "os import": re.compile(r"^import os$", re.M), "gone": "nope"},
+            patch=patch,
+        )
+        self.target = patch_openwebui.Target("router", module)
+        self.cache = self.tmp / "cache"
+
+    def run_target(self, **kwargs):
+        return patch_openwebui.run_target(self.target, cache_dir=self.cache, **kwargs)
+
+    def test_reports_anchors_and_reuses_cache(self):
+        first = self.run_target()
+        self.assertEqual(first["status"], "applied")
+        self.assertEqual(first["anchors"], {"handler": True, "os import": True, "gone": False})
+        self.assertIn("patched()", self.file.read_text())
+
+        # A fresh copy of the same upstream file (e.g. a rebuild) comes from the cache.
+        self.file.write_text("import os\n\ndef handler():\n    pass\n", encoding="utf-8")
+        second = self.run_target()
+        self.assertEqual((second["status"], self.calls), ("cached", 1))
+        self.assertEqual(second["sha256"], first["sha256"])
+        self.assertIn("patched()", self.file.read_text())
+        self.assertIn("gone=MISSING", patch_openwebui.format_result(second))
+
+    def test_compiles_patched_python(self):
+        result = self.run_target()
+        self.assertTrue(result["bytecode"])
+        self.assertTrue(list((self.tmp / "__pycache__").glob("router.*.pyc")))
+
+    def test_syntax_error_fails_the_build(self):
+        self.target.module.patch = lambda text: text + "def broken(:\n"
+        with self.assertRaises(SystemExit):
+            self.run_target()
+
+    def test_check_writes_nothing(self):
+        result = self.run_target(check=True)
+        self.assertEqual((result["status"], self.calls), ("checked", 0))
+        self.assertNotIn("patched()", self.file.read_text())
+        self.assertFalse(self.cache.exists())
+
+
+class TestFrontendPatch(unittest.TestCase):
+    def test_injects_once_before_last_body_close(self):
+        html = "<html><body><p>&lt;/body&gt;</p></body></html>"
+        patched = patch_frontend.patch(html)
+        self.assertTrue(patched.endswith("</script>\n\n</body></html>"))
+        self.assertEqual(patch_frontend.patch(patched), patched)
+
+    def test_missing_body_fails(self):
+        with self.assertRaises(SystemExit):
+            patch_frontend.patch("<html></html>")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import open_persona_prewarm as prewarm
+import open_persona_provider_cache as pc
+import open_persona_seed as seed
+
+USER_KEY = "user-openai-key"
+
+
+class Sidecar(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200 if self.path == "/healthz" else 404)
+        self.end_headers()
+
+    def do_POST(self):
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            server.requests.append((self.path, dict((k.lower(), v) for k, v in self.headers.items())))
+        time.sleep(0.02)
+        with server.lock:
+            server.active -= 1
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b'{"ok": true}')
+
+    def log_message(self, *args):
+        pass
+
+
+class TestPrewarm(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.db = seed.Database("", os.path.join(tmp, "webui.db"))
+        self.addCleanup(self.db.close)
+        settings = {"tools": {"valves": {pc.USER_TOOL_ID: {"openai_api_key": USER_KEY}}}}
+        with self.db.transaction() as cur:
+            cur.execute('CREATE TABLE "user" (id TEXT PRIMARY KEY, settings TEXT, last_active_at BIGINT)')
+            cur.execute("CREATE TABLE tool (id TEXT PRIMARY KEY, valves TEXT)")
+            cur.executemany(
+                'INSERT INTO "user" (id, settings, last_active_at) VALUES (?, ?, ?)',
+                [("old", None, 100), ("new", json.dumps(settings), 300), ("mid", "{}", 200), ("never", None, None)],
+            )
+            cur.execute(
+                "INSERT INTO tool (id, valves) VALUES (?, ?)",
+                (pc.ADMIN_TOOL_ID, json.dumps({"anthropic_api_key": "admin-anthropic-key"})),
+            )
+
+    def test_most_recently_active_users_with_their_valves(self):
+        with self.db.read_transaction() as cur:
+            users = prewarm.recent_users(cur, 2)
+            tool_valves = prewarm.admin_valves(cur)
+        self.assertEqual(users, [("new", {"openai_api_key": USER_KEY}), ("mid", {})])
+        self.assertEqual(tool_valves, {"anthropic_api_key": "admin-anthropic-key"})
+
+    def test_headers_match_a_real_request(self):
+        tool_valves, user_valves = {"anthropic_api_key": "admin-anthropic-key"}, {"openai_api_key": USER_KEY}
+        headers = prewarm.warmup_headers("new", tool_valves, user_valves, api_key="sidecar-key")
+        keys = pc.resolve_provider_keys("new", load=lambda _: (tool_valves, user_valves), key_cache=pc.ProviderKeyCache())
+        for name, value in keys.headers().items():
+            self.assertEqual(headers[name], value)
+        self.assertEqual(headers["x-openwebui-user-id"], "new")
+        self.assertEqual(headers["Authorization"], "Bearer sidecar-key")
+
+    def test_sidecar_target(self):
+        env = {"OPENAI_API_BASE_URLS": "https://api.openai.com/v1;http://open-persona-sidecar:8000/v1/", "OPENAI_API_KEYS": "a;b"}
+        self.assertEqual(prewarm.sidecar_target(env), ("http://open-persona-sidecar:8000/v1", "b"))
+        self.assertEqual(prewarm.sidecar_target({"OPENAI_API_BASE_URLS": "https://api.openai.com/v1"}), (None, ""))
+        self.assertEqual(prewarm.sidecar_target({"OPEN_PERSONA_PREWARM_URL": "http://localhost:8000/v1"})[0], "http://localhost:8000/v1")
+
+    def test_prewarm_is_bounded_and_sends_identity(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), Sidecar)
+        server.lock, server.active, server.max_active, server.requests = threading.Lock(), 0, 0, []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+        self.assertTrue(prewarm.wait_for_sidecar(base_url, wait_seconds=0))
+        users = [(f"u{i}", {}) for i in range(6)]
+        self.assertEqual(prewarm.prewarm(base_url, "", users, {}, concurrency=2), {"warmed": 6, "failed": 0})
+        self.assertLessEqual(server.max_active, 2)
+        self.assertEqual({path for path, _ in server.requests}, {"/v1/warmup"})
+        self.assertEqual(sorted(h["x-openwebui-user-id"] for _, h in server.requests), [u for u, _ in users])
+
+    def test_sidecar_down_is_skipped_quietly(self):
+        self.assertFalse(prewarm.wait_for_sidecar("http://127.0.0.1:9/v1", wait_seconds=0))
+        self.assertEqual(prewarm.prewarm("http://127.0.0.1:9/v1", "", [("u1", {})], {}), {"warmed": 0, "failed": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
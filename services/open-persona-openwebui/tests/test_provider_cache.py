@@ -0,0 +1,104 @@
+import unittest
+
+import open_persona_provider_cache as pc
+from helpers import FakeClock
+
+
+class FakeValves:
+    def __init__(self, tool_valves=None, user_valves=None):
+        self.tool_valves = tool_valves or {}
+        self.user_valves = user_valves or {}
+        self.calls = 0
+
+    def __call__(self, user_id):
+        self.calls += 1
+        return self.tool_valves, self.user_valves.get(user_id, {})
+
+
+class TestProviderKeyCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock(0.0)
+        self.cache = pc.ProviderKeyCache(max_users=2, ttl_seconds=10, clock=self.clock)
+        self.valves = FakeValves(
+            tool_valves={"openai_api_key": "sk-admin"},
+            user_valves={"u1": {"openai_api_key": "sk-u1\r\n", "openrouter_api_key": "or-u1"}},
+        )
+
+    def resolve(self, user_id):
+        return pc.resolve_provider_keys(user_id, load=self.valves, key_cache=self.cache)
+
+    def test_user_override_and_sanitize(self):
+        keys = self.resolve("u1")
+        self.assertEqual(keys.openai_api_key, "sk-u1")
+        self.assertEqual(
+            keys.headers(),
+            {"x-openpersona-openai-api-key": "sk-u1", "x-openpersona-openrouter-api-key": "or-u1"},
+        )
+        self.assertEqual(self.resolve("u2").openai_api_key, "sk-admin")
+
+    def test_signature(self):
+        keys = self.resolve("u1")
+        signature = pc.sign_keys(keys[:3], "secret")
+        self.assertEqual(len(signature), 64)
+        self.assertEqual(signature, pc.sign_keys(("sk-u1", "", "or-u1"), "secret"))
+        self.assertNotEqual(signature, pc.sign_keys(("sk-u1", "", "or-u2"), "secret"))
+        self.assertNotEqual(signature, pc.sign_keys(keys[:3], "other-secret"))
+        self.assertEqual(pc.sign_keys(keys[:3], ""), "")
+        for key in keys[:3]:
+            if key:
+                self.assertNotIn(key, signature)
+
+        signed = keys._replace(signature=signature)
+        self.assertEqual(signed.headers()[pc.SIGNATURE_HEADER], signature)
+        self.assertNotIn(pc.SIGNATURE_HEADER, keys._replace(signature="").headers())
+
+    def test_hit_miss_and_ttl(self):
+        self.resolve("u1")
+        self.resolve("u1")
+        self.assertEqual(self.valves.calls, 1)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+        self.clock.now = 11
+        self.resolve("u1")
+        self.assertEqual(self.valves.calls, 2)
+
+    def test_lru_bound(self):
+        for uid in ("u1", "u2", "u3"):
+            self.resolve(uid)
+        self.assertEqual(self.cache.stats()["size"], 2)
+        self.resolve("u1")
+        self.assertEqual(self.valves.calls, 4)
+
+    def test_user_valve_write_invalidates_that_user(self):
+        self.resolve("u1")
+        self.resolve("u2")
+        self.valves.user_valves["u1"] = {"openai_api_key": "sk-rotated"}
+        pc.invalidate(pc.USER_TOOL_ID, "u1", key_cache=self.cache)
+        self.assertEqual(self.resolve("u1").openai_api_key, "sk-rotated")
+        self.resolve("u2")
+        self.assertEqual(self.valves.calls, 3)
+
+    def test_admin_valve_write_clears_all(self):
+        self.resolve("u2")
+        self.valves.tool_valves = {"openai_api_key": "sk-admin-2"}
+        pc.invalidate(pc.ADMIN_TOOL_ID, key_cache=self.cache)
+        self.assertEqual(self.resolve("u2").openai_api_key, "sk-admin-2")
+
+    def test_unrelated_tool_write_keeps_cache(self):
+        self.resolve("u1")
+        pc.invalidate("some_other_tool", "u1", key_cache=self.cache)
+        self.resolve("u1")
+        self.assertEqual(self.valves.calls, 1)
+
+    def test_stale_load_is_not_stored(self):
+        def racing_load(user_id):
+            # A valve write lands while this lookup is reading the DB.
+            pc.invalidate(pc.USER_TOOL_ID, user_id, key_cache=self.cache)
+            return {}, {"openai_api_key": "sk-old"}
+
+        pc.resolve_provider_keys("u1", load=racing_load, key_cache=self.cache)
+        self.assertEqual(self.cache.stats()["size"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
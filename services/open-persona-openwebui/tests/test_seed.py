@@ -0,0 +1,173 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import open_persona_seed as seed
+
+SCHEMA = [
+    'CREATE TABLE "user" (id TEXT PRIMARY KEY, role TEXT)',
+    'CREATE TABLE "group" ('
+    "id TEXT PRIMARY KEY, user_id TEXT, name TEXT, description TEXT, "
+    "data JSON, meta JSON, permissions JSON, created_at BIGINT, updated_at BIGINT)",
+    "CREATE TABLE group_member ("
+    "id TEXT PRIMARY KEY, group_id TEXT NOT NULL, user_id TEXT NOT NULL, created_at BIGINT, updated_at BIGINT)",
+    "CREATE TABLE tool ("
+    "id TEXT PRIMARY KEY, user_id TEXT, name TEXT, content TEXT, specs TEXT, meta TEXT, "
+    "created_at BIGINT, updated_at BIGINT, valves TEXT, access_control JSON)",
+]
+TABLES = ("tool", "group_member", '"group"', '"user"')
+
+
+def postgres_url():
+    """A Postgres to test against: OPEN_PERSONA_TEST_DATABASE_URL, else a local pgserver stand-in."""
+    url = os.environ.get("OPEN_PERSONA_TEST_DATABASE_URL")
+    if url:
+        return url
+    try:
+        import pgserver
+        import psycopg2  # noqa: F401
+    except ImportError:
+        return None
+    global _pg_server
+    if "_pg_server" not in globals():
+        _pg_server = pgserver.get_server(tempfile.mkdtemp(prefix="open-persona-pg-"), cleanup_mode="stop")
+    return _pg_server.get_uri()
+
+
+def create_schema(db):
+    with db.transaction() as cur:
+        for table in TABLES:
+            cur.execute(f"DROP TABLE IF EXISTS {table}")
+        for statement in SCHEMA:
+            cur.execute(statement)
+        cur.executemany(
+            'INSERT INTO "user" (id, role) VALUES (?, ?)',
+            [("a1", "admin"), ("a2", "admin"), ("u1", "user")],
+        )
+
+
+class SeedTests:
+    """Seeding checks shared by the dialects; subclasses provide `make_db()`."""
+
+    def setUp(self):
+        self.db = self.make_db()
+        create_schema(self.db)
+
+    def tearDown(self):
+        self.db.close()
+
+    def run_seed(self, user_content="user tool", admin_content="admin tool"):
+        with self.db.transaction(lock_key=seed.SEED_LOCK_KEY) as cur:
+            return seed.seed(cur, user_content, admin_content, {})
+
+    def execute(self, sql, params=()):
+        with self.db.transaction() as cur:
+            cur.execute(sql, params)
+            return cur.fetchall() if sql.lstrip().upper().startswith("SELECT") else None
+
+    def tool_row(self, tool_id):
+        return self.execute("SELECT updated_at, meta, access_control FROM tool WHERE id = ?", (tool_id,))[0]
+
+    def test_first_run_creates_everything(self):
+        summary = self.run_seed()
+        self.assertTrue(summary["group_created"])
+        self.assertEqual(summary["members_added"], 2)
+        self.assertEqual(summary[seed.USER_TOOL_ID], "inserted")
+        self.assertEqual(summary[seed.ADMIN_TOOL_ID], "inserted")
+        _, meta, access_control = self.tool_row(seed.ADMIN_TOOL_ID)
+        self.assertIn(seed.CONTENT_HASH_KEY, json.loads(meta))
+        if isinstance(access_control, str):
+            access_control = json.loads(access_control)
+        self.assertEqual(access_control["read"]["group_ids"], [seed.ADMIN_GROUP_ID])
+
+    def test_second_run_is_a_no_op(self):
+        self.run_seed()
+        self.execute("UPDATE tool SET updated_at = 1")
+        summary = self.run_seed()
+        self.assertFalse(summary["group_created"])
+        self.assertEqual(summary["members_added"], 0)
+        self.assertEqual(summary[seed.USER_TOOL_ID], "unchanged")
+        self.assertEqual(self.tool_row(seed.USER_TOOL_ID)[0], 1)
+
+    def test_changed_content_is_rewritten(self):
+        self.run_seed()
+        self.execute("UPDATE tool SET updated_at = 1")
+        summary = self.run_seed(admin_content="admin tool v2")
+        self.assertEqual(summary[seed.USER_TOOL_ID], "unchanged")
+        self.assertEqual(summary[seed.ADMIN_TOOL_ID], "updated")
+        self.assertGreater(self.tool_row(seed.ADMIN_TOOL_ID)[0], 1)
+
+    def test_membership_set_diff_keeps_existing_members(self):
+        self.run_seed()
+        # Member added through the UI with its own id, plus a new admin.
+        self.execute(
+            "INSERT INTO group_member (id, group_id, user_id) VALUES ('uuid-1', ?, 'u1')", (seed.ADMIN_GROUP_ID,)
+        )
+        self.execute("INSERT INTO \"user\" (id, role) VALUES ('a3', 'admin')")
+        self.assertEqual(self.run_seed()["members_added"], 1)
+        members = {r[0] for r in self.execute("SELECT user_id FROM group_member")}
+        self.assertEqual(members, {"a1", "a2", "a3", "u1"})
+
+    def test_failed_seed_rolls_back(self):
+        with self.assertRaises(RuntimeError):
+            with self.db.transaction(lock_key=seed.SEED_LOCK_KEY) as cur:
+                seed.seed(cur, "user tool", "admin tool", {})
+                raise RuntimeError("boom")
+        self.assertEqual(self.execute("SELECT id FROM tool"), [])
+
+    def test_read_transaction_reads_without_the_write_lock(self):
+        with self.db.read_transaction() as cur:
+            cur.execute('SELECT id FROM "user" ORDER BY id')
+            self.assertEqual([r[0] for r in cur.fetchall()], ["a1", "a2", "u1"])
+            # A writer still gets its lock while the read is open (rolled back here:
+            # on SQLite its commit would wait for the reader).
+            with self.assertRaises(RuntimeError):
+                with self.db.transaction() as writer:
+                    writer.execute("INSERT INTO \"user\" (id, role) VALUES ('a3', 'admin')")
+                    raise RuntimeError("rollback")
+
+    def test_read_transaction_rejects_writes(self):
+        with self.assertRaises(Exception):
+            with self.db.read_transaction() as cur:
+                cur.execute("INSERT INTO \"user\" (id, role) VALUES ('a3', 'admin')")
+        self.assertEqual(len(self.execute('SELECT id FROM "user"')), 3)
+
+
+class TestSeedSqlite(SeedTests, unittest.TestCase):
+    def make_db(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        return seed.Database("", os.path.join(self.tmp, "webui.db"))
+
+    def setUp(self):
+        self.db = self.make_db()
+        open(self.db.sqlite_path, "w").close()
+        create_schema(self.db)
+
+    def test_has_table(self):
+        with self.db.transaction() as cur:
+            self.assertTrue(cur.has_table("tool"))
+            self.assertFalse(cur.has_table("nope"))
+
+
+class TestSeedPostgres(SeedTests, unittest.TestCase):
+    def make_db(self):
+        url = postgres_url()
+        if not url:
+            self.skipTest("no Postgres available (set OPEN_PERSONA_TEST_DATABASE_URL or install pgserver)")
+        return seed.Database(url)
+
+
+class TestDatabaseUrl(unittest.TestCase):
+    def test_dialect_detection(self):
+        self.assertEqual(seed.Database("", "/tmp/x.db").sqlite_path, "/tmp/x.db")
+        self.assertEqual(seed.Database("sqlite:////data/webui.db").sqlite_path, "/data/webui.db")
+        pg = seed.Database("postgresql+psycopg2://u:p@db:5432/webui")
+        self.assertEqual((pg.dialect, pg.dsn), ("postgres", "postgresql://u:p@db:5432/webui"))
+        self.assertEqual(seed.Database("postgres://u@db/webui").dialect, "postgres")
+
+
+if __name__ == '__main__':
+    unittest.main()
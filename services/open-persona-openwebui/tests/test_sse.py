@@ -0,0 +1,87 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+import open_persona_sse as sse
+
+
+def event(content: str, separator: bytes = b"\n\n") -> bytes:
+    return b"data: " + json.dumps({"choices": [{"delta": {"content": content}}]}).encode() + separator
+
+
+async def _aiter(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def relay(chunks, **kwargs) -> list:
+    async def collect():
+        return [item async for item in sse.relay(_aiter(chunks), **kwargs)]
+
+    return asyncio.run(collect())
+
+
+class TestRelay(unittest.TestCase):
+    def test_whole_event_reads_pass_through_unchanged(self):
+        chunks = [event("a"), event("b"), b"data: [DONE]\n\n"]
+        items = relay(chunks)
+        self.assertEqual(items, chunks)
+        self.assertIs(items[0], chunks[0])
+
+    def test_events_split_and_merged_across_reads(self):
+        stream = event("a") + event("b") + event("c") + b"data: [DONE]\n\n"
+        for size in (1, 3, 7, 64, len(stream)):
+            chunks = [stream[i : i + size] for i in range(0, len(stream), size)]
+            self.assertEqual(relay(chunks), [event("a"), event("b"), event("c"), b"data: [DONE]\n\n"], size)
+
+    def test_crlf_and_cr_separators(self):
+        for separator in (b"\r\n\r\n", b"\r\r", b"\n\r\n"):
+            events = [event("a", separator), event("b", separator), b"data: [DONE]" + separator]
+            stream = b"".join(events)
+            for size in (1, 2, 3, 5, len(stream)):
+                chunks = [stream[i : i + size] for i in range(0, len(stream), size)]
+                self.assertEqual(relay(chunks), events, (separator, size))
+
+    def test_crlf_line_end_is_not_a_separator(self):
+        items = relay([b'data: {"a": 1}\r\n', b'data: {"b": 2}\r\n\r\n'])
+        self.assertEqual(items, [b'data: {"a": 1}\n', b'data: {"b": 2}\n', b"\n"])
+
+    def test_separator_split_across_reads_while_skipping(self):
+        for separator in (b"\n\n", b"\r\n\r\n", b"\r\r"):
+            big = event("x" * 100, separator)
+            for cut in range(1, len(separator)):
+                chunks = [big[:-cut], big[-cut:] + event("b", separator)]
+                self.assertEqual(
+                    relay(chunks, max_event_size=60), [sse.OVERSIZED_EVENT, event("b", separator)], (separator, cut)
+                )
+
+    def test_items_parse_like_middleware_lines(self):
+        # Open WebUI's middleware strips the item and json-loads what follows `data:`.
+        for item in relay([event("x\n\ny") + event("z")]):
+            text = item.decode().strip()
+            self.assertTrue(text.startswith("data:"))
+            json.loads(text[len("data:") :].strip())
+
+    def test_multi_line_event_is_split_into_lines(self):
+        items = relay([b'data: {"a": 1}\ndata: {"b": 2}\n\n'])
+        self.assertEqual(items, [b'data: {"a": 1}\n', b'data: {"b": 2}\n', b"\n"])
+
+    def test_trailing_partial_event_is_flushed(self):
+        self.assertEqual(relay([event("a"), b"data: [DONE]"]), [event("a"), b"data: [DONE]\n\n"])
+
+    def test_oversized_event_is_replaced(self):
+        big = event("x" * 100)
+        chunks = [event("a"), big[:40], big[40:80], big[80:] + event("b")]
+        self.assertEqual(relay(chunks, max_event_size=60), [event("a"), sse.OVERSIZED_EVENT, event("b")])
+        self.assertEqual(relay([big + event("b")], max_event_size=60), [sse.OVERSIZED_EVENT, event("b")])
+
+    def test_only_for_sidecar_urls(self):
+        self.assertTrue(sse.use_passthrough("http://open-persona-sidecar:8000/v1"))
+        self.assertFalse(sse.use_passthrough("https://api.openai.com/v1"))
+        with mock.patch.object(sse, "PASSTHROUGH", False):
+            self.assertFalse(sse.use_passthrough("http://open-persona-sidecar:8000/v1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import json
+import os
+import pathlib
+import shutil
+import sys
+import tempfile
+import unittest
+
+import open_persona_metrics
+import open_persona_startup as startup
+import patch_main
+
+MAIN = (
+    "import os\n"
+    "\n"
+    "@asynccontextmanager\n"
+    "async def lifespan(app: FastAPI):\n"
+    "    start_logger()\n"
+    "\n"
+    "    yield\n"
+    "\n"
+    "    stop()\n"
+    "\n"
+    'app.include_router(tools.router, prefix="/api/v1/tools", tags=["tools"])\n'
+)
+
+
+class TestStartupReport(unittest.TestCase):
+    def setUp(self):
+        self.marks = dict(startup.marks)
+        self.imports = dict(startup.import_seconds)
+        startup.marks.clear()
+        startup.import_seconds.clear()
+
+        def restore():
+            startup.marks.clear()
+            startup.marks.update(self.marks)
+            startup.import_seconds.clear()
+            startup.import_seconds.update(self.imports)
+
+        self.addCleanup(restore)
+
+    def test_parses_script_marks(self):
+        marks = startup.parse_script_marks("script_start=100,5;deps=101.25;bogus;=3;seed=x;exec=102")
+        self.assertEqual(marks, [("script_start", 100.5), ("deps", 101.25), ("exec", 102.0)])
+        self.assertEqual(startup.parse_script_marks(""), [])
+
+    def test_phases_from_script_to_ready(self):
+        startup.marks.update({"main": 103.0, "lifespan": 106.0, "ready": 106.5})
+        startup.import_seconds["open_webui.routers.openai"] = 0.75
+        data = startup.report({"OPEN_PERSONA_STARTUP_MARKS": "script_start=100;deps=100.5;secret_key=101;exec=102"})
+
+        self.assertEqual(
+            data["phases"],
+            {
+                "deps": 0.5,
+                "secret_key": 0.5,
+                "exec": 1.0,
+                "interpreter": 1.0,
+                "import": 3.0,
+                "lifespan": 0.5,
+                "healthy": 6.5,
+            },
+        )
+        self.assertEqual(data["imports"], {"open_webui.routers.openai": 0.75})
+        self.assertIn("healthy=6500ms", startup.format_report(data))
+        self.assertIn("openai=750ms", startup.format_report(data))
+
+    def test_without_script_marks_healthy_starts_at_main(self):
+        startup.marks.update({"main": 10.0, "lifespan": 12.0, "ready": 13.0})
+        data = startup.report({})
+        self.assertEqual(data["phases"], {"import": 2.0, "lifespan": 1.0, "healthy": 3.0})
+
+    def test_ready_writes_report_and_metrics(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, "report.json")
+        startup.mark("main")
+        startup.import_seconds["open_webui.routers.tools"] = 0.25
+
+        data = startup.ready(path)
+        with open(path, encoding="utf-8") as f:
+            self.assertEqual(json.load(f), data)
+        self.assertIn("healthy", data["phases"])
+
+        text = open_persona_metrics.render()
+        self.assertIn('open_persona_startup_phase_seconds{phase="healthy"}', text)
+        self.assertIn('open_persona_startup_import_seconds{module="open_webui.routers.tools"} 0.25', text)
+
+
+class TestImportTimer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp)
+        pathlib.Path(self.tmp, "op_startup_probe.py").write_text("VALUE = 42\n", encoding="utf-8")
+        sys.path.insert(0, self.tmp)
+        self.addCleanup(sys.path.remove, self.tmp)
+        self.addCleanup(sys.modules.pop, "op_startup_probe", None)
+        self.addCleanup(startup.import_seconds.pop, "op_startup_probe", None)
+
+    def test_times_first_import_and_uninstalls(self):
+        before = list(sys.meta_path)
+        startup.install_import_timer(["op_startup_probe"])
+        import op_startup_probe
+
+        self.assertEqual(op_startup_probe.VALUE, 42)
+        self.assertGreaterEqual(startup.import_seconds["op_startup_probe"], 0.0)
+        self.assertEqual(sys.meta_path, before)
+
+    def test_already_imported_modules_are_not_timed(self):
+        before = list(sys.meta_path)
+        startup.install_import_timer(["json"])
+        self.assertEqual(sys.meta_path, before)
+
+
+class TestMainPatch(unittest.TestCase):
+    def test_marks_main_lifespan_and_ready_once(self):
+        patched = patch_main.patch(MAIN)
+        self.assertTrue(patched.startswith(patch_main.STARTUP_HEAD))
+        self.assertIn(patch_main.LIFESPAN + patch_main.LIFESPAN_START + "    start_logger()\n", patched)
+        self.assertIn("\n" + patch_main.READY + "    yield\n" + patch_main.SHUTDOWN, patched)
+        self.assertEqual(patch_main.patch(patched), patched)
+        compile(patched, "main.py", "exec")
+
+
+if __name__ == '__main__':
+    unittest.main()
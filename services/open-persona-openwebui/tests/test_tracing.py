@@ -0,0 +1,133 @@
+import asyncio
+import importlib.util
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import open_persona_executor
+import open_persona_forwarding as fwd
+import open_persona_tracing as tracing
+
+HAS_OTEL = importlib.util.find_spec("opentelemetry") is not None
+
+PARENT = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+
+
+class TestTraceparent(unittest.TestCase):
+    def test_parse(self):
+        self.assertEqual(
+            tracing.parse_traceparent(PARENT),
+            ("4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7", 1),
+        )
+
+    def test_rejects_invalid(self):
+        for value in (
+            None,
+            "",
+            "garbage",
+            "01-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01",
+            "00-" + "0" * 32 + "-00f067aa0ba902b7-01",
+            "00-4bf92f3577b34da6a3ce929d0e0e4736-" + "0" * 16 + "-01",
+        ):
+            self.assertIsNone(tracing.parse_traceparent(value), value)
+
+
+class TestSpan(unittest.TestCase):
+    def test_disabled_is_a_shared_noop(self):
+        ctx = tracing.span("x", {"traceparent": PARENT}, enabled=False)
+        self.assertIs(ctx, tracing.span("y", enabled=False))
+        with ctx as span:
+            self.assertIsNone(span)
+
+    def test_child_of_incoming_traceparent(self):
+        exporter = tracing.JsonLinesExporter(mode="propagate")
+        headers = {"Traceparent": PARENT, "tracestate": "vendor=abc"}
+        with tracing.span("stage", headers, enabled=True, span_exporter=exporter) as span:
+            pass
+        self.assertEqual(span.trace_id, "4bf92f3577b34da6a3ce929d0e0e4736")
+        self.assertEqual(span.parent_span_id, "00f067aa0ba902b7")
+        self.assertNotEqual(span.span_id, "00f067aa0ba902b7")
+        out = span.headers()
+        self.assertEqual(out["traceparent"], f"00-{span.trace_id}-{span.span_id}-01")
+        self.assertEqual(out["tracestate"], "vendor=abc")
+
+    def test_new_trace_without_parent(self):
+        exporter = tracing.JsonLinesExporter(mode="propagate")
+        with mock.patch.object(tracing, "_otel_parent", return_value=None):
+            with tracing.span("stage", {"tracestate": "ignored=1"}, enabled=True, span_exporter=exporter) as span:
+                pass
+        self.assertIsNone(span.parent_span_id)
+        self.assertIsNotNone(tracing.parse_traceparent(span.traceparent()))
+        self.assertNotIn("tracestate", span.headers())
+
+    def test_file_export_is_otlp_json(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "traces.jsonl")
+            exporter = tracing.JsonLinesExporter(mode="file", path=path)
+            with tracing.span("stage", {"traceparent": PARENT}, enabled=True, span_exporter=exporter) as span:
+                span.set_attribute("open_persona.original_model_id", "persona-a")
+            with self.assertRaises(RuntimeError):
+                with tracing.span("failing", None, enabled=True, span_exporter=exporter):
+                    raise RuntimeError("boom")
+            with open(path, encoding="utf-8") as f:
+                docs = [json.loads(line) for line in f]
+
+        self.assertEqual(len(docs), 2)
+        resource = docs[0]["resourceSpans"][0]
+        self.assertEqual(resource["resource"]["attributes"][0]["value"]["stringValue"], tracing.SERVICE_NAME)
+        exported = resource["scopeSpans"][0]["spans"][0]
+        self.assertEqual(exported["traceId"], span.trace_id)
+        self.assertEqual(exported["parentSpanId"], "00f067aa0ba902b7")
+        self.assertLessEqual(int(exported["startTimeUnixNano"]), int(exported["endTimeUnixNano"]))
+        self.assertEqual(
+            exported["attributes"],
+            [{"key": "open_persona.original_model_id", "value": {"stringValue": "persona-a"}}],
+        )
+        failed = docs[1]["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+        self.assertEqual(failed["status"], {"code": 2, "message": "RuntimeError"})
+
+
+class TestSidecarHeaders(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(fwd.open_persona_provider_cache, "resolve_provider_keys", return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_no_trace_headers_when_disabled(self):
+        with mock.patch.object(tracing, "ENABLED", False):
+            headers = fwd.resolve_sidecar_headers("u1", "persona-a", trace_headers={"traceparent": PARENT})
+        self.assertNotIn("traceparent", headers)
+        self.assertEqual(headers["x-openpersona-original-model-id"], "persona-a")
+
+    def test_traceparent_joins_incoming_trace(self):
+        with mock.patch.object(tracing, "ENABLED", True), mock.patch.object(tracing, "MODE", "propagate"):
+            headers = fwd.resolve_sidecar_headers("u1", "persona-a", trace_headers={"traceparent": PARENT})
+        trace_id, span_id, flags = tracing.parse_traceparent(headers["traceparent"])
+        self.assertEqual(trace_id, "4bf92f3577b34da6a3ce929d0e0e4736")
+        self.assertNotEqual(span_id, "00f067aa0ba902b7")
+        self.assertEqual(headers["x-openwebui-user-id"], "u1")
+
+    @unittest.skipUnless(HAS_OTEL, "opentelemetry not installed")
+    def test_otel_span_is_parent_on_the_header_pool(self):
+        from opentelemetry import trace
+        from opentelemetry.trace import NonRecordingSpan, SpanContext, TraceFlags
+
+        parent = SpanContext(0x4BF92F3577B34DA6A3CE929D0E0E4736, 0x00F067AA0BA902B7, False, TraceFlags(1))
+
+        async def scenario():
+            # As in Open WebUI's request handler: the span is current on the event loop,
+            # and the headers are built on the Open Persona pool.
+            with trace.use_span(NonRecordingSpan(parent)):
+                return await open_persona_executor.run_blocking(fwd.resolve_sidecar_headers, "u1", "persona-a")
+
+        with mock.patch.object(tracing, "ENABLED", True), mock.patch.object(tracing, "MODE", "propagate"):
+            headers = asyncio.run(scenario())
+        trace_id, _, flags = tracing.parse_traceparent(headers["traceparent"])
+        self.assertEqual(trace_id, "4bf92f3577b34da6a3ce929d0e0e4736")
+        self.assertEqual(flags, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
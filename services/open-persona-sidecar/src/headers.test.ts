@@ -0,0 +1,211 @@
+import crypto from "node:crypto";
+import zlib from "node:zlib";
+
+import { describe, expect, it } from "vitest";
+
+import {
+  InvalidKeySignatureError,
+  metaFromHeaders,
+  providerKeysFromHeaders,
+  runnerKeySignature,
+  signProviderKeys,
+  traceContextHeaders,
+  verifiedKeySignature,
+  warmupHandler,
+  type ProviderKeys
+} from "./headers.js";
+
+function request(headers: Record<string, string>) {
+  const lower = Object.fromEntries(Object.entries(headers).map(([k, v]) => [k.toLowerCase(), v]));
+  return { header: (name: string) => lower[name.toLowerCase()] };
+}
+
+function response() {
+  const res = {
+    statusCode: 200,
+    body: undefined as unknown,
+    status(code: number) {
+      res.statusCode = code;
+      return res;
+    },
+    json(body: unknown) {
+      res.body = body;
+      return res;
+    }
+  };
+  return res;
+}
+
+const SECRET = "shared-secret";
+
+function signedHeaders(keys: [string, string, string], secret = SECRET): Record<string, string> {
+  const headers: Record<string, string> = {
+    "x-openpersona-provider-key-sig": signProviderKeys(secret, keys)
+  };
+  if (keys[0]) headers["x-openpersona-openai-api-key"] = keys[0];
+  if (keys[1]) headers["x-openpersona-anthropic-api-key"] = keys[1];
+  if (keys[2]) headers["x-openpersona-openrouter-api-key"] = keys[2];
+  return headers;
+}
+
+describe("provider key signature", () => {
+  it("matches the Open WebUI side (HMAC-SHA256 over NUL-joined keys)", () => {
+    const expected = crypto.createHmac("sha256", SECRET).update("oa-1\0\0or-1").digest("hex");
+    expect(signProviderKeys(SECRET, ["oa-1", "", "or-1"])).toBe(expected);
+    expect(expected).toHaveLength(64);
+  });
+
+  it("accepts a signature over the forwarded keys", () => {
+    const req = request(signedHeaders(["oa-1", "", "or-1"]));
+    expect(verifiedKeySignature(req, SECRET)).toBe(signProviderKeys(SECRET, ["oa-1", "", "or-1"]));
+  });
+
+  it("rejects a signature borrowed from other keys, a truncated one or a wrong secret", () => {
+    const borrowed = { ...signedHeaders(["oa-victim", "", ""]), "x-openpersona-openai-api-key": "oa-attacker" };
+    expect(() => verifiedKeySignature(request(borrowed), SECRET)).toThrow(InvalidKeySignatureError);
+
+    const truncated = signedHeaders(["oa-1", "", ""]);
+    truncated["x-openpersona-provider-key-sig"] = truncated["x-openpersona-provider-key-sig"].slice(0, 16);
+    expect(() => verifiedKeySignature(request(truncated), SECRET)).toThrow(InvalidKeySignatureError);
+
+    expect(() => verifiedKeySignature(request(signedHeaders(["oa-1", "", ""], "other")), SECRET)).toThrow(
+      InvalidKeySignatureError
+    );
+  });
+
+  it("is ignored without a header or without a secret", () => {
+    expect(verifiedKeySignature(request({}), SECRET)).toBeUndefined();
+    expect(verifiedKeySignature(request(signedHeaders(["oa-1", "", ""])), undefined)).toBeUndefined();
+  });
+});
+
+describe("runner identity", () => {
+  const defaults = { openaiApiKey: "oa-default" };
+
+  it("includes the sidecar's default keys", () => {
+    const req = request({ "x-openpersona-openrouter-api-key": "or-1" });
+    const before = runnerKeySignature(providerKeysFromHeaders(req, defaults));
+    const after = runnerKeySignature(providerKeysFromHeaders(req, { openaiApiKey: "oa-rotated" }));
+    expect(before).not.toBe(after);
+    expect(providerKeysFromHeaders(req, defaults).openaiApiKey).toBe("oa-default");
+  });
+
+  it("does not follow a signature header alone", () => {
+    const victim = providerKeysFromHeaders(request(signedHeaders(["oa-victim", "", ""])), {}, SECRET);
+    // Same user, same (unverifiable) signature, no keys: a different runner.
+    const replay: ProviderKeys = { signature: victim.signature };
+    expect(runnerKeySignature(replay)).not.toBe(runnerKeySignature(victim));
+  });
+
+  it("is resolved once per header tuple", () => {
+    const headers = signedHeaders(["oa-cached", "", ""]);
+    const first = providerKeysFromHeaders(request(headers), defaults, SECRET);
+    expect(first.runnerKey).toBe(runnerKeySignature(first));
+    expect(providerKeysFromHeaders(request({ ...headers }), defaults, SECRET)).toBe(first);
+    // Other defaults or another secret are a different entry.
+    expect(providerKeysFromHeaders(request(headers), {}, SECRET)).not.toBe(first);
+    expect(() => providerKeysFromHeaders(request(headers), defaults, "other")).toThrow(InvalidKeySignatureError);
+  });
+
+  it("does not cache a signature that failed to verify", () => {
+    const forged = { ...signedHeaders(["oa-victim", "", ""]), "x-openpersona-openai-api-key": "oa-attacker" };
+    expect(() => providerKeysFromHeaders(request(forged), {}, SECRET)).toThrow(InvalidKeySignatureError);
+    expect(() => providerKeysFromHeaders(request(forged), {}, SECRET)).toThrow(InvalidKeySignatureError);
+  });
+
+  it("is stable, never contains the keys and fits a DNS label", () => {
+    const keys = providerKeysFromHeaders(request(signedHeaders(["oa-secret-value", "", ""])), {}, SECRET);
+    const sig = runnerKeySignature(keys);
+    expect(sig).toBe(runnerKeySignature({ ...keys }));
+    expect(sig).toMatch(/^[0-9a-f]{16}$/);
+    expect(`open-persona-runner-${"0".repeat(16)}-${sig}`.length).toBeLessThanOrEqual(63);
+  });
+});
+
+describe("persona meta headers", () => {
+  const meta = { persona: { template: "izzy" }, memory: { enabled: false } };
+  const raw = Buffer.from(JSON.stringify(meta), "utf8");
+  const digest = `sha256:${crypto.createHash("sha256").update(raw).digest("hex")}`;
+
+  it("decodes base64 and zlib-compressed meta", () => {
+    expect(metaFromHeaders(request({ "x-openpersona-meta-b64": raw.toString("base64") }))).toEqual(meta);
+    expect(metaFromHeaders(request({ "x-openpersona-meta-z64": zlib.deflateSync(raw).toString("base64") }))).toEqual(
+      meta
+    );
+    expect(metaFromHeaders(request({ "x-openpersona-meta-z64": "not zlib" }))).toBeUndefined();
+    expect(metaFromHeaders(request({}))).toBeUndefined();
+  });
+
+  it("serves a verified digest from the cache", () => {
+    expect(metaFromHeaders(request({ "x-openpersona-meta-b64": raw.toString("base64"), "x-openpersona-meta-digest": digest }))).toEqual(meta);
+    // The next turn may send only the digest.
+    expect(metaFromHeaders(request({ "x-openpersona-meta-digest": digest }))).toEqual(meta);
+  });
+
+  it("does not cache meta under a digest it does not match", () => {
+    const forged = "sha256:" + "0".repeat(64);
+    const other = Buffer.from(JSON.stringify({ persona: { template: "grant-draft" } })).toString("base64");
+    metaFromHeaders(request({ "x-openpersona-meta-b64": other, "x-openpersona-meta-digest": forged }));
+    expect(metaFromHeaders(request({ "x-openpersona-meta-digest": forged }))).toBeUndefined();
+  });
+});
+
+describe("trace context headers", () => {
+  const traceparent = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01";
+
+  it("passes a valid traceparent and its tracestate through", () => {
+    expect(traceContextHeaders(request({ traceparent, tracestate: "vendor=1" }))).toEqual({
+      traceparent,
+      tracestate: "vendor=1"
+    });
+  });
+
+  it("drops malformed trace context", () => {
+    expect(traceContextHeaders(request({ traceparent: "01-xyz", tracestate: "vendor=1" }))).toEqual({});
+    expect(traceContextHeaders(request({}))).toEqual({});
+  });
+});
+
+describe("POST /v1/warmup", () => {
+  function handler(ensured: Array<{ key: string; keys: ProviderKeys }>, secret = SECRET) {
+    return warmupHandler({
+      workspaceKeyForRequest: (req) => {
+        const user = req.header("x-openwebui-user-id");
+        return user ? { key: user, source: "header" } : { key: "anonymous", source: "anonymous" };
+      },
+      providerKeysFromRequest: (req) => providerKeysFromHeaders(req, {}, secret),
+      ensureRunner: async (key, keys) => {
+        ensured.push({ key, keys });
+        return { configChanged: false };
+      }
+    });
+  }
+
+  it("starts the caller's runner with the keys a completion would use", async () => {
+    const ensured: Array<{ key: string; keys: ProviderKeys }> = [];
+    const res = response();
+    await handler(ensured)(request({ "x-openwebui-user-id": "u1", ...signedHeaders(["oa-1", "", ""]) }), res);
+    expect(res.statusCode).toBe(200);
+    expect(res.body).toEqual({ ok: true, configChanged: false });
+    expect(ensured).toHaveLength(1);
+    expect(ensured[0].key).toBe("u1");
+    expect(ensured[0].keys.openaiApiKey).toBe("oa-1");
+  });
+
+  it("requires the user id header", async () => {
+    const ensured: Array<{ key: string; keys: ProviderKeys }> = [];
+    const res = response();
+    await handler(ensured)(request({}), res);
+    expect(res.statusCode).toBe(400);
+    expect(ensured).toHaveLength(0);
+  });
+
+  it("rejects a signature that does not match the keys", async () => {
+    const ensured: Array<{ key: string; keys: ProviderKeys }> = [];
+    const res = response();
+    const headers = { "x-openwebui-user-id": "u1", ...signedHeaders(["oa-1", "", ""]), "x-openpersona-openai-api-key": "oa-2" };
+    await handler(ensured)(request(headers), res);
+    expect(res.statusCode).toBe(401);
+    expect(ensured).toHaveLength(0);
+  });
+});
@@ -0,0 +1,219 @@
+// Parsing of the headers the patched Open WebUI router sends with each completion
+// (provider keys and their signature, persona meta, trace context). Kept free of
+// express/dockerode so it can be unit tested on its own.
+import crypto from "node:crypto";
+import zlib from "node:zlib";
+
+export type HeaderSource = { header(name: string): string | undefined };
+
+export type ProviderKeys = {
+  openaiApiKey?: string;
+  anthropicApiKey?: string;
+  openrouterApiKey?: string;
+  // x-openpersona-provider-key-sig, set only when it verified against the keys sent.
+  signature?: string;
+  // runnerKeySignature() of the above, filled in by providerKeysFromHeaders.
+  runnerKey?: string;
+};
+
+export type ProviderKeyDefaults = {
+  openaiApiKey?: string;
+  anthropicApiKey?: string;
+  openrouterApiKey?: string;
+};
+
+export const PROVIDER_KEY_HEADERS = {
+  openaiApiKey: "x-openpersona-openai-api-key",
+  anthropicApiKey: "x-openpersona-anthropic-api-key",
+  openrouterApiKey: "x-openpersona-openrouter-api-key"
+} as const;
+
+export const PROVIDER_KEY_SIGNATURE_HEADER = "x-openpersona-provider-key-sig";
+
+export class InvalidKeySignatureError extends Error {
+  constructor() {
+    super(`invalid ${PROVIDER_KEY_SIGNATURE_HEADER}`);
+  }
+}
+
+export function cleanHeaderValue(value: string | undefined): string | undefined {
+  if (!value) return undefined;
+  const cleaned = value.replace(/[\r\n]/g, "").trim();
+  return cleaned || undefined;
+}
+
+// HMAC-SHA256 (hex) of the key triple, as open_persona_provider_cache.sign_keys computes it.
+export function signProviderKeys(secret: string, keys: [string, string, string]): string {
+  return crypto.createHmac("sha256", secret).update(keys.join("\0"), "utf8").digest("hex");
+}
+
+// The request's key signature if it matches the keys it carries under `secret`.
+// A missing header (or no secret) yields undefined; a header that does not verify throws,
+// so a caller cannot borrow another user's signature.
+export function verifiedKeySignature(req: HeaderSource, secret: string | undefined): string | undefined {
+  const value = req.header(PROVIDER_KEY_SIGNATURE_HEADER)?.trim().toLowerCase();
+  if (!value || !secret) return undefined;
+  if (!/^[0-9a-f]{64}$/.test(value)) throw new InvalidKeySignatureError();
+  const expected = signProviderKeys(secret, [
+    cleanHeaderValue(req.header(PROVIDER_KEY_HEADERS.openaiApiKey)) ?? "",
+    cleanHeaderValue(req.header(PROVIDER_KEY_HEADERS.anthropicApiKey)) ?? "",
+    cleanHeaderValue(req.header(PROVIDER_KEY_HEADERS.openrouterApiKey)) ?? ""
+  ]);
+  if (!crypto.timingSafeEqual(Buffer.from(value, "hex"), Buffer.from(expected, "hex"))) {
+    throw new InvalidKeySignatureError();
+  }
+  return value;
+}
+
+// Resolved keys per (raw key headers, signature header, defaults, secret). A turn
+// repeats the previous one's headers, so verifying the signature and hashing the
+// runner key happen once per key change instead of on every request. Only
+// verified results are stored; a signature that does not match is checked (and
+// rejected) every time.
+export const PROVIDER_KEY_CACHE_MAX = 256;
+const providerKeysByHeaders = new Map<string, ProviderKeys>();
+
+// The keys a runner for this request gets: the forwarded ones, else the sidecar's own defaults.
+// The returned object is shared between requests with the same headers; do not modify it.
+export function providerKeysFromHeaders(
+  req: HeaderSource,
+  defaults: ProviderKeyDefaults,
+  signatureSecret?: string
+): ProviderKeys {
+  const openai = req.header(PROVIDER_KEY_HEADERS.openaiApiKey);
+  const anthropic = req.header(PROVIDER_KEY_HEADERS.anthropicApiKey);
+  const openrouter = req.header(PROVIDER_KEY_HEADERS.openrouterApiKey);
+  const cacheKey = [
+    openai ?? "",
+    anthropic ?? "",
+    openrouter ?? "",
+    req.header(PROVIDER_KEY_SIGNATURE_HEADER) ?? "",
+    defaults.openaiApiKey ?? "",
+    defaults.anthropicApiKey ?? "",
+    defaults.openrouterApiKey ?? "",
+    signatureSecret ?? ""
+  ].join("\0");
+  const cached = providerKeysByHeaders.get(cacheKey);
+  if (cached) {
+    providerKeysByHeaders.delete(cacheKey);
+    providerKeysByHeaders.set(cacheKey, cached);
+    return cached;
+  }
+
+  const keys: ProviderKeys = {
+    openaiApiKey: cleanHeaderValue(openai) ?? cleanHeaderValue(defaults.openaiApiKey),
+    anthropicApiKey: cleanHeaderValue(anthropic) ?? cleanHeaderValue(defaults.anthropicApiKey),
+    openrouterApiKey: cleanHeaderValue(openrouter) ?? cleanHeaderValue(defaults.openrouterApiKey),
+    signature: verifiedKeySignature(req, signatureSecret)
+  };
+  keys.runnerKey = runnerKeySignature(keys);
+  Object.freeze(keys);
+  providerKeysByHeaders.set(cacheKey, keys);
+  if (providerKeysByHeaders.size > PROVIDER_KEY_CACHE_MAX) {
+    const oldest = providerKeysByHeaders.keys().next().value;
+    if (oldest !== undefined) providerKeysByHeaders.delete(oldest);
+  }
+  return keys;
+}
+
+// Runner identity for a key set: a hash of the effective keys (sidecar defaults included,
+// so rotating them starts a new runner) and, when present, the full verified signature.
+// Never contains the keys. 16 hex characters keep the runner name a valid DNS label.
+export function runnerKeySignature(keys: ProviderKeys): string {
+  const material = JSON.stringify({
+    openai: keys.openaiApiKey ?? "",
+    anthropic: keys.anthropicApiKey ?? "",
+    openrouter: keys.openrouterApiKey ?? "",
+    signature: keys.signature ?? ""
+  });
+  return crypto.createHash("sha256").update(material, "utf8").digest("hex").slice(0, 16);
+}
+
+// Open WebUI sends the persona meta as x-openpersona-meta-b64 (or zlib-compressed as
+// x-openpersona-meta-z64) plus x-openpersona-meta-digest (sha256 of the JSON bytes).
+// Parsed meta is kept per digest so repeated turns skip decoding; the digest is
+// verified before caching so a caller cannot pin arbitrary meta to a digest.
+export const META_CACHE_MAX = 256;
+const metaByDigest = new Map<string, unknown>();
+
+export function metaFromHeaders<T>(req: HeaderSource): T | undefined {
+  const digest = req.header("x-openpersona-meta-digest")?.trim();
+  if (digest) {
+    const cached = metaByDigest.get(digest);
+    if (cached) {
+      metaByDigest.delete(digest);
+      metaByDigest.set(digest, cached);
+      return cached as T;
+    }
+  }
+
+  const z64 = req.header("x-openpersona-meta-z64")?.toString();
+  const b64 = req.header("x-openpersona-meta-b64")?.toString();
+  let raw: Buffer;
+  let meta: T;
+  try {
+    if (z64) raw = zlib.inflateSync(Buffer.from(z64, "base64"));
+    else if (b64) raw = Buffer.from(b64, "base64");
+    else return undefined;
+    meta = JSON.parse(raw.toString("utf8")) as T;
+  } catch {
+    return undefined;
+  }
+
+  if (digest && meta && digest === `sha256:${crypto.createHash("sha256").update(raw).digest("hex")}`) {
+    metaByDigest.set(digest, meta);
+    if (metaByDigest.size > META_CACHE_MAX) {
+      const oldest = metaByDigest.keys().next().value;
+      if (oldest !== undefined) metaByDigest.delete(oldest);
+    }
+  }
+  return meta;
+}
+
+// W3C trace context (traceparent/tracestate) set by the Open WebUI patch; passed on
+// to opencode so runner spans join the same trace.
+const TRACEPARENT_RE = /^00-[0-9a-f]{32}-[0-9a-f]{16}-[0-9a-f]{2}$/;
+
+export function traceContextHeaders(req: HeaderSource): Record<string, string> {
+  const headers: Record<string, string> = {};
+  const traceparent = req.header("traceparent")?.trim();
+  if (!traceparent || !TRACEPARENT_RE.test(traceparent)) return headers;
+  headers.traceparent = traceparent;
+  const tracestate = req.header("tracestate")?.trim();
+  if (tracestate) headers.tracestate = tracestate;
+  return headers;
+}
+
+type WarmupRequest = HeaderSource;
+type WarmupResponse = {
+  status(code: number): WarmupResponse;
+  json(body: unknown): unknown;
+};
+
+// POST /v1/warmup: start the caller's runner and set up its workspace without running a
+// prompt (open_persona_prewarm.py in the Open WebUI image). Takes the same identity and
+// provider-key headers as a completion, so the next real turn finds the same runner up.
+export function warmupHandler(deps: {
+  workspaceKeyForRequest(req: WarmupRequest): { key: string; source: string };
+  providerKeysFromRequest(req: WarmupRequest): ProviderKeys;
+  ensureRunner(workspaceKey: string, keys: ProviderKeys): Promise<{ configChanged: boolean }>;
+}) {
+  return async (req: WarmupRequest, res: WarmupResponse): Promise<void> => {
+    try {
+      const workspace = deps.workspaceKeyForRequest(req);
+      if (workspace.source !== "header") {
+        res.status(400).json({ error: { message: "x-openwebui-user-id is required" } });
+        return;
+      }
+      const runner = await deps.ensureRunner(workspace.key, deps.providerKeysFromRequest(req));
+      res.json({ ok: true, configChanged: runner.configChanged });
+    } catch (err) {
+      if (err instanceof InvalidKeySignatureError) {
+        res.status(401).json({ error: { message: err.message } });
+        return;
+      }
+      const message = err instanceof Error ? err.message : String(err);
+      res.status(500).json({ error: { message } });
+    }
+  };
+}
@@ -5,8 +5,21 @@ import path from "node:path";
 import Docker from "dockerode";
 import express from "express";
 
+import {
+  InvalidKeySignatureError,
+  metaFromHeaders,
+  providerKeysFromHeaders,
+  runnerKeySignature,
+  traceContextHeaders,
+  warmupHandler,
+  type ProviderKeys
+} from "./headers.js";
+
 const OPENCODE_BASE_URL = process.env.OPENCODE_BASE_URL ?? "http://opencode:4096";
 const PORT = Number(process.env.PORT ?? "8000");
+// Open WebUI keeps pooled connections to us open for OPEN_PERSONA_SIDECAR_KEEPALIVE_SECONDS (60s);
+// stay open longer than that so it never reuses a socket we are closing.
+const KEEP_ALIVE_TIMEOUT_MS = Number(process.env.KEEP_ALIVE_TIMEOUT_MS ?? "75000");
 const WORKSPACE_ROOT = process.env.WORKSPACE_ROOT ?? "/workspace/open-persona";
 
 const RUNNER_MODE = (process.env.RUNNER_MODE ?? "shared").toLowerCase();
@@ -97,6 +110,9 @@ type OpenPersonaMeta = {
   };
 };
 
+// Resolved models for a completion, as base64 JSON; the Open WebUI badge reads it.
+const MODEL_DETAILS_HEADER = "x-openpersona-model-details";
+
 type PersonaTemplateId = "izzy" | "grant-draft";
 
 function personaTemplateFromRequest(originalModelId: string, meta: OpenPersonaMeta | undefined): PersonaTemplateId | undefined {
@@ -574,10 +590,15 @@ function opencodeUrl(opencodeBaseUrl: string, pathname: string, directory: strin
   return url.toString();
 }
 
-async function opencodeCreateSession(opencodeBaseUrl: string, directory: string, title: string): Promise<{ id: string }> {
+async function opencodeCreateSession(
+  opencodeBaseUrl: string,
+  directory: string,
+  title: string,
+  extraHeaders?: Record<string, string>
+): Promise<{ id: string }> {
   const res = await fetch(opencodeUrl(opencodeBaseUrl, "/session", directory), {
     method: "POST",
-    headers: { "content-type": "application/json" },
+    headers: { "content-type": "application/json", ...extraHeaders },
     body: JSON.stringify({ title })
   });
 
@@ -596,7 +617,8 @@ async function opencodePrompt(
   agent: string,
   prompt: string,
   system?: string,
-  modelOverride?: string
+  modelOverride?: string,
+  extraHeaders?: Record<string, string>
 ) {
   const body: any = {
     agent,
@@ -607,7 +629,7 @@ async function opencodePrompt(
 
   const res = await fetch(opencodeUrl(opencodeBaseUrl, `/session/${encodeURIComponent(sessionID)}/message`, directory), {
     method: "POST",
-    headers: { "content-type": "application/json" },
+    headers: { "content-type": "application/json", ...extraHeaders },
     body: JSON.stringify(body)
   });
 
@@ -716,39 +738,25 @@ async function waitForOpencodeServer(opencodeBaseUrl: string): Promise<void> {
   throw new Error(`opencode runner not responding at ${opencodeBaseUrl}`);
 }
 
-type ProviderKeys = {
-  openaiApiKey?: string;
-  anthropicApiKey?: string;
-  openrouterApiKey?: string;
-};
-
-function cleanHeaderValue(value: string | undefined): string | undefined {
-  if (!value) return undefined;
-  const cleaned = value.replace(/[\r\n]/g, "").trim();
-  return cleaned || undefined;
-}
+// HMAC secret shared with Open WebUI (open_persona_provider_cache.SIGNATURE_SECRET,
+// same fallback chain); when set, a provider-key signature that does not match the
+// forwarded keys is rejected.
+const KEY_SIGNATURE_SECRET =
+  process.env.OPEN_PERSONA_KEY_SIGNATURE_SECRET ||
+  process.env.WEBUI_SECRET_KEY ||
+  process.env.WEBUI_JWT_SECRET_KEY ||
+  undefined;
 
 function providerKeysFromRequest(req: express.Request): ProviderKeys {
-  return {
-    openaiApiKey: cleanHeaderValue(req.header("x-openpersona-openai-api-key")) ?? cleanHeaderValue(DEFAULT_OPENAI_API_KEY),
-    anthropicApiKey: cleanHeaderValue(req.header("x-openpersona-anthropic-api-key")) ?? cleanHeaderValue(DEFAULT_ANTHROPIC_API_KEY),
-    openrouterApiKey: cleanHeaderValue(req.header("x-openpersona-openrouter-api-key")) ?? cleanHeaderValue(DEFAULT_OPENROUTER_API_KEY)
-  };
-}
-
-function providerSignature(keys: ProviderKeys): string {
-  // Used only for container identity; never log raw keys.
-  const material = JSON.stringify(
+  return providerKeysFromHeaders(
+    req,
     {
-      openai: keys.openaiApiKey ?? "",
-      anthropic: keys.anthropicApiKey ?? "",
-      openrouter: keys.openrouterApiKey ?? ""
+      openaiApiKey: DEFAULT_OPENAI_API_KEY,
+      anthropicApiKey: DEFAULT_ANTHROPIC_API_KEY,
+      openrouterApiKey: DEFAULT_OPENROUTER_API_KEY
     },
-    null,
-    0
+    KEY_SIGNATURE_SECRET
   );
-  const sig = crypto.createHash("sha256").update(material, "utf8").digest("hex").slice(0, 8);
-  return sig || "default";
 }
 
 async function ensureRunner(
@@ -771,7 +779,7 @@ async function ensureRunner(
   }
 
   const hash = workspaceHashForKey(workspaceKey);
-  const keySig = providerSignature(providerKeys);
+  const keySig = providerKeys.runnerKey ?? runnerKeySignature(providerKeys);
   const name = `open-persona-runner-${hash}-${keySig}`;
   const baseUrl = `http://${name}:4096`;
 
@@ -955,17 +963,7 @@ app.post("/v1/chat/completions", async (req, res) => {
       console.log(`workspace routing: source=${workspace.source} hash=${workspaceHashForKey(workspace.key)}`);
     }
     const headerOriginalModelId = req.header("x-openpersona-original-model-id")?.trim();
-    const headerMetaB64 = req.header("x-openpersona-meta-b64")?.toString();
-
-    let openPersonaMeta: OpenPersonaMeta | undefined;
-    if (headerMetaB64) {
-      try {
-        const jsonStr = Buffer.from(headerMetaB64, "base64").toString("utf8");
-        openPersonaMeta = JSON.parse(jsonStr) as OpenPersonaMeta;
-      } catch {
-        openPersonaMeta = undefined;
-      }
-    }
+    const openPersonaMeta = metaFromHeaders<OpenPersonaMeta>(req);
 
     const isPersonaModel = Boolean(headerOriginalModelId && headerOriginalModelId !== model);
     const originalModelId = isPersonaModel ? (headerOriginalModelId as string) : "";
@@ -1014,6 +1012,7 @@ app.post("/v1/chat/completions", async (req, res) => {
 
     const chatId = memoryEnabled ? getOpenWebUIChatId(req) : undefined;
     const title = chatId ? `Open WebUI ${chatId}` : "Open WebUI";
+    const traceHeaders = traceContextHeaders(req);
 
     let sessionID: string;
     if (chatId) {
@@ -1023,19 +1022,19 @@ app.post("/v1/chat/completions", async (req, res) => {
         const existing = getExistingSessionId(runner.directory, chatId, map);
         if (existing) return existing;
 
-        const created = await opencodeCreateSession(runner.opencodeBaseUrl, runner.directory, title);
+        const created = await opencodeCreateSession(runner.opencodeBaseUrl, runner.directory, title, traceHeaders);
         map[chatId] = created.id;
         saveSessionMap(runner.directory, map);
         return created.id;
       });
     } else {
-      const created = await opencodeCreateSession(runner.opencodeBaseUrl, runner.directory, title);
+      const created = await opencodeCreateSession(runner.opencodeBaseUrl, runner.directory, title, traceHeaders);
       sessionID = created.id;
     }
 
     let opencodeResult: { info: unknown; parts: Array<any> };
     try {
-      opencodeResult = await opencodePrompt(runner.opencodeBaseUrl, runner.directory, sessionID, selectedAgentName, prompt, forwardedSystem, /*modelOverride=*/ undefined);
+      opencodeResult = await opencodePrompt(runner.opencodeBaseUrl, runner.directory, sessionID, selectedAgentName, prompt, forwardedSystem, /*modelOverride=*/ undefined, traceHeaders);
     } catch (err) {
       // If the session expired/was lost (runner restart), recreate once.
       if (!chatId) throw err;
@@ -1043,13 +1042,13 @@ app.post("/v1/chat/completions", async (req, res) => {
       const lockKey = `${runner.directory}:${chatId}`;
       sessionID = await withSessionLock(lockKey, async () => {
         const map = loadSessionMap(runner.directory);
-        const created = await opencodeCreateSession(runner.opencodeBaseUrl, runner.directory, title);
+        const created = await opencodeCreateSession(runner.opencodeBaseUrl, runner.directory, title, traceHeaders);
         map[chatId] = created.id;
         saveSessionMap(runner.directory, map);
         return created.id;
       });
 
-      opencodeResult = await opencodePrompt(runner.opencodeBaseUrl, runner.directory, sessionID, selectedAgentName, prompt, forwardedSystem, /*modelOverride*/ undefined);
+      opencodeResult = await opencodePrompt(runner.opencodeBaseUrl, runner.directory, sessionID, selectedAgentName, prompt, forwardedSystem, /*modelOverride*/ undefined, traceHeaders);
     }
 
     const content = renderOpencodeParts(opencodeResult.parts, { personaTemplate: persona.template });
@@ -1057,14 +1056,16 @@ app.post("/v1/chat/completions", async (req, res) => {
     const created = Math.floor(Date.now() / 1000);
     const responseID = `chatcmpl_${sessionID}`;
 
-  if (!stream) {
-      // Attach model_details metadata so Open WebUI can show the resolved models
-      const model_details = {
-        model: effectiveMainModel,
-        small_model: effectiveSubagentModel,
-        resolved_from: extracted.model ? 'workspace' : (TEMPLATE_MODEL ? 'template' : 'env')
-      };
+    // Attach model_details metadata so Open WebUI can show the resolved models.
+    // The header (base64 JSON) lets the UI badge read it without parsing bodies.
+    const model_details = {
+      model: effectiveMainModel,
+      small_model: effectiveSubagentModel,
+      resolved_from: extracted.model ? 'workspace' : (TEMPLATE_MODEL ? 'template' : 'env')
+    };
+    res.setHeader(MODEL_DETAILS_HEADER, Buffer.from(JSON.stringify(model_details), "utf8").toString("base64"));
 
+  if (!stream) {
       res.json({
         id: responseID,
         object: "chat.completion",
@@ -1086,23 +1087,19 @@ app.post("/v1/chat/completions", async (req, res) => {
     res.setHeader("cache-control", "no-cache");
     res.setHeader("connection", "keep-alive");
 
-    const model_details = {
-      model: effectiveMainModel,
-      small_model: effectiveSubagentModel,
-      resolved_from: extracted.model ? 'workspace' : (TEMPLATE_MODEL ? 'template' : 'env')
-    };
-
-    const chunkEnvelope = (delta: Record<string, unknown>, finish_reason: string | null) => ({
+    // model_details rides on the first chunk (and the response header) only; repeating it
+    // in every chunk just adds bytes Open WebUI re-parses per event.
+    const chunkEnvelope = (delta: Record<string, unknown>, finish_reason: string | null, withDetails = false) => ({
       id: responseID,
       object: "chat.completion.chunk",
       created,
       model: model ?? `open-persona/${agent}`,
-      model_details,
+      ...(withDetails ? { model_details } : {}),
       choices: [{ index: 0, delta, finish_reason }]
     });
 
     // Send an initial metadata chunk containing model_details
-    res.write(`data: ${JSON.stringify(chunkEnvelope({ metadata: model_details }, null))}\n\n`);
+    res.write(`data: ${JSON.stringify(chunkEnvelope({ metadata: model_details }, null, true))}\n\n`);
     res.write(`data: ${JSON.stringify(chunkEnvelope({ role: "assistant" }, null))}\n\n`);
 
 
@@ -1117,11 +1114,25 @@ app.post("/v1/chat/completions", async (req, res) => {
     res.write("data: [DONE]\n\n");
     res.end();
   } catch (err) {
+    if (err instanceof InvalidKeySignatureError) {
+      res.status(401).json({ error: { message: err.message } });
+      return;
+    }
     const message = err instanceof Error ? err.message : String(err);
     res.status(500).json({ error: { message } });
   }
 });
 
+// Pre-warm (open_persona_prewarm.py in the Open WebUI image); see warmupHandler.
+app.post(
+  "/v1/warmup",
+  warmupHandler({
+    workspaceKeyForRequest: (req) => workspaceKeyForRequest(req as express.Request, undefined),
+    providerKeysFromRequest: (req) => providerKeysFromRequest(req as express.Request),
+    ensureRunner: (workspaceKey, keys) => ensureRunner(workspaceKey, keys, /*selectedPersona=*/ undefined)
+  })
+);
+
 // Admin tool runner endpoint: one-time, limited exception for a specific workspace
 app.post('/admin/workspace-tools', express.json(), async (req, res) => {
   try {
@@ -1176,6 +1187,8 @@ app.post('/admin/workspace-tools', express.json(), async (req, res) => {
   }
 });
 
-app.listen(PORT, "0.0.0.0", () => {
+const server = app.listen(PORT, "0.0.0.0", () => {
   console.log(`open-persona-sidecar listening on :${PORT}`);
 });
+server.keepAliveTimeout = KEEP_ALIVE_TIMEOUT_MS;
+server.headersTimeout = KEEP_ALIVE_TIMEOUT_MS + 1000;